@@ -1,10 +1,12 @@
 REM Sample orchestration script for pipeline demo
 REM Calls all core pipeline scripts every 30 minutes (for local/demo use)
-python fetch_market_data.py
-python feature_engineering_timeframe.py
-python aggregate_features_by_timeframe.py
-python train_timeframe_model.py
-python inference_timeframe.py
-python backtest_by_timeframe.py
-python trade_ideas_logger.py
+python fetch_market_data.py 30m --async --derive 1h,4h,12h,1d
+python streaming_indicators.py 30m
+python feature_engineering_timeframe.py 30m --incremental
+python aggregate_features_by_timeframe.py 30m
+python train_timeframe_model.py 30m --incremental
+python inference_timeframe.py 30m --latest
+python backtest_by_timeframe.py 30m
+python inference_timeframe.py 30m --live
+python trade_ideas_logger.py 30m --live
 python live_paper_trading_bot.py
@@ -0,0 +1,4 @@
+REM Sample orchestration script for pipeline demo
+REM Full model refit and rescoring, scheduled weekly; the 30m cycle only updates models and scores new bars
+python train_timeframe_model.py 30m --fresh
+python inference_timeframe.py 30m
@@ -1,21 +1,123 @@
 """
 Aggregates features for multiple assets/timeframes.
 Used to build ML-ready datasets for modeling and inference.
+
+Per-symbol <SYMBOL>/<tf>_features.parquet files are streamed one at a time
+into ohlcv_parquet/<tf>_features.parquet, one row group per symbol, so the
+combined frame is never built in pandas memory. A sidecar index records
+which source file (size/mtime) each row group came from; incremental runs
+re-read only symbols whose per-symbol file changed and carry the other row
+groups over from the previous output. The aggregate's schema is the union
+of the per-symbol schemas (pa.unify_schemas, columns a symbol lacks are
+null); when that union differs from the previous output's schema every
+symbol is re-read, and incompatible column types raise instead of dropping
+a symbol or a column.
 """
 
-import pandas as pd
+import json
+import os
+import sys
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+FEATURES_DIR = "ohlcv_parquet"
+INDEX_SUFFIX = ".index.json"
+
+def source_files(timeframe, features_dir=FEATURES_DIR):
+    sources = {}
+    for symbol_folder in sorted(os.listdir(features_dir)):
+        path = os.path.join(features_dir, symbol_folder, f"{timeframe}_features.parquet")
+        if os.path.isdir(os.path.join(features_dir, symbol_folder)) and os.path.exists(path):
+            sources[symbol_folder] = path
+    return sources
+
+def file_signature(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def load_index(index_path):
+    if not os.path.exists(index_path):
+        return {}
+    with open(index_path, "r") as f:
+        return json.load(f)
+
+def unified_schema(schemas):
+    """Union of the per-symbol schemas; raises ValueError when a column's types cannot be reconciled."""
+    try:
+        return pa.unify_schemas(list(schemas))
+    except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+        raise ValueError(f"Per-symbol feature files have incompatible schemas: {e}") from e
+
+def conform(table, schema):
+    """`table` with the columns of `schema` in its order, all-null columns for those it lacks."""
+    columns = [table.column(field.name) if field.name in table.column_names else pa.nulls(table.num_rows, field.type)
+               for field in schema]
+    return pa.Table.from_arrays(columns, schema=schema)
+
+def aggregate_timeframe(timeframe, incremental=True, features_dir=FEATURES_DIR):
+    """Write <tf>_features.parquet with one row group per symbol. Returns the total row count."""
+    out_path = os.path.join(features_dir, f"{timeframe}_features.parquet")
+    index_path = out_path + INDEX_SUFFIX
+    sources = source_files(timeframe, features_dir)
+    if not sources:
+        print(f"No per-symbol feature files for {timeframe} in {features_dir}")
+        return 0
+
+    previous = load_index(index_path) if incremental and os.path.exists(out_path) else {}
+    previous_symbols = previous.get('symbols', {})
+    signatures = {symbol: file_signature(path) for symbol, path in sources.items()}
+    changed = [s for s in sources if previous_symbols.get(s, {}).get('signature') != signatures[s]]
+    removed = [s for s in previous_symbols if s not in sources]
+    if previous and not changed and not removed:
+        print(f"[{timeframe}] Aggregate up to date ({len(sources)} symbols)")
+        return sum(entry['rows'] for entry in previous_symbols.values())
+
+    schema = unified_schema(pq.read_schema(path) for path in sources.values())
+    old_file = pq.ParquetFile(out_path) if previous else None
+    if old_file is not None and not old_file.schema_arrow.equals(schema, check_metadata=False):
+        print(f"[{timeframe}] Feature schema changed, re-reading all {len(sources)} symbols")
+        old_file.close()
+        old_file = None
+        changed = list(sources)
+    tmp_path = out_path + ".tmp"
+    writer = pq.ParquetWriter(tmp_path, schema)
+    index = {'timeframe': timeframe, 'symbols': {}}
+    total_rows = 0
+    try:
+        for symbol, path in sources.items():
+            entry = previous_symbols.get(symbol)
+            if symbol not in changed and entry is not None:
+                table = old_file.read_row_group(entry['row_group'])
+            else:
+                table = pq.read_table(path)
+            if table.num_rows == 0:
+                continue
+            if not table.schema.equals(schema, check_metadata=False):
+                table = conform(table, schema)
+            writer.write_table(table, row_group_size=table.num_rows)
+            index['symbols'][symbol] = {
+                'signature': signatures[symbol],
+                'row_group': len(index['symbols']),
+                'rows': table.num_rows
+            }
+            total_rows += table.num_rows
+    finally:
+        writer.close()
+        if old_file is not None:
+            old_file.close()
+    os.replace(tmp_path, out_path)
+    with open(index_path, "w") as f:
+        json.dump(index, f)
+    print(f"[{timeframe}] Aggregated {len(index['symbols'])} symbols ({total_rows} rows, "
+          f"{len(changed)} re-read, {len(removed)} removed) into {out_path}")
+    return total_rows
 
-def aggregate_features(timeframes):
-    # Placeholder: Load feature files from each timeframe, concat/join as needed
-    aggregated_df = pd.DataFrame()
-    for timeframe in timeframes:
-        # Replace with your actual feature file loading logic
-        # df = pd.read_csv(f'features_{timeframe}.csv')
-        # aggregated_df = pd.concat([aggregated_df, df])
-        pass
-    return aggregated_df
+def aggregate_features(timeframes, incremental=True):
+    return {timeframe: aggregate_timeframe(timeframe, incremental=incremental) for timeframe in timeframes}
 
 if __name__ == "__main__":
-    # Example usage:
-    # df = aggregate_features(['30m', '1h', '4h'])
-    pass
+    args = [a for a in sys.argv[1:] if a != "--full"]
+    if not args:
+        print("Usage: python aggregate_features_by_timeframe.py [timeframe ...] [--full]")
+        sys.exit(1)
+    aggregate_features(args, incremental="--full" not in sys.argv)
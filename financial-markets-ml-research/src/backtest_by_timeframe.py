@@ -1,56 +1,106 @@
+"""
+Backtests a timeframe's predictions with a per-symbol long-only state machine
+(entry, liquidation, scale-out, trailing stop, volatility-spike and
+signal-flip exits) and writes the trade log, portfolio curve and summary.
+
+The default engine, backtest_kernel(), runs the state machine over
+contiguous NumPy arrays (symbols grouped by one stable argsort) and is
+JIT-compiled with numba when it is installed; without numba the same
+function runs as plain Python over lists. simulate_reference() keeps the
+original iterrows implementation: --verify diffs the two trade logs on a
+timeframe's data, tests/test_backtest_engines.py on a synthetic panel with
+and without numba, and --benchmark times both.
+
+backtest(df, params) is the in-memory API: it takes the trade parameters
+and a preloaded load_backtest_frame() frame and returns the trade log,
+portfolio curve and summary without touching the disk, so trials can run
+side by side in one process. run_backtest_for_timeframe() adds the file
+sinks (plot, CSV and JSON) and reads trade_params.json only when no
+parameters are passed.
+"""
+
+import argparse
 import pandas as pd
 import numpy as np
 import os
-import sys
-import matplotlib.pyplot as plt
+import time
 import json
+from inference_timeframe import load_features_with_predictions
+
+try:
+    from numba import njit
+except ImportError:  # optional: the kernel then runs uncompiled
+    njit = None
+
+def jit(func):
+    return njit(cache=True, nogil=True)(func) if njit is not None else func
 
 def load_trade_params(json_path="trade_params.json"):
     with open(json_path, "r") as f:
         params = json.load(f)
     return params
-# Load trade parameters from file
-trade_params = load_trade_params()  # Uses default 'trade_params.json'
 
 # --- Configurable Parameters ---
-
-
-MAX_OPEN_TRADES = trade_params['max_open_trades']
+# Trade parameters (leverage, trade_pct, scale_out_pct, take_profit_pct, stop_loss_pct,
+# proba_threshold, and max_open_trades for portfolio_backtest.py) are passed in as a dict,
+# usually load_trade_params(); the values below are defaults for the other keys.
 
 FEATURES_DIR = 'ohlcv_parquet'
+DASHBOARD_DIR = 'dashboard_data'
 STARTING_CASH = 100_000
-LEVERAGE = trade_params['leverage']               # <--- Set your leverage here
-TRADE_PCT = trade_params['trade_pct']
-SCALE_OUT_PCT = trade_params['scale_out_pct']
-TAKE_PROFIT_PCT = trade_params['take_profit_pct']
-STOP_LOSS_PCT = trade_params['stop_loss_pct']
 TRADE_COST = 0.001         # 0.1% per side
 VOL_SPIKE_PCTL = 0.9
-PROBA_THRESHOLD = trade_params['proba_threshold']
+TRADE_PARAMS = ['leverage', 'trade_pct', 'scale_out_pct', 'take_profit_pct', 'stop_loss_pct', 'proba_threshold']
+DEFAULT_PARAMS = {'starting_cash': STARTING_CASH, 'trade_cost': TRADE_COST, 'vol_spike_pctl': VOL_SPIKE_PCTL}
+
+TRADE_LOG_COLUMNS = ['symbol', 'entry_time', 'entry_price', 'exit_time', 'exit_price', 'exit_type',
+                     'pnl_gross', 'fee', 'pnl_net', 'position_pct']
+EXIT_TYPES = ['Liquidation', 'TakeProfit70%', 'TrailingStop', 'VolSpike', 'SignalFlip']
+LIQUIDATION, TAKE_PROFIT, TRAILING_STOP, VOL_SPIKE, SIGNAL_FLIP = range(len(EXIT_TYPES))
+
+def resolve_params(params):
+    """`params` over DEFAULT_PARAMS; every TRADE_PARAMS key must be given."""
+    p = {**DEFAULT_PARAMS, **params}
+    missing = [k for k in TRADE_PARAMS if k not in p]
+    if missing:
+        raise KeyError(f"Missing trade parameters: {missing}")
+    return p
 
-def run_backtest_for_timeframe(timeframe):
+def load_backtest_frame(timeframe):
+    """Deduplicated, sorted rows with every needed column present, indexed by (datetime, symbol)."""
     features_path = os.path.join(FEATURES_DIR, f"{timeframe}_features.parquet")
     if not os.path.exists(features_path):
         print(f"No aggregated features file: {features_path}")
-        return
-    df = pd.read_parquet(features_path)
+        return None
+    df = load_features_with_predictions(timeframe)
     if df.empty:
         print(f"Aggregated file is empty for {timeframe}")
-        return
+        return None
     df = df.drop_duplicates(subset=['symbol', 'timestamp', 'timeframe']).sort_values(['symbol','timestamp']).reset_index(drop=True)
     needed_cols = ['symbol', 'timestamp', 'timeframe', 'close', 'target_return_1', 'pred_up', 'proba_up', 'drawdown_20', 'rolling_std_14', 'low_vol_liquidity']
     df = df.dropna(subset=needed_cols)
     df['datetime'] = pd.to_datetime(df['timestamp'])
-    df = df.set_index(['datetime', 'symbol'])
+    return df.set_index(['datetime', 'symbol'])
 
-    # Volatility spike thresholds (per symbol)
-    symbol_thresholds = df.groupby('symbol')['rolling_std_14'].quantile(VOL_SPIKE_PCTL).to_dict()
-    df['vol_spike'] = df.apply(lambda row: row['rolling_std_14'] > symbol_thresholds[row.name[1]], axis=1)
+def vol_spike_reference(df, vol_spike_pctl=VOL_SPIKE_PCTL):
+    symbol_thresholds = df.groupby('symbol')['rolling_std_14'].quantile(vol_spike_pctl).to_dict()
+    return df.apply(lambda row: row['rolling_std_14'] > symbol_thresholds[row.name[1]], axis=1)
 
-    # ---- Per-Trade Simulation ----
+def vol_spike_flags(df, vol_spike_pctl=VOL_SPIKE_PCTL):
+    """rolling_std_14 above its symbol's vol_spike_pctl quantile, as one vectorized comparison."""
+    thresholds = df.groupby('symbol')['rolling_std_14'].quantile(vol_spike_pctl)
+    symbols = df.index.get_level_values('symbol')
+    return df['rolling_std_14'].to_numpy() > thresholds.reindex(symbols).to_numpy()
+
+def simulate_reference(df, params):
+    """Original row-by-row simulation (iterrows); kept as the reference for --verify and --benchmark.
+    Expects a vol_spike column (see simulate())."""
+    p = resolve_params(params)
+    leverage, trade_pct, scale_out_pct = p['leverage'], p['trade_pct'], p['scale_out_pct']
+    take_profit_pct, stop_loss_pct, proba_threshold = p['take_profit_pct'], p['stop_loss_pct'], p['proba_threshold']
+    trade_cost = p['trade_cost']
     trade_log = []
-    portfolio_curve = []
-    portfolio_value = STARTING_CASH
+    portfolio_value = p['starting_cash']
 
     symbols = df.index.get_level_values('symbol').unique()
     for symbol in symbols:
@@ -66,15 +116,15 @@ def run_backtest_for_timeframe(timeframe):
 
         for idx, row in sdf.iterrows():
             # ENTRY LOGIC
-            if position == 0.0 and row['pred_up'] == 1 and row['proba_up'] >= PROBA_THRESHOLD:
+            if position == 0.0 and row['pred_up'] == 1 and row['proba_up'] >= proba_threshold:
                 position = 1.0
                 entry_idx = idx
                 entry_price = row['close']
                 max_price = entry_price
                 scale_out_done = False
                 entry_time = idx
-                notional = TRADE_PCT * LEVERAGE * portfolio_value
-                entry_fee = notional * TRADE_COST
+                notional = trade_pct * leverage * portfolio_value
+                entry_fee = notional * trade_cost
                 portfolio_value -= entry_fee  # Deduct entry fee up front
                 liquidation_triggered = False
                 continue
@@ -84,17 +134,17 @@ def run_backtest_for_timeframe(timeframe):
                 if row['close'] > max_price:
                     max_price = row['close']
 
-                # Helper: liquidation threshold (if price drops -1/LEVERAGE from entry)
-                liquidation_threshold = entry_price * (1 - 1.0 / LEVERAGE)
+                # Helper: liquidation threshold (if price drops -1/leverage from entry)
+                liquidation_threshold = entry_price * (1 - 1.0 / leverage)
                 # Check for liquidation (only for long, spot-like trades; shorts are more complex)
                 if row['close'] <= liquidation_threshold and not liquidation_triggered:
                     exit_time = idx
                     exit_price = row['close']
                     position_size = position
-                    trade_value = TRADE_PCT * position_size * LEVERAGE * portfolio_value
+                    trade_value = trade_pct * position_size * leverage * portfolio_value
 
                     # On liquidation, you lose your initial margin (the full value for this trade, minus fee already paid)
-                    net_pnl = -TRADE_PCT * position_size * portfolio_value  # Lose full position, no need to deduct exit fee again
+                    net_pnl = -trade_pct * position_size * portfolio_value  # Lose full position, no need to deduct exit fee again
                     trade_log.append({
                         'symbol': symbol,
                         'entry_time': entry_time,
@@ -115,14 +165,14 @@ def run_backtest_for_timeframe(timeframe):
                     continue  # skip further exit logic for this bar
 
                 # SCALE-OUT LOGIC
-                if not scale_out_done and (row['close'] / entry_price - 1) >= TAKE_PROFIT_PCT:
+                if not scale_out_done and (row['close'] / entry_price - 1) >= take_profit_pct:
                     exit_time = idx
                     exit_price = row['close']
-                    position_size = SCALE_OUT_PCT
+                    position_size = scale_out_pct
 
-                    trade_value = TRADE_PCT * position_size * LEVERAGE * portfolio_value
+                    trade_value = trade_pct * position_size * leverage * portfolio_value
                     gross_pnl = (exit_price - entry_price) / entry_price * trade_value
-                    exit_fee = trade_value * TRADE_COST
+                    exit_fee = trade_value * trade_cost
                     net_pnl = gross_pnl - exit_fee
 
                     trade_log.append({
@@ -138,19 +188,19 @@ def run_backtest_for_timeframe(timeframe):
                         'position_pct': position_size
                     })
                     portfolio_value += net_pnl
-                    position = 1.0 - SCALE_OUT_PCT
+                    position = 1.0 - scale_out_pct
                     scale_out_done = True
 
                 # TRAILING STOP / DRAWNDOWN EXIT
                 drawdown = row['close'] / max_price - 1
-                if drawdown < STOP_LOSS_PCT:
+                if drawdown < stop_loss_pct:
                     exit_time = idx
                     exit_price = row['close']
                     position_size = position
 
-                    trade_value = TRADE_PCT * position_size * LEVERAGE * portfolio_value
+                    trade_value = trade_pct * position_size * leverage * portfolio_value
                     gross_pnl = (exit_price - entry_price) / entry_price * trade_value
-                    exit_fee = trade_value * TRADE_COST
+                    exit_fee = trade_value * trade_cost
                     net_pnl = gross_pnl - exit_fee
 
                     trade_log.append({
@@ -176,9 +226,9 @@ def run_backtest_for_timeframe(timeframe):
                     exit_price = row['close']
                     position_size = position
 
-                    trade_value = TRADE_PCT * position_size * LEVERAGE * portfolio_value
+                    trade_value = trade_pct * position_size * leverage * portfolio_value
                     gross_pnl = (exit_price - entry_price) / entry_price * trade_value
-                    exit_fee = trade_value * TRADE_COST
+                    exit_fee = trade_value * trade_cost
                     net_pnl = gross_pnl - exit_fee
 
                     trade_log.append({
@@ -199,14 +249,14 @@ def run_backtest_for_timeframe(timeframe):
                     entry_time = None
 
                 # SIGNAL FLIP EXIT (when signal turns off)
-                elif row['pred_up'] == 0 and row['proba_up'] < (1 - PROBA_THRESHOLD):
+                elif row['pred_up'] == 0 and row['proba_up'] < (1 - proba_threshold):
                     exit_time = idx
                     exit_price = row['close']
                     position_size = position
 
-                    trade_value = TRADE_PCT * position_size * LEVERAGE * portfolio_value
+                    trade_value = trade_pct * position_size * leverage * portfolio_value
                     gross_pnl = (exit_price - entry_price) / entry_price * trade_value
-                    exit_fee = trade_value * TRADE_COST
+                    exit_fee = trade_value * trade_cost
                     net_pnl = gross_pnl - exit_fee
 
                     trade_log.append({
@@ -225,31 +275,172 @@ def run_backtest_for_timeframe(timeframe):
                     position = 0.0
                     scale_out_done = False
                     entry_time = None
+    return pd.DataFrame(trade_log, columns=TRADE_LOG_COLUMNS)
+
+@jit
+def record_trade(log, pnl, k, entry_row, exit_row, exit_type, pnl_gross, fee, pnl_net, position_pct):
+    log[k, 0] = entry_row
+    log[k, 1] = exit_row
+    log[k, 2] = exit_type
+    pnl[k, 0] = pnl_gross
+    pnl[k, 1] = fee
+    pnl[k, 2] = pnl_net
+    pnl[k, 3] = position_pct
+    return k + 1
+
+@jit
+def backtest_kernel(close, pred_up, proba_up, vol_spike, starts, portfolio_value, trade_pct, leverage,
+                    scale_out_pct, take_profit_pct, stop_loss_pct, trade_cost, proba_threshold):
+    """simulate_reference()'s state machine over arrays grouped by symbol (rows starts[s]:starts[s + 1]).
+
+    Arithmetic is written in the reference's operation order so the results are bit-identical.
+    Returns (log, pnl): log rows are (entry row, exit row, exit type), pnl rows are
+    (pnl_gross, fee, pnl_net, position_pct), one per trade in the reference's append order.
+    """
+    n = len(close)
+    log = np.empty((2 * n + 1, 3), dtype=np.int64)  # at most a scale-out and an exit per bar
+    pnl = np.empty((2 * n + 1, 4), dtype=np.float64)
+    k = 0
+    for s in range(len(starts) - 1):
+        position = 0.0
+        entry = -1
+        entry_price = 0.0
+        max_price = 0.0
+        scale_out_done = False
+        entry_fee = 0.0
+        for i in range(starts[s], starts[s + 1]):
+            price = close[i]
+            if position == 0.0 and pred_up[i] == 1 and proba_up[i] >= proba_threshold:
+                position = 1.0
+                entry = i
+                entry_price = price
+                max_price = entry_price
+                scale_out_done = False
+                notional = trade_pct * leverage * portfolio_value
+                entry_fee = notional * trade_cost
+                portfolio_value -= entry_fee
+                continue
+            if position > 0.0:
+                if price > max_price:
+                    max_price = price
+                # The reference's liquidation_triggered flag is always False here (reset on entry)
+                if price <= entry_price * (1 - 1.0 / leverage):
+                    net_pnl = -trade_pct * position * portfolio_value
+                    k = record_trade(log, pnl, k, entry, i, LIQUIDATION, net_pnl, entry_fee, net_pnl, position)
+                    portfolio_value += net_pnl
+                    position = 0.0
+                    scale_out_done = False
+                    continue
+                if not scale_out_done and (price / entry_price - 1) >= take_profit_pct:
+                    trade_value = trade_pct * scale_out_pct * leverage * portfolio_value
+                    gross_pnl = (price - entry_price) / entry_price * trade_value
+                    exit_fee = trade_value * trade_cost
+                    net_pnl = gross_pnl - exit_fee
+                    k = record_trade(log, pnl, k, entry, i, TAKE_PROFIT, gross_pnl, exit_fee, net_pnl, scale_out_pct)
+                    portfolio_value += net_pnl
+                    position = 1.0 - scale_out_pct
+                    scale_out_done = True
+                if price / max_price - 1 < stop_loss_pct:
+                    exit_type = TRAILING_STOP
+                elif vol_spike[i]:
+                    exit_type = VOL_SPIKE
+                elif pred_up[i] == 0 and proba_up[i] < (1 - proba_threshold):
+                    exit_type = SIGNAL_FLIP
+                else:
+                    continue
+                trade_value = trade_pct * position * leverage * portfolio_value
+                gross_pnl = (price - entry_price) / entry_price * trade_value
+                exit_fee = trade_value * trade_cost
+                net_pnl = gross_pnl - exit_fee
+                k = record_trade(log, pnl, k, entry, i, exit_type, gross_pnl, exit_fee, net_pnl, position)
+                portfolio_value += net_pnl
+                position = 0.0
+                scale_out_done = False
+    return log[:k], pnl[:k]
+
+def simulate_kernel(df, params, vol_spike=None):
+    """Same trade log as simulate_reference(df, params), computed by backtest_kernel()."""
+    p = resolve_params(params)
+    codes, symbols = pd.factorize(df.index.get_level_values('symbol'))
+    order = np.argsort(codes, kind='stable')
+    starts = np.searchsorted(codes[order], np.arange(len(symbols) + 1))
+    vol_spike = vol_spike_flags(df, p['vol_spike_pctl']) if vol_spike is None else np.asarray(vol_spike, dtype=bool)
+    arrays = [df['close'].to_numpy(dtype='float64')[order], df['pred_up'].to_numpy(dtype='float64')[order],
+              df['proba_up'].to_numpy(dtype='float64')[order], vol_spike[order], starts]
+    if njit is None:
+        arrays = [a.tolist() for a in arrays]  # element access on lists is far cheaper than on arrays in Python
+    log, pnl = backtest_kernel(*arrays, float(p['starting_cash']), float(p['trade_pct']), float(p['leverage']),
+                               float(p['scale_out_pct']), float(p['take_profit_pct']), float(p['stop_loss_pct']),
+                               float(p['trade_cost']), float(p['proba_threshold']))
+    entry_rows, exit_rows = order[log[:, 0]], order[log[:, 1]]
+    times = df.index.get_level_values('datetime')
+    close = df['close'].to_numpy(dtype='float64')
+    return pd.DataFrame({
+        'symbol': np.asarray(symbols, dtype=object)[codes[entry_rows]],
+        'entry_time': times[entry_rows],
+        'entry_price': close[entry_rows],
+        'exit_time': times[exit_rows],
+        'exit_price': close[exit_rows],
+        'exit_type': np.asarray(EXIT_TYPES, dtype=object)[log[:, 2]],
+        'pnl_gross': pnl[:, 0],
+        'fee': pnl[:, 1],
+        'pnl_net': pnl[:, 2],
+        'position_pct': pnl[:, 3]
+    }, columns=TRADE_LOG_COLUMNS)
+
+def simulate(df, params, engine="kernel"):
+    """Trade log sorted by exit time, from the compiled kernel or the iterrows reference."""
+    if engine == "reference":
+        vol_spike_pctl = resolve_params(params)['vol_spike_pctl']
+        trade_log_df = simulate_reference(df.assign(vol_spike=vol_spike_reference(df, vol_spike_pctl)), params)
+    else:
+        trade_log_df = simulate_kernel(df, params)
+    # Stable, so trades closing on the same bar keep symbol order (param_sweep relies on the same order)
+    return trade_log_df.sort_values('exit_time', kind='stable')
 
-    # ---- Portfolio Value Simulation (using net pnl for each trade) ----
-    trade_log_df = pd.DataFrame(trade_log)
-    trade_log_df = trade_log_df.sort_values('exit_time')
-    portfolio_curve = [STARTING_CASH]
-    for _, trade in trade_log_df.iterrows():
-        new_value = portfolio_curve[-1] + trade['pnl_net']
-        portfolio_curve.append(new_value)
-    portfolio_curve = pd.Series(portfolio_curve[1:], index=trade_log_df['exit_time'])
-    
-    # ---- Analytics ----
+def portfolio_curve_from_log(trade_log_df, starting_cash=STARTING_CASH):
+    """Portfolio value after each trade of an exit-time-sorted log (using net pnl for each trade)."""
+    portfolio_curve = [starting_cash]
+    for pnl_net in trade_log_df['pnl_net']:
+        portfolio_curve.append(portfolio_curve[-1] + pnl_net)
+    return pd.Series(portfolio_curve[1:], index=trade_log_df['exit_time'])
+
+def backtest_summary(portfolio_curve, trade_log_df, starting_cash=STARTING_CASH):
+    """Headline statistics of a portfolio curve (indexed by exit time) and its trade log."""
     returns = portfolio_curve.pct_change().fillna(0)
     sharpe = returns.mean() / returns.std() * (252**0.5) if returns.std() > 0 else np.nan
     max_dd = (portfolio_curve / portfolio_curve.cummax() - 1).min()
     win_rate = (trade_log_df['pnl_net'] > 0).sum() / len(trade_log_df) if len(trade_log_df) > 0 else 0
     avg_hold = (trade_log_df['exit_time'] - trade_log_df['entry_time']).dt.total_seconds().mean() / 3600 if len(trade_log_df) > 0 else 0
+    final_value = portfolio_curve.iloc[-1] if len(portfolio_curve) else starting_cash
+    return {
+        'final_value': float(final_value),
+        'total_return': float((final_value/starting_cash-1)),
+        'max_drawdown': float(max_dd),
+        'sharpe': float(sharpe),
+        'win_rate': float(win_rate),
+        'avg_hold_hours': float(avg_hold),
+        'trade_count': int(len(trade_log_df))
+    }
+
+def backtest(df, params, engine="kernel"):
+    """In-memory backtest of a load_backtest_frame() frame: returns (trade log, portfolio curve, summary)."""
+    p = resolve_params(params)
+    trade_log_df = simulate(df, p, engine)
+    portfolio_curve = portfolio_curve_from_log(trade_log_df, p['starting_cash'])
+    return trade_log_df, portfolio_curve, backtest_summary(portfolio_curve, trade_log_df, p['starting_cash'])
 
-    print(f"[{timeframe}] Final Value: ${portfolio_curve.iloc[-1]:,.2f}")
-    print(f"Total Return: {(portfolio_curve.iloc[-1]/STARTING_CASH-1):.2%}")
-    print(f"Max Drawdown: {max_dd:.2%}")
-    print(f"Sharpe Ratio: {sharpe:.2f}")
-    print(f"Win Rate: {win_rate:.2%}")
-    print(f"Avg Holding Time: {avg_hold:.2f} hours/trade")
-    print(f"Trade Count: {len(trade_log_df)}")
+def print_summary(summary, timeframe):
+    print(f"[{timeframe}] Final Value: ${summary['final_value']:,.2f}")
+    print(f"Total Return: {summary['total_return']:.2%}")
+    print(f"Max Drawdown: {summary['max_drawdown']:.2%}")
+    print(f"Sharpe Ratio: {summary['sharpe']:.2f}")
+    print(f"Win Rate: {summary['win_rate']:.2%}")
+    print(f"Avg Holding Time: {summary['avg_hold_hours']:.2f} hours/trade")
+    print(f"Trade Count: {summary['trade_count']}")
 
+def plot_portfolio_curve(portfolio_curve, timeframe):
+    import matplotlib.pyplot as plt  # only needed for this sink
     plt.figure(figsize=(12,6))
     portfolio_curve.plot(label='Portfolio Value')
     plt.ylabel('Portfolio Value')
@@ -258,31 +449,93 @@ def run_backtest_for_timeframe(timeframe):
     plt.grid()
     #plt.show()
     plt.savefig(f"Portfolio_Curve_{timeframe}_chart.png")
+    plt.close()
 
+def save_backtest(trade_log_df, portfolio_curve, summary, timeframe, out_dir=DASHBOARD_DIR):
     # Optionally save trade log for live signal monitoring:
     trade_log_df.to_csv(f"trade_log_{timeframe}.csv", index=False)
     print(f"Trade log saved: trade_log_{timeframe}.csv")
 
     # Store for future dashboarding
-    trade_log_df.to_csv(f"dashboard_data/trade_log_{timeframe}.csv", index=False)
-    portfolio_curve.to_csv(f"dashboard_data/portfolio_curve_{timeframe}.csv", header=['portfolio_value'])
-    summary = {
-        'final_value': float(portfolio_curve.iloc[-1]),
-        'total_return': float((portfolio_curve.iloc[-1]/STARTING_CASH-1)),
-        'max_drawdown': float(max_dd),
-        'sharpe': float(sharpe),
-        'win_rate': float(win_rate),
-        'avg_hold_hours': float(avg_hold),
-        'trade_count': int(len(trade_log_df))
-    }
-    import json
-    with open(f"dashboard_data/summary_{timeframe}.json", "w") as f:
+    os.makedirs(out_dir, exist_ok=True)
+    trade_log_df.to_csv(os.path.join(out_dir, f"trade_log_{timeframe}.csv"), index=False)
+    portfolio_curve.to_csv(os.path.join(out_dir, f"portfolio_curve_{timeframe}.csv"), header=['portfolio_value'])
+    with open(os.path.join(out_dir, f"summary_{timeframe}.json"), "w") as f:
         json.dump(summary, f)
-    print(f"Dashboard files saved in dashboard_data/ for {timeframe}")
+    print(f"Dashboard files saved in {out_dir}/ for {timeframe}")
+
+def run_backtest_for_timeframe(timeframe, engine="kernel", params=None, plot=True, save=True):
+    """Load the timeframe's frame, backtest it and write the sinks; params default to trade_params.json."""
+    params = load_trade_params() if params is None else params
+    df = load_backtest_frame(timeframe)
+    if df is None:
+        return None
+    trade_log_df, portfolio_curve, summary = backtest(df, params, engine)
+    print_summary(summary, timeframe)
+    if plot:
+        plot_portfolio_curve(portfolio_curve, timeframe)
+    if save:
+        save_backtest(trade_log_df, portfolio_curve, summary, timeframe)
+    return trade_log_df, portfolio_curve, summary
+
+def verify_engines(timeframe, params=None):
+    """Diff the kernel's vol-spike flags and trade log against the reference implementation."""
+    params = load_trade_params() if params is None else params
+    df = load_backtest_frame(timeframe)
+    if df is None:
+        return False
+    vol_spike_pctl = resolve_params(params)['vol_spike_pctl']
+    flags = vol_spike_flags(df, vol_spike_pctl)
+    reference_flags = vol_spike_reference(df, vol_spike_pctl).to_numpy(dtype=bool)
+    mismatched_flags = int((flags != reference_flags).sum())
+    expected = simulate(df, params, "reference").reset_index(drop=True)
+    actual = simulate(df, params, "kernel").reset_index(drop=True)
+    try:
+        pd.testing.assert_frame_equal(actual, expected, check_exact=True)
+        identical = mismatched_flags == 0
+    except AssertionError as e:
+        print(f"[FAIL] Trade logs differ:\n{e}")
+        identical = False
+    print(f"[{'OK' if identical else 'FAIL'}] {timeframe}: {len(expected)} reference trades, {len(actual)} kernel "
+          f"trades, {mismatched_flags} vol_spike mismatches")
+    return identical
+
+def benchmark_engines(timeframe, params=None, repeat=3):
+    """Best-of-`repeat` wall time of each engine (vol-spike flags plus simulation) on the same frame."""
+    params = load_trade_params() if params is None else params
+    df = load_backtest_frame(timeframe)
+    if df is None:
+        return None
+    started = time.perf_counter()
+    simulate(df, params, "kernel")  # first call pays for numba compilation (cached on disk afterwards)
+    warmup = time.perf_counter() - started
+    timings = {}
+    for engine in ["reference", "kernel"]:
+        runs = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            simulate(df, params, engine)
+            runs.append(time.perf_counter() - started)
+        timings[engine] = min(runs)
+    speedup = timings['reference'] / max(timings['kernel'], 1e-9)
+    print(f"[{timeframe}] {len(df)} rows: reference {timings['reference']:.2f}s, kernel {timings['kernel']:.3f}s "
+          f"({'numba' if njit is not None else 'no numba'}; first call {warmup:.2f}s) -> {speedup:,.0f}x")
+    return {**timings, 'rows': len(df), 'speedup': speedup, 'first_call': warmup}
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python backtest_by_timeframe_tradelog.py [timeframe]")
-        sys.exit(1)
-    tf = sys.argv[1]
-    run_backtest_for_timeframe(tf)
+    parser = argparse.ArgumentParser(description="Backtest a timeframe's predictions.")
+    parser.add_argument("timeframe")
+    parser.add_argument("--engine", choices=["kernel", "reference"], default="kernel")
+    parser.add_argument("--verify", action="store_true", help="Diff the kernel's trade log against the reference")
+    parser.add_argument("--benchmark", action="store_true", help="Time the kernel against the reference")
+    parser.add_argument("--params", default="trade_params.json", help="Trade parameters JSON file")
+    parser.add_argument("--no-plot", action="store_true")
+    args = parser.parse_args()
+    params = load_trade_params(args.params)
+    if args.verify or args.benchmark:
+        if args.verify:
+            verify_engines(args.timeframe, params)
+        if args.benchmark:
+            benchmark_engines(args.timeframe, params)
+    else:
+        run_backtest_for_timeframe(args.timeframe, args.engine, params, plot=not args.no_plot)
@@ -0,0 +1,94 @@
+"""
+Attaches higher-timeframe context (e.g. 4h/1d features) to lower-timeframe rows.
+
+Feature timestamps are bar open times. A lower row's features are known when
+its bar closes (open + lower delta), and a higher bar may only be used once it
+has closed too (open + higher delta), so each row gets the last higher bar
+with close <= lower close for the same symbol -- never the bar still forming.
+
+The match is a single searchsorted over a composite (symbol code, close ms)
+int64 key for all symbols at once, so there is no per-row or per-symbol loop.
+Output goes to ohlcv_parquet/<tf>_mtf_features.parquet with the context
+columns named <higher_tf>_<feature>.
+"""
+
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import ohlcv_store
+import feature_registry
+from aggregate_features_by_timeframe import source_files
+
+FEATURES_DIR = "ohlcv_parquet"
+KEY_SPAN = 2**42  # ms per symbol code in the composite key (covers dates to ~2109)
+EXCLUDED_CONTEXT = ['hour', 'dayofweek']
+
+def context_columns(available):
+    """Higher-timeframe features worth joining: no targets and no calendar fields."""
+    return [c for c in feature_registry.FEATURE_COLUMNS
+            if c in available and not c.startswith('target_') and c not in EXCLUDED_CONTEXT]
+
+def close_ms(timestamps, timeframe):
+    """Epoch ms at which bars opened at `timestamps` have closed."""
+    return ohlcv_store.series_to_ms(timestamps) + ohlcv_store.timeframe_ms(timeframe)
+
+def asof_indices(lower_codes, lower_ms, higher_codes, higher_ms):
+    """Row of the last higher bar with the same code and close <= lower_ms (-1 if none)."""
+    higher_key = higher_codes * KEY_SPAN + higher_ms
+    order = np.argsort(higher_key, kind='stable')
+    pos = np.searchsorted(higher_key[order], lower_codes * KEY_SPAN + lower_ms, side='right') - 1
+    matched = order[np.clip(pos, 0, None)]
+    valid = (pos >= 0) & (higher_codes[matched] == lower_codes)
+    return np.where(valid, matched, -1)
+
+def join_higher_timeframes(lower, timeframe, higher, columns=None):
+    """Return `lower` with as-of context columns from each frame in `higher` ({tf: features df})."""
+    lower_ms = close_ms(lower['timestamp'], timeframe)
+    joined = {}
+    for higher_tf, hdf in higher.items():
+        if ohlcv_store.timeframe_ms(higher_tf) <= ohlcv_store.timeframe_ms(timeframe):
+            raise ValueError(f"{higher_tf} is not a higher timeframe than {timeframe}")
+        cols = context_columns(hdf.columns) if columns is None else columns
+        codes, _ = pd.factorize(pd.concat([lower['symbol'].astype(str), hdf['symbol'].astype(str)], ignore_index=True))
+        codes = codes.astype('int64')
+        idx = asof_indices(codes[:len(lower)], lower_ms, codes[len(lower):], close_ms(hdf['timestamp'], higher_tf))
+        missing = idx < 0
+        take = np.clip(idx, 0, None)
+        for col in cols:
+            values = hdf[col].to_numpy()
+            out = values.take(take).astype(np.result_type(values.dtype, np.float32))
+            out[missing] = np.nan
+            joined[f"{higher_tf}_{col}"] = out
+        print(f"[{timeframe}<-{higher_tf}] {len(cols)} columns, {int((~missing).sum())}/{len(lower)} rows matched")
+    return pd.concat([lower, pd.DataFrame(joined, index=lower.index)], axis=1)
+
+def load_timeframe_features(timeframe, columns=None, features_dir=FEATURES_DIR):
+    """Aggregated <tf>_features.parquet if present, otherwise the per-symbol files."""
+    path = os.path.join(features_dir, f"{timeframe}_features.parquet")
+    paths = [path] if os.path.exists(path) else list(source_files(timeframe, features_dir).values())
+    if not paths:
+        raise FileNotFoundError(f"No feature files for {timeframe} in {features_dir}")
+    if columns is not None:
+        available = pq.read_schema(paths[0]).names
+        columns = ['symbol', 'timestamp'] + context_columns(available) if columns == 'context' else columns
+    return pd.concat([pd.read_parquet(p, columns=columns) for p in paths], ignore_index=True)
+
+def build_mtf_features(timeframe, higher_timeframes, features_dir=FEATURES_DIR):
+    started = time.perf_counter()
+    lower = load_timeframe_features(timeframe, features_dir=features_dir)
+    higher = {tf: load_timeframe_features(tf, columns='context', features_dir=features_dir) for tf in higher_timeframes}
+    joined = join_higher_timeframes(lower, timeframe, higher)
+    out_path = os.path.join(features_dir, f"{timeframe}_mtf_features.parquet")
+    joined.to_parquet(out_path, index=False)
+    print(f"[DONE] {len(joined)} rows x {joined.shape[1]} columns written to {out_path} "
+          f"in {time.perf_counter() - started:.1f}s")
+    return out_path
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python cross_timeframe_join.py [timeframe] [higher timeframes...]")
+        sys.exit(1)
+    build_mtf_features(sys.argv[1], sys.argv[2:])
@@ -0,0 +1,87 @@
+"""
+Blends the main model with the per-symbol models at inference time.
+
+Weights come from validation_results/model_validation_<tf>.csv, which holds
+both the main model's and the per-symbol model's out-of-sample metrics for
+every symbol. Each model's weight is its AUC edge over a coin flip
+(max(auc - 0.5, 0)); "weighted" normalises the two edges, "winner" gives
+everything to the better model. Symbols without a per-symbol model, or
+where neither model beats 0.5, fall back to the main model alone.
+
+The main model scores all rows in one call; rows are then grouped by symbol
+with one argsort so each per-symbol model scores only its own contiguous
+slice, and the blend is a single vectorized expression over the weight
+arrays.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import model_registry
+
+VALIDATION_RESULTS_DIR = "validation_results"
+ENSEMBLE_MODE = "weighted"  # or "winner"
+WEIGHT_METRIC = "auc"
+
+def validation_path(timeframe):
+    return os.path.join(VALIDATION_RESULTS_DIR, f"model_validation_{timeframe}.csv")
+
+def ensemble_weights(validation_df, mode=ENSEMBLE_MODE, metric=WEIGHT_METRIC):
+    """Per-symbol (w_main, w_symbol) from main vs per-symbol validation rows; rows sum to 1."""
+    scores = validation_df.pivot_table(index='symbol', columns='model', values=metric, aggfunc='last')
+    for model in ['main', 'per_symbol']:
+        if model not in scores.columns:
+            scores[model] = np.nan
+    edge_main = (scores['main'] - 0.5).clip(lower=0).fillna(0)
+    edge_symbol = (scores['per_symbol'] - 0.5).clip(lower=0).fillna(0)
+    if mode == "winner":
+        w_symbol = (edge_symbol > edge_main).astype(float)
+    elif mode == "weighted":
+        total = edge_main + edge_symbol
+        w_symbol = (edge_symbol / total.where(total > 0)).fillna(0.0)
+    else:
+        raise ValueError(f"Unknown ensemble mode: {mode}")
+    return pd.DataFrame({'w_main': 1.0 - w_symbol, 'w_symbol': w_symbol})
+
+def load_weights(timeframe, mode=ENSEMBLE_MODE, metric=WEIGHT_METRIC):
+    path = validation_path(timeframe)
+    if not os.path.exists(path):
+        print(f"[WARN] {path} not found, ensemble falls back to the main model")
+        return pd.DataFrame(columns=['w_main', 'w_symbol'], dtype=float)
+    return ensemble_weights(pd.read_csv(path), mode, metric)
+
+def required_columns(timeframe, registry):
+    """Union of the feature lists of the main and per-symbol models (read from the manifest, not the models)."""
+    entries = registry.entries(timeframe)
+    columns = []
+    for features in entries.get('features', pd.Series(dtype=object)):
+        columns.extend(features)
+    return list(dict.fromkeys(columns))
+
+def score_ensemble(df, timeframe, registry=None, weights=None, main_artifact=None):
+    """Blended probabilities for every row of df: returns proba_up, proba_main and proba_symbol arrays."""
+    registry = registry or model_registry.ModelRegistry()
+    main_artifact = main_artifact or registry.get(timeframe)
+    if main_artifact is None:
+        raise FileNotFoundError(f"No main model registered for {timeframe}")
+    weights = load_weights(timeframe) if weights is None else weights
+
+    proba_main = main_artifact['model'].predict_proba(df[main_artifact['features']])[:, 1]
+    proba_symbol = np.full(len(df), np.nan)
+    codes, symbols = pd.factorize(df['symbol'].astype(str))
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(symbols) + 1))
+    w_symbol_by_code = weights['w_symbol'].reindex(symbols).fillna(0.0).to_numpy()
+    for k, symbol in enumerate(symbols):
+        if w_symbol_by_code[k] <= 0:
+            continue  # zero weight: skip loading and scoring the per-symbol model
+        artifact = registry.get(timeframe, symbol)
+        if artifact is None:
+            w_symbol_by_code[k] = 0.0
+            continue
+        rows = order[bounds[k]:bounds[k + 1]]
+        proba_symbol[rows] = artifact['model'].predict_proba(df[artifact['features']].iloc[rows])[:, 1]
+
+    w_symbol = w_symbol_by_code[codes]
+    proba = np.where(np.isnan(proba_symbol), proba_main, (1.0 - w_symbol) * proba_main + w_symbol * proba_symbol)
+    return proba, proba_main, proba_symbol
@@ -1,31 +1,45 @@
 import pandas as pd
 import numpy as np
-import talib
 import os
 import sys
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pyarrow as pa
+import pyarrow.parquet as pq
 import pytz
 from datetime import datetime, timezone
+import ohlcv_store
+import feature_registry
+import panel_features
+from compact_schema import to_compact_schema
 DATA_DIR = ''
 COVERAGE_LOG_PATH = 'symbol_timeframe_coverage.csv'
 
 def log_symbol_coverage(features_path, timeframe):
-    df = pd.read_parquet(features_path)
-    df['datetime'] = pd.to_datetime(df['timestamp'])
-    summary = []
-    for symbol, sdf in df.groupby('symbol'):
-        n_bars = len(sdf)
-        start = sdf['datetime'].min()
-        end = sdf['datetime'].max()
-        sufficient = n_bars >= 1000
-        summary.append({
-            'symbol': symbol,
-            'timeframe': timeframe,
-            'n_bars': n_bars,
-            'start': start,
-            'end': end,
-            'sufficient': sufficient
-        })
-    summary_df = pd.DataFrame(summary)
+    # The OHLCV manifest answers coverage without touching bar data; fall back to scanning features
+    summary_df = ohlcv_store.coverage_frame(timeframe, root=DATA_DIR)
+    if not summary_df.empty:
+        summary_df = summary_df[['symbol', 'timeframe', 'n_bars', 'start', 'end']]
+        summary_df['sufficient'] = summary_df['n_bars'] >= 1000
+    else:
+        df = pd.read_parquet(features_path, columns=['symbol', 'timestamp'])
+        df['datetime'] = pd.to_datetime(df['timestamp'])
+        summary = []
+        for symbol, sdf in df.groupby('symbol'):
+            n_bars = len(sdf)
+            start = sdf['datetime'].min()
+            end = sdf['datetime'].max()
+            sufficient = n_bars >= 1000
+            summary.append({
+                'symbol': symbol,
+                'timeframe': timeframe,
+                'n_bars': n_bars,
+                'start': start,
+                'end': end,
+                'sufficient': sufficient
+            })
+        summary_df = pd.DataFrame(summary)
     # Append or overwrite; here we append and deduplicate on ['symbol', 'timeframe']
     if os.path.exists(COVERAGE_LOG_PATH):
         existing = pd.read_csv(COVERAGE_LOG_PATH, parse_dates=['start', 'end'])
@@ -37,13 +51,16 @@ def log_symbol_coverage(features_path, timeframe):
     print(f"Coverage summary saved to {COVERAGE_LOG_PATH}")
 
 
-def clean_ohlcv(df):
+def bad_bar_mask(df):
     # Drop flat bars
     flat = (df['open'] == df['high']) & (df['open'] == df['low']) & (df['open'] == df['close'])
     # Drop zero or missing volume
     no_vol = df['volume'].isna() | (df['volume'] == 0)
+    return flat | no_vol
+
+def clean_ohlcv(df, timeframe):
     before = len(df)
-    df_clean = df[~(flat | no_vol)].reset_index(drop=True)
+    df_clean = df[~bad_bar_mask(df)].reset_index(drop=True)
     after = len(df_clean)
     print(f"  Dropped {before - after} bars (flat or zero/missing volume)")
 
@@ -84,107 +101,277 @@ def clean_ohlcv(df):
 
 
 
-def generate_features_for_timeframe(timeframe):
-    for symbol_folder in os.listdir(DATA_DIR):
-        folder_path = os.path.join(DATA_DIR, symbol_folder)
-        if not os.path.isdir(folder_path):
-            continue
-        in_path = os.path.join(folder_path, f'{timeframe}.parquet')
-        out_path = os.path.join(folder_path, f'{timeframe}_features.parquet')
-        if not os.path.exists(in_path):
-            print(f"Raw data file missing: {in_path}")
-            continue
+def compute_features(df, columns=None):
+    """Add feature and target columns to a cleaned, time-sorted OHLCV frame.
 
-        # --- Load Data ---
-                # --- Load & Clean Data ---
-        df = pd.read_parquet(in_path)
-        if df.empty or len(df) < 50:
-            print(f"Not enough data in {in_path}")
-            continue
-        df = df.sort_values('timestamp').reset_index(drop=True)
-        df = clean_ohlcv(df)
-        if len(df) < 50:
-            print(f"Not enough data after cleaning in {in_path}")
+    Definitions live in feature_registry; `columns` (e.g. a model artifact's
+    `features` list) restricts the computation to what is actually needed.
+    """
+    return feature_registry.compute_features(df, columns=columns)
+
+
+def finalize_features(df):
+    # --- Deduplicate and Clean ---
+    dedup_cols = ['symbol', 'timestamp', 'timeframe'] if set(['symbol','timestamp','timeframe']).issubset(df.columns) else ['timestamp']
+    return df.drop_duplicates(subset=dedup_cols).dropna().reset_index(drop=True)
+
+def load_clean_bars(symbol_folder, timeframe, start=None):
+    in_path = ohlcv_store.partition_root(symbol_folder, timeframe, root=DATA_DIR)
+    if not ohlcv_store.has_bars(symbol_folder, timeframe, root=DATA_DIR):
+        print(f"Raw data missing: {in_path}")
+        return None
+
+    # --- Load & Clean Data ---
+    df = ohlcv_store.read_bars(symbol_folder, timeframe, root=DATA_DIR, start=start)
+    if df.empty or len(df) < 50:
+        print(f"Not enough data in {in_path}")
+        return None
+    df = df.sort_values('timestamp').reset_index(drop=True)
+    df = clean_ohlcv(df, timeframe)
+    if len(df) < 50:
+        print(f"Not enough data after cleaning in {in_path}")
+        return None
+    return df
+
+def write_full_features(symbol_folder, timeframe, out_path, compact=False):
+    df = load_clean_bars(symbol_folder, timeframe)
+    if df is None:
+        return None
+    df = finalize_features(compute_features(df))
+    if compact:
+        df = to_compact_schema(df)
+
+    # --- Save Feature Data ---
+    df.to_parquet(out_path, index=False)
+    print(f"Features saved to: {out_path}")
+    return len(df)
+
+# --- Incremental mode ---
+# Recursive indicators (EMA/MACD, Wilder RSI/ATR/ADX) forget their seed geometrically, so a tail of
+# WARMUP_BARS cleaned bars reproduces a full recompute to float precision; rolling windows need <= 24.
+WARMUP_BARS = 600
+VERIFY_BARS = 50
+VERIFY_RTOL = 1e-6
+VERIFY_ATOL = 1e-8
+CUMULATIVE_FEATURES = ['obv']  # running totals: realigned to the existing file by a constant offset
+
+def append_incremental_features(symbol_folder, timeframe, out_path, compact=False):
+    """Compute features only for bars newer than the existing features file and append them.
+
+    Reloads just the warm-up tail, checks the recomputed overlap against the stored rows and
+    falls back to a full rebuild if they disagree. Returns the number of rows appended
+    (None if the symbol was skipped).
+    """
+    if not os.path.exists(out_path):
+        return write_full_features(symbol_folder, timeframe, out_path, compact=compact)
+    existing = pq.read_table(out_path)
+    existing_ts = existing.column('timestamp').to_pandas()
+    if existing.num_rows == 0:
+        return write_full_features(symbol_folder, timeframe, out_path, compact=compact)
+    last_ts = existing_ts.max()
+
+    # Flat/zero-volume bars are removed by cleaning, so read generously and trim to WARMUP_BARS
+    delta = ohlcv_store.TIMEFRAME_DELTAS[timeframe]
+    df = load_clean_bars(symbol_folder, timeframe, start=last_ts - 3 * WARMUP_BARS * delta)
+    if df is None:
+        return None
+    n_before = int((df['timestamp'] <= last_ts).sum())
+    if n_before < WARMUP_BARS + VERIFY_BARS and n_before < existing.num_rows:
+        print(f"  Tail too short for warm-up ({n_before} bars), rebuilding {out_path}")
+        return write_full_features(symbol_folder, timeframe, out_path, compact=compact)
+    df = df.iloc[max(0, n_before - WARMUP_BARS - VERIFY_BARS):].reset_index(drop=True)
+    tail = finalize_features(compute_features(df))
+
+    # --- Verify the overlap against the stored rows ---
+    overlap_start = existing.num_rows - VERIFY_BARS if existing.num_rows > VERIFY_BARS else 0
+    stored = existing.slice(overlap_start).to_pandas()
+    recomputed = tail[tail['timestamp'].isin(stored['timestamp'])]
+    stored = stored[stored['timestamp'].isin(recomputed['timestamp'])].reset_index(drop=True)
+    recomputed = recomputed.reset_index(drop=True)
+    if stored.empty:
+        print(f"  No overlap with stored features, rebuilding {out_path}")
+        return write_full_features(symbol_folder, timeframe, out_path, compact=compact)
+    for col in CUMULATIVE_FEATURES:
+        offset = stored[col].iloc[0] - recomputed[col].iloc[0]
+        recomputed[col] += offset
+        tail[col] += offset
+    numeric = [c for c in stored.columns if pd.api.types.is_numeric_dtype(stored[c]) and c in recomputed.columns]
+    mismatched = [
+        c for c in numeric
+        if not np.allclose(recomputed[c].to_numpy(float), stored[c].to_numpy(float), rtol=VERIFY_RTOL, atol=VERIFY_ATOL)
+    ]
+    if mismatched:
+        print(f"  Incremental overlap mismatch on {mismatched[:5]}, rebuilding {out_path}")
+        return write_full_features(symbol_folder, timeframe, out_path, compact=compact)
+
+    # --- Append new rows ---
+    new_rows = tail[tail['timestamp'] > last_ts][stored.columns]
+    if compact:
+        new_rows = to_compact_schema(new_rows)
+    if new_rows.empty:
+        print(f"No new feature rows for {out_path}")
+        return 0
+    try:
+        new_table = pa.Table.from_pandas(new_rows, schema=existing.schema, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, ValueError) as e:
+        # e.g. switching between the compact and float64 schemas
+        print(f"  Schema change ({e}), rebuilding {out_path}")
+        return write_full_features(symbol_folder, timeframe, out_path, compact=compact)
+    pq.write_table(pa.concat_tables([existing, new_table]), out_path)
+    print(f"Appended {len(new_rows)} feature rows to: {out_path}")
+    return len(new_rows)
+
+def generate_features_for_symbol(symbol_folder, timeframe, incremental=False, compact=False):
+    folder_path = os.path.join(DATA_DIR, symbol_folder)
+    out_path = os.path.join(folder_path, f'{timeframe}_features.parquet')
+    if incremental:
+        return append_incremental_features(symbol_folder, timeframe, out_path, compact=compact)
+    return write_full_features(symbol_folder, timeframe, out_path, compact=compact)
+
+def run_symbol_job(symbol_folder, timeframe, incremental=False, compact=False):
+    """Worker entry point: one symbol, errors and timing captured instead of raised."""
+    started = time.perf_counter()
+    try:
+        rows = generate_features_for_symbol(symbol_folder, timeframe, incremental=incremental, compact=compact)
+        status, error = ('ok' if rows is not None else 'skipped'), ''
+    except Exception as e:
+        rows, status, error = None, 'error', f"{type(e).__name__}: {e}"
+    return {
+        'symbol': symbol_folder,
+        'timeframe': timeframe,
+        'status': status,
+        'rows': rows,
+        'seconds': time.perf_counter() - started,
+        'error': error
+    }
+
+def list_symbol_folders():
+    return [
+        f for f in sorted(os.listdir(DATA_DIR))
+        if os.path.isdir(os.path.join(DATA_DIR, f))
+    ]
+
+def generate_features_for_timeframe(timeframe, incremental=False, workers=None, compact=False):
+    """Build features for every symbol folder; workers > 1 fans symbols out over a process pool."""
+    symbol_folders = list_symbol_folders()
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    if workers == 1:
+        results = [run_symbol_job(f, timeframe, incremental, compact) for f in symbol_folders]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_symbol_job, f, timeframe, incremental, compact) for f in symbol_folders]
+            results = [future.result() for future in as_completed(futures)]
+
+    timings = pd.DataFrame(results, columns=['symbol', 'timeframe', 'status', 'rows', 'seconds', 'error'])
+    if not timings.empty:
+        timings = timings.sort_values('seconds', ascending=False).reset_index(drop=True)
+    print_feature_run_summary(timings, time.perf_counter() - started, workers)
+    return timings
+
+def load_panel_inputs(timeframe, symbol_folders):
+    """Cleaned bars for the panel engine, plus result rows for the symbols that were skipped."""
+    folders, frames, load_seconds, skipped = [], [], [], []
+    for symbol_folder in symbol_folders:
+        started = time.perf_counter()
+        df = load_clean_bars(symbol_folder, timeframe)
+        if df is None:
+            skipped.append({'symbol': symbol_folder, 'timeframe': timeframe, 'status': 'skipped',
+                            'rows': None, 'seconds': time.perf_counter() - started, 'error': ''})
             continue
+        folders.append(symbol_folder)
+        frames.append(df)
+        load_seconds.append(time.perf_counter() - started)
+    return folders, frames, load_seconds, skipped
+
+def generate_features_panel(timeframe, compact=False):
+    """Full rebuild of every symbol through the panel engine (see panel_features.py).
 
+    Rolling features for all symbols are computed block-wise as 2-D arrays; seconds per symbol
+    are its load plus finalise/write time, the shared panel pass is only in the wall-clock total.
+    """
+    started = time.perf_counter()
+    folders, frames, load_seconds, results = load_panel_inputs(timeframe, list_symbol_folders())
+    for j, df in panel_features.iter_panel_features(frames):
+        job_started = time.perf_counter()
+        out_path = os.path.join(DATA_DIR, folders[j], f'{timeframe}_features.parquet')
+        try:
+            df = finalize_features(df)
+            if compact:
+                df = to_compact_schema(df)
+            df.to_parquet(out_path, index=False)
+            rows, status, error = len(df), 'ok', ''
+        except Exception as e:
+            rows, status, error = None, 'error', f"{type(e).__name__}: {e}"
+        frames[j] = None  # release the block's inputs as we go
+        results.append({'symbol': folders[j], 'timeframe': timeframe, 'status': status, 'rows': rows,
+                        'seconds': load_seconds[j] + time.perf_counter() - job_started, 'error': error})
 
-        # --- Lagged Returns ---
-        for lag in [1, 3, 6, 12]:
-            df[f'return_{lag}'] = df['close'].pct_change(lag)
-
-        # --- Rolling Statistics ---
-        windows = [6, 12, 24]
-        for win in windows:
-            df[f'close_mean_{win}'] = df['close'].rolling(win).mean()
-            df[f'close_std_{win}'] = df['close'].rolling(win).std()
-            df[f'close_z_{win}'] = (df['close'] - df[f'close_mean_{win}']) / df[f'close_std_{win}']
-            df[f'hl_range_{win}'] = (df['high'] - df['low']).rolling(win).mean() / df['close']
-
-        # --- Volume Features ---
-        for win in windows:
-            df[f'volume_mean_{win}'] = df['volume'].rolling(win).mean()
-            df[f'volume_std_{win}'] = df['volume'].rolling(win).std()
-
-        # --- TA-Lib Indicators ---
-        df['rsi_14'] = talib.RSI(df['close'], timeperiod=14)
-        df['ema_12'] = talib.EMA(df['close'], timeperiod=12)
-        df['ema_26'] = talib.EMA(df['close'], timeperiod=26)
-        macd, macdsignal, macdhist = talib.MACD(df['close'], fastperiod=12, slowperiod=26, signalperiod=9)
-        df['macd'] = macd
-        df['macd_signal'] = macdsignal
-        df['macd_hist'] = macdhist
-        upperband, middleband, lowerband = talib.BBANDS(df['close'], timeperiod=20, nbdevup=2, nbdevdn=2)
-        df['bb_upper_20'] = upperband
-        df['bb_middle_20'] = middleband
-        df['bb_lower_20'] = lowerband
-        df['bb_width_20'] = (upperband - lowerband) / middleband
-        df['atr_14'] = talib.ATR(df['high'], df['low'], df['close'], timeperiod=14)
-        df['adx_14'] = talib.ADX(df['high'], df['low'], df['close'], timeperiod=14)
-        slowk, slowd = talib.STOCH(df['high'], df['low'], df['close'])
-        df['stoch_k'] = slowk
-        df['stoch_d'] = slowd
-        df['willr_14'] = talib.WILLR(df['high'], df['low'], df['close'], timeperiod=14)
-        df['cci_14'] = talib.CCI(df['high'], df['low'], df['close'], timeperiod=14)
-        df['mfi_14'] = talib.MFI(df['high'], df['low'], df['close'], df['volume'], timeperiod=14)
-        df['obv'] = talib.OBV(df['close'], df['volume'])
-
-        # --- Time Features ---
-        df['hour'] = df['timestamp'].dt.hour
-        df['dayofweek'] = df['timestamp'].dt.dayofweek
-
-        # --- Targets ---
-        df['target_return_1'] = df['close'].shift(-1) / df['close'] - 1
-        df['target_up'] = (df['target_return_1'] > 0).astype(int)
-
-        # --- Risk Features Stefan ---
-        # Trailing drawdown (max close over last 20 bars)
-        df['drawdown_20'] = df['close'] / df['close'].rolling(20).max() - 1
-
-        # Rolling volatility (14 bars)
-        df['rolling_std_14'] = df['close'].pct_change().rolling(14).std()
-
-        # Liquidity risk: Low volume flag (less than 50% of 20-bar mean)
-        df['low_vol_liquidity'] = (df['volume'] < df['volume'].rolling(20).mean() * 0.5).astype(int)
-
-        # Rolling min/max for possible mean reversion or breakout stops
-        df['rolling_max_20'] = df['close'].rolling(20).max()
-        df['rolling_min_20'] = df['close'].rolling(20).min()
-
-
-        # --- Deduplicate and Clean ---
-        dedup_cols = ['symbol', 'timestamp', 'timeframe'] if set(['symbol','timestamp','timeframe']).issubset(df.columns) else ['timestamp']
-        df = df.drop_duplicates(subset=dedup_cols).dropna().reset_index(drop=True)
-
-        # --- Save Feature Data ---
-        df.to_parquet(out_path, index=False)
-        print(f"Features saved to: {out_path}")
+    timings = pd.DataFrame(results, columns=['symbol', 'timeframe', 'status', 'rows', 'seconds', 'error'])
+    if not timings.empty:
+        timings = timings.sort_values('seconds', ascending=False).reset_index(drop=True)
+    print_feature_run_summary(timings, time.perf_counter() - started, 1)
+    return timings
+
+def verify_panel_parity(timeframe, symbol_folders=None, rtol=VERIFY_RTOL, atol=VERIFY_ATOL):
+    """Compare panel and per-symbol features in memory (nothing is written). One row per symbol."""
+    folders, frames, _, _ = load_panel_inputs(timeframe, symbol_folders or list_symbol_folders())
+    records = []
+    for j, panel_df in panel_features.iter_panel_features(frames):
+        panel_df = finalize_features(panel_df)
+        reference = finalize_features(compute_features(frames[j]))
+        record = {'symbol': folders[j], 'rows': len(reference), 'panel_rows': len(panel_df),
+                  'max_abs_diff': 0.0, 'worst_column': None, 'match': len(panel_df) == len(reference)}
+        if record['match']:
+            for col in feature_registry.FEATURE_COLUMNS:
+                a = reference[col].to_numpy(dtype='float64')
+                b = panel_df[col].to_numpy(dtype='float64')
+                diff = np.abs(a - b)
+                diff[(a == b) | (np.isnan(a) & np.isnan(b))] = 0.0
+                worst = float(np.nanmax(diff)) if len(diff) else 0.0
+                if worst > record['max_abs_diff']:
+                    record['max_abs_diff'], record['worst_column'] = worst, col
+                if not np.allclose(a, b, rtol=rtol, atol=atol, equal_nan=True):
+                    record['match'] = False
+        records.append(record)
+    report = pd.DataFrame(records, columns=['symbol', 'rows', 'panel_rows', 'match', 'max_abs_diff', 'worst_column'])
+    print(report.to_string(index=False))
+    print(f"[{timeframe}] Panel parity: {int(report['match'].sum())}/{len(report)} symbols match")
+    return report
+
+def print_feature_run_summary(timings, wall_seconds, workers):
+    if timings.empty:
+        print(f"[{workers} workers] No symbol folders found in {DATA_DIR!r}")
+        return
+    counts = timings['status'].value_counts().to_dict()
+    cpu_seconds = timings['seconds'].sum()
+    print(f"\n[DONE] {len(timings)} symbols in {wall_seconds:.1f}s wall / {cpu_seconds:.1f}s summed "
+          f"({workers} workers, {cpu_seconds / max(wall_seconds, 1e-9):.1f}x) | {counts}")
+    print("Slowest symbols:")
+    print(timings.head(10)[['symbol', 'status', 'rows', 'seconds']].to_string(index=False))
+    for _, row in timings[timings['status'] == 'error'].iterrows():
+        print(f"[ERROR] {row['symbol']}: {row['error']}")
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python feature_engineering_timeframe.py [timeframe]")
-        sys.exit(1)
-    timeframe = sys.argv[1]
-    generate_features_for_timeframe(timeframe)
+    parser = argparse.ArgumentParser(description="Build per-symbol feature files for one timeframe.")
+    parser.add_argument("timeframe")
+    parser.add_argument("--incremental", action="store_true", help="Only compute features for bars newer than the existing file")
+    parser.add_argument("--compact", action="store_true", help="Write float32/int8/categorical columns (see compact_schema.py)")
+    parser.add_argument("--workers", type=int, default=None, help="Process pool size (default: CPU count, 1 = serial)")
+    parser.add_argument("--engine", choices=["symbol", "panel"], default="symbol",
+                        help="panel: compute rolling features for all symbols as 2-D arrays (full rebuild only)")
+    parser.add_argument("--verify-panel", action="store_true", help="Report panel vs per-symbol differences and exit")
+    args = parser.parse_args()
+    timeframe = args.timeframe
+    if args.verify_panel:
+        report = verify_panel_parity(timeframe)
+        sys.exit(0 if report['match'].all() else 1)
+    if args.engine == "panel":
+        if args.incremental:
+            parser.error("--engine panel always rebuilds; drop --incremental")
+        generate_features_panel(timeframe, compact=args.compact)
+    else:
+        generate_features_for_timeframe(timeframe, incremental=args.incremental, workers=args.workers, compact=args.compact)
     # Usage after feature cleaning/engineering
     features_path = os.path.join(DATA_DIR, f"{timeframe}_features.parquet")
     log_symbol_coverage(features_path, timeframe)
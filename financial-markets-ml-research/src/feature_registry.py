@@ -0,0 +1,158 @@
+"""
+Declarative feature registry.
+
+Every feature (and every intermediate shared by several features) is a node
+that declares its inputs. compute_features() resolves the dependency DAG for
+just the requested columns, evaluates each node once, and releases
+intermediates as soon as their last consumer has run. Passing the `features`
+list saved in a model artifact computes only what that model needs.
+"""
+
+import importlib
+import pandas as pd
+
+class LazyModule:
+    """Imports a module on first attribute access, so importing the registry does not need TA-Lib
+    (the streaming engine only reads its column lists)."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self.name), attr)
+
+talib = LazyModule('talib')
+BASE_COLUMNS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+REGISTRY = {}         # name -> (inputs, func)
+FEATURE_COLUMNS = []  # public feature/target columns, in feature-file order
+
+def register(name, inputs, func, public=True):
+    if name in REGISTRY:
+        raise ValueError(f"Feature already registered: {name}")
+    REGISTRY[name] = (tuple(inputs), func)
+    if public:
+        FEATURE_COLUMNS.append(name)
+
+# --- Lagged Returns ---
+for lag in [1, 3, 6, 12]:
+    register(f'return_{lag}', ['close'], lambda close, lag=lag: close.pct_change(lag))
+
+# --- Rolling Statistics ---
+WINDOWS = [6, 12, 24]
+register('_hl', ['high', 'low'], lambda high, low: high - low, public=False)
+for win in WINDOWS:
+    register(f'close_mean_{win}', ['close'], lambda close, win=win: close.rolling(win).mean())
+    register(f'close_std_{win}', ['close'], lambda close, win=win: close.rolling(win).std())
+    register(f'close_z_{win}', ['close', f'close_mean_{win}', f'close_std_{win}'],
+             lambda close, mean, std: (close - mean) / std)
+    register(f'hl_range_{win}', ['_hl', 'close'], lambda hl, close, win=win: hl.rolling(win).mean() / close)
+
+# --- Volume Features ---
+for win in WINDOWS:
+    register(f'volume_mean_{win}', ['volume'], lambda volume, win=win: volume.rolling(win).mean())
+    register(f'volume_std_{win}', ['volume'], lambda volume, win=win: volume.rolling(win).std())
+
+# --- TA-Lib Indicators ---
+register('rsi_14', ['close'], lambda close: talib.RSI(close, timeperiod=14))
+register('ema_12', ['close'], lambda close: talib.EMA(close, timeperiod=12))
+register('ema_26', ['close'], lambda close: talib.EMA(close, timeperiod=26))
+register('_macd', ['close'], lambda close: talib.MACD(close, fastperiod=12, slowperiod=26, signalperiod=9), public=False)
+register('macd', ['_macd'], lambda m: m[0])
+register('macd_signal', ['_macd'], lambda m: m[1])
+register('macd_hist', ['_macd'], lambda m: m[2])
+register('_bbands_20', ['close'], lambda close: talib.BBANDS(close, timeperiod=20, nbdevup=2, nbdevdn=2), public=False)
+register('bb_upper_20', ['_bbands_20'], lambda bb: bb[0])
+register('bb_middle_20', ['_bbands_20'], lambda bb: bb[1])
+register('bb_lower_20', ['_bbands_20'], lambda bb: bb[2])
+register('bb_width_20', ['_bbands_20'], lambda bb: (bb[0] - bb[2]) / bb[1])
+register('atr_14', ['high', 'low', 'close'], lambda high, low, close: talib.ATR(high, low, close, timeperiod=14))
+register('adx_14', ['high', 'low', 'close'], lambda high, low, close: talib.ADX(high, low, close, timeperiod=14))
+register('_stoch', ['high', 'low', 'close'], lambda high, low, close: talib.STOCH(high, low, close), public=False)
+register('stoch_k', ['_stoch'], lambda st: st[0])
+register('stoch_d', ['_stoch'], lambda st: st[1])
+register('willr_14', ['high', 'low', 'close'], lambda high, low, close: talib.WILLR(high, low, close, timeperiod=14))
+register('cci_14', ['high', 'low', 'close'], lambda high, low, close: talib.CCI(high, low, close, timeperiod=14))
+register('mfi_14', ['high', 'low', 'close', 'volume'],
+         lambda high, low, close, volume: talib.MFI(high, low, close, volume, timeperiod=14))
+register('obv', ['close', 'volume'], lambda close, volume: talib.OBV(close, volume))
+
+# --- Time Features ---
+register('hour', ['timestamp'], lambda ts: ts.dt.hour)
+register('dayofweek', ['timestamp'], lambda ts: ts.dt.dayofweek)
+
+# --- Targets ---
+register('target_return_1', ['close'], lambda close: close.shift(-1) / close - 1)
+register('target_up', ['target_return_1'], lambda ret: (ret > 0).astype(int))
+
+# --- Risk Features Stefan ---
+# One rolling max serves both the trailing drawdown and the breakout level
+register('_close_max_20', ['close'], lambda close: close.rolling(20).max(), public=False)
+register('_volume_mean_20', ['volume'], lambda volume: volume.rolling(20).mean(), public=False)
+register('drawdown_20', ['close', '_close_max_20'], lambda close, cmax: close / cmax - 1)
+# return_1 is close.pct_change(), so the volatility reuses it rather than recomputing
+register('rolling_std_14', ['return_1'], lambda ret: ret.rolling(14).std())
+register('low_vol_liquidity', ['volume', '_volume_mean_20'], lambda volume, vmean: (volume < vmean * 0.5).astype(int))
+register('rolling_max_20', ['_close_max_20'], lambda cmax: cmax)
+register('rolling_min_20', ['close'], lambda close: close.rolling(20).min())
+
+def plan(columns, available=()):
+    """Nodes needed for `columns`, dependencies first. Each shared intermediate appears once;
+    nodes in `available` are leaves whose dependencies are not planned."""
+    order = []
+    seen = set()
+
+    def visit(name):
+        if name in seen or name in BASE_COLUMNS:
+            return
+        if name in available:
+            seen.add(name)
+            order.append(name)
+            return
+        if name not in REGISTRY:
+            raise KeyError(f"Unknown feature: {name}")
+        seen.add(name)
+        for dep in REGISTRY[name][0]:
+            visit(dep)
+        order.append(name)
+
+    for column in columns:
+        visit(column)
+    return order
+
+def compute_features(df, columns=None, precomputed=None):
+    """Return `df` with the requested feature columns appended (all public features by default).
+
+    `precomputed` maps node names to already available series (e.g. from a panel
+    computation); those nodes are taken as-is instead of being evaluated.
+    """
+    columns = FEATURE_COLUMNS if columns is None else [c for c in columns if c not in BASE_COLUMNS]
+    values = dict(precomputed or {})
+    order = plan(columns, available=values)
+    wanted = set(columns)
+    remaining_uses = {}
+    for name in order:
+        if name in values:
+            continue
+        for dep in REGISTRY[name][0]:
+            remaining_uses[dep] = remaining_uses.get(dep, 0) + 1
+
+    for name in order:
+        if name in values:
+            continue
+        inputs, func = REGISTRY[name]
+        values[name] = func(*[values[dep] if dep in values else df[dep] for dep in inputs])
+        for dep in inputs:
+            remaining_uses[dep] -= 1
+            if remaining_uses[dep] == 0 and dep not in wanted and dep not in BASE_COLUMNS:
+                del values[dep]
+
+    new = pd.DataFrame({c: values[c] for c in columns}, index=df.index)
+    return pd.concat([df, new], axis=1)
+
+def input_columns(columns):
+    """Raw OHLCV columns a set of features depends on."""
+    needed = set()
+    for name in plan(columns):
+        needed.update(dep for dep in REGISTRY[name][0] if dep in BASE_COLUMNS)
+    needed.update(c for c in columns if c in BASE_COLUMNS)
+    return [c for c in BASE_COLUMNS if c in needed]
@@ -1,15 +1,39 @@
 import ccxt
+import ccxt.async_support as ccxt_async
 import pandas as pd
+import argparse
+import asyncio
+import json
 import os
+import random
 import sys
 import time
+import ohlcv_store
+import resample_ohlcv
 
 LIMIT = 300
 OUTPUT_DIR = "ohlcv_parquet"
 #Symbols can be updated and grow from exchanges or other data sources, just need to align.
 SYMBOLS_FILE = "path_to_your_symbols.txt"
 
-def fetch_missing_bars(exchange, symbol, timeframe, since=None):
+# --- Async fetch settings ---
+CONCURRENCY = 16           # symbol/timeframe jobs in flight at once
+MAX_RETRIES = 5            # per page, for network / rate limit errors
+BACKOFF_BASE = 1.0         # seconds, doubled on every retry (plus jitter)
+RETRYABLE_ERRORS = (ccxt.NetworkError, ccxt.RateLimitExceeded)
+
+OHLCV_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+def bars_to_frame(all_data, symbol, timeframe):
+    if not all_data:
+        return pd.DataFrame()
+    df = pd.DataFrame(all_data, columns=OHLCV_COLUMNS)
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms', utc=True)
+    df['symbol'] = symbol
+    df['timeframe'] = timeframe
+    return df
+
+def fetch_missing_bars(exchange, symbol, timeframe, since=None, until=None):
     all_data = []
     seen_timestamps = set()
     while True:
@@ -17,7 +41,7 @@ def fetch_missing_bars(exchange, symbol, timeframe, since=None):
             ohlcv = exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=LIMIT)
         except Exception as e:
             print(f"Error for {symbol}-{timeframe}: {e}. Skipping this symbol/timeframe.")
-            return pd.DataFrame()
+            return None
         if not ohlcv:
             break
         ohlcv = [row for row in ohlcv if row[0] not in seen_timestamps]
@@ -29,22 +53,203 @@ def fetch_missing_bars(exchange, symbol, timeframe, since=None):
             since = ohlcv[-1][0] + 1
         else:
             break
-        if len(ohlcv) < LIMIT:
+        if len(ohlcv) < LIMIT or (until is not None and ohlcv[-1][0] >= until):
             break
         time.sleep(exchange.rateLimit / 1000 + 0.1)
-    if not all_data:
-        return pd.DataFrame()
-    df = pd.DataFrame(all_data, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms', utc=True)
-    df['symbol'] = symbol
-    df['timeframe'] = timeframe
-    return df
+    if until is not None:
+        all_data = [row for row in all_data if row[0] <= until]
+    return bars_to_frame(all_data, symbol, timeframe)
+
+# --- Async fetch mode ---
+
+class TokenBucket:
+    """Async token bucket shared by every in-flight request.
+
+    Refills at `rate` tokens per second and allows bursts of up to `capacity`
+    requests, so many symbols can be paged concurrently without exceeding
+    the exchange's request budget.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+async def fetch_page_with_retry(exchange, limiter, symbol, timeframe, since):
+    for attempt in range(MAX_RETRIES + 1):
+        await limiter.acquire()
+        try:
+            return await exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=LIMIT)
+        except RETRYABLE_ERRORS as e:
+            if attempt == MAX_RETRIES:
+                print(f"Error for {symbol}-{timeframe}: {e}. Giving up after {MAX_RETRIES} retries.")
+                return None
+            delay = BACKOFF_BASE * 2 ** attempt + random.uniform(0, BACKOFF_BASE)
+            print(f"Retry {attempt + 1}/{MAX_RETRIES} for {symbol}-{timeframe} in {delay:.1f}s: {e}")
+            await asyncio.sleep(delay)
+        except Exception as e:
+            print(f"Error for {symbol}-{timeframe}: {e}. Skipping this symbol/timeframe.")
+            return None
+
+async def fetch_missing_bars_async(exchange, limiter, symbol, timeframe, since=None, until=None):
+    all_data = []
+    seen_timestamps = set()
+    while True:
+        ohlcv = await fetch_page_with_retry(exchange, limiter, symbol, timeframe, since)
+        if ohlcv is None:
+            return None
+        if not ohlcv:
+            break
+        ohlcv = [row for row in ohlcv if row[0] not in seen_timestamps]
+        if not ohlcv:
+            break
+        all_data.extend(ohlcv)
+        seen_timestamps.update(row[0] for row in ohlcv)
+        if ohlcv[-1][0] is not None:
+            since = ohlcv[-1][0] + 1
+        else:
+            break
+        if len(ohlcv) < LIMIT or (until is not None and ohlcv[-1][0] >= until):
+            break
+    if until is not None:
+        all_data = [row for row in all_data if row[0] <= until]
+    return bars_to_frame(all_data, symbol, timeframe)
+
+class ReplayExchange:
+    """Local stand-in for an async ccxt exchange that serves recorded OHLCV pages.
+
+    The recording is JSON of the form {symbol: {timeframe: [[ts, o, h, l, c, v], ...]}}
+    and is paged exactly like `fetch_ohlcv(since=, limit=)` on the real client,
+    with an optional artificial latency per request.
+    """
+
+    def __init__(self, recording_path, latency=0.0, rate_limit=100):
+        with open(recording_path, "r") as f:
+            self.recording = json.load(f)
+        self.latency = latency
+        self.rateLimit = rate_limit
+        self.requests = 0
+
+    async def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if symbol not in self.recording:
+            raise ccxt.BadSymbol(f"replay has no data for {symbol}")
+        rows = self.recording[symbol].get(timeframe, [])
+        if since is not None:
+            rows = [row for row in rows if row[0] >= since]
+        return rows[:limit] if limit else rows
+
+    async def close(self):
+        pass
+
+# --- Local storage ---
+
+def plan_ranges(symbol, timeframe):
+    """Missing (since_ms, until_ms) ranges from the coverage manifest; tail first, then interior gaps."""
+    ohlcv_store.migrate_legacy(symbol, timeframe, root=OUTPUT_DIR)
+    ranges = ohlcv_store.plan_missing_ranges(symbol, timeframe, root=OUTPUT_DIR)
+    if ranges == [(None, None)]:
+        print(f"No local data found for {symbol} - {timeframe}, downloading full history...")
+        return ranges
+    ranges = sorted(ranges, key=lambda r: r[1] is not None)
+    gaps = sum(1 for _, until in ranges if until is not None)
+    if ranges and ranges[0][1] is None:
+        print(f"Latest timestamp: {pd.Timestamp(ranges[0][0] - 1, unit='ms', tz='UTC')} | Fetching newer bars...")
+    if gaps:
+        print(f"Repairing {gaps} gap(s) for {symbol} - {timeframe}")
+    return ranges
+
+def save_bars(df_new, symbol, timeframe, since=None, until=None):
+    """Append only the new bars, then compact the partitions that have accumulated enough deltas."""
+    if df_new is None:
+        print(f"Fetch failed for {symbol} - {timeframe}, will retry next run")
+        return
+    if until is not None:
+        # Whatever the exchange could not return for an interior gap will not show up later either
+        ohlcv_store.mark_unavailable(symbol, timeframe, since, until, root=OUTPUT_DIR)
+    if not df_new.empty:
+        # The exchange also returns the still-forming bar; stored, it would never be refetched
+        df_new = df_new[ohlcv_store.series_to_ms(df_new['timestamp']) <= ohlcv_store.latest_closed_bar_ms(timeframe)]
+    if df_new.empty:
+        print(f"No new bars to add for {symbol} - {timeframe}")
+        return
+    written = ohlcv_store.append_bars(df_new, symbol, timeframe, root=OUTPUT_DIR)
+    ohlcv_store.compact(symbol, timeframe, root=OUTPUT_DIR)
+    print(f"Appended {written} new bars for {symbol} - {timeframe}")
+
+def update_symbol(exchange, symbol, timeframe):
+    print(f"\nProcessing {symbol} - {timeframe}")
+    for since, until in plan_ranges(symbol, timeframe):
+        df_new = fetch_missing_bars(exchange, symbol, timeframe, since=since, until=until)
+        save_bars(df_new, symbol, timeframe, since=since, until=until)
+
+async def update_symbol_async(exchange, limiter, semaphore, symbol, timeframe):
+    async with semaphore:
+        started = time.perf_counter()
+        new_bars = 0
+        for since, until in await asyncio.to_thread(plan_ranges, symbol, timeframe):
+            df_new = await fetch_missing_bars_async(exchange, limiter, symbol, timeframe, since=since, until=until)
+            await asyncio.to_thread(save_bars, df_new, symbol, timeframe, since, until)
+            new_bars += 0 if df_new is None else len(df_new)
+        return symbol, timeframe, new_bars, time.perf_counter() - started
+
+async def update_all_async(exchange, symbols, timeframes, concurrency=CONCURRENCY, rate=None):
+    """Refresh every symbol/timeframe pair concurrently under one shared rate limiter."""
+    rate = rate or 1000 / exchange.rateLimit
+    limiter = TokenBucket(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+    jobs = [
+        update_symbol_async(exchange, limiter, semaphore, symbol, timeframe)
+        for timeframe in timeframes for symbol in symbols
+    ]
+    results = await asyncio.gather(*jobs, return_exceptions=True)
+    failures = [r for r in results if isinstance(r, Exception)]
+    new_bars = sum(r[2] for r in results if not isinstance(r, Exception))
+    print(f"\n[DONE] {len(jobs) - len(failures)}/{len(jobs)} symbol/timeframe jobs, "
+          f"{new_bars} new bars in {time.perf_counter() - started:.1f}s "
+          f"(concurrency={concurrency}, rate={rate:.1f} req/s)")
+    for failure in failures:
+        print(f"[ERROR] {failure!r}")
+    return results
+
+async def run_async(symbols, timeframes, concurrency, replay=None):
+    if replay:
+        exchange = ReplayExchange(replay)
+    else:
+        # Our TokenBucket does the throttling, so ccxt's own serial throttler is disabled.
+        exchange = ccxt_async.okx({'enableRateLimit': False})
+    try:
+        await update_all_async(exchange, symbols, timeframes, concurrency=concurrency)
+    finally:
+        await exchange.close()
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: [timeframe]")
-        sys.exit(1)
-    timeframe = sys.argv[1]
+    parser = argparse.ArgumentParser(description="Fetch OHLCV bars into the local Parquet lake.")
+    parser.add_argument("timeframes", nargs="+", help="One or more timeframes, e.g. 30m 1h")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Fetch all symbols concurrently")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--replay", help="Serve recorded OHLCV pages from this JSON file instead of OKX (async mode)")
+    parser.add_argument("--compact", action="store_true", help="Only compact every symbol's partitions, no fetching")
+    parser.add_argument("--rebuild-manifest", action="store_true", help="Rebuild the coverage manifest from stored bars first")
+    parser.add_argument("--derive", default="",
+                        help="Comma-separated higher timeframes to build locally from the first timeframe, e.g. 1h,4h,12h,1d")
+    args = parser.parse_args()
 
     if not os.path.exists(SYMBOLS_FILE):
         print(f"Symbol file not found: {SYMBOLS_FILE}")
@@ -53,44 +258,29 @@ def main():
         symbols = [line.strip() for line in f if line.strip()]
 
     os.makedirs(OUTPUT_DIR, exist_ok=True)
-    exchange = ccxt.okx({'enableRateLimit': True})
-
-    for symbol in symbols:
-        print(f"\nProcessing {symbol} - {timeframe}")
-        symbol_dir = os.path.join(OUTPUT_DIR, symbol.replace('/', ''))
-        os.makedirs(symbol_dir, exist_ok=True)
-        outfile = os.path.join(symbol_dir, f"{timeframe}.parquet")
-
-        # Load existing data if available
-        if os.path.exists(outfile):
-            df_existing = pd.read_parquet(outfile)
-            if not df_existing.empty:
-                last_ts = df_existing['timestamp'].max()
-                since = int(last_ts.value // 10**6) + 1  # ms since epoch
-                print(f"Latest timestamp: {last_ts} | Fetching newer bars...")
-                df_new = fetch_missing_bars(exchange, symbol, timeframe, since=since)
-                if not df_new.empty:
-                    combined = pd.concat([df_existing, df_new]).drop_duplicates(subset='timestamp').sort_values('timestamp').reset_index(drop=True)
-                    combined.to_parquet(outfile, index=False)
-                    print(f"Updated {symbol} - {timeframe} with {len(df_new)} new bars (Total: {len(combined)})")
-                else:
-                    print(f"No new bars to add for {symbol} - {timeframe}")
-            else:
-                print(f"Existing file is empty, downloading full history...")
-                df_full = fetch_missing_bars(exchange, symbol, timeframe)
-                if not df_full.empty:
-                    df_full.to_parquet(outfile, index=False)
-                    print(f"Saved {symbol} - {timeframe} ({len(df_full)} bars)")
-                else:
-                    print(f"No data found for {symbol} - {timeframe}")
-        else:
-            print(f"No local data found for {symbol} - {timeframe}, downloading full history...")
-            df_full = fetch_missing_bars(exchange, symbol, timeframe)
-            if not df_full.empty:
-                df_full.to_parquet(outfile, index=False)
-                print(f"Saved {symbol} - {timeframe} ({len(df_full)} bars)")
-            else:
-                print(f"No data found for {symbol} - {timeframe}")
+
+    if args.rebuild_manifest:
+        manifest = ohlcv_store.rebuild_manifest(root=OUTPUT_DIR)
+        print(f"Rebuilt coverage manifest for {len(manifest)} symbols")
+
+    if args.compact:
+        for timeframe in args.timeframes:
+            for symbol in symbols:
+                n = ohlcv_store.compact(symbol, timeframe, root=OUTPUT_DIR, min_files=2)
+                print(f"Compacted {n} month(s) for {symbol} - {timeframe}")
+        return
+
+    if args.use_async or args.replay:
+        asyncio.run(run_async(symbols, args.timeframes, args.concurrency, replay=args.replay))
+    else:
+        exchange = ccxt.okx({'enableRateLimit': True})
+        for timeframe in args.timeframes:
+            for symbol in symbols:
+                update_symbol(exchange, symbol, timeframe)
+
+    derived = [tf for tf in args.derive.split(",") if tf]
+    if derived:
+        resample_ohlcv.derive_all(symbols, derived, base_timeframe=args.timeframes[0], root=OUTPUT_DIR)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,191 @@
+"""
+Resident inference service: keeps main and per-symbol models in memory and
+scores batches of feature rows over HTTP on localhost.
+
+    POST /predict  {"timeframe": "30m", "columns": [...], "data": [[...], ...],
+                    "symbols": [...], "per_symbol": true}
+             ->    {"proba_up": [...], "pred_up": [...], "model": ["main" | "per_symbol", ...]}
+    GET  /health   loaded models, cache hit/miss counts, registry reloads
+    POST /reload   re-read the model registry now
+
+Rows are sent column-wise and turned into one float32 array, and each model
+scores its rows with Booster.inplace_predict (no DMatrix or DataFrame per
+request). With per_symbol, rows of symbols that have a registered model are
+scored by that model, grouped per symbol, and the rest by the main model.
+
+Artifacts come from the model registry (model_registry.py), whose cache is
+keyed by content hash: a background thread polls models/registry.json and
+preloads the new main models as soon as train_timeframe_model.py registers
+them, so a retrain is picked up without restarting the service.
+"""
+
+import argparse
+import json
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+import model_registry
+
+HOST = "127.0.0.1"
+PORT = 8765
+RELOAD_INTERVAL = 5.0  # seconds between registry polls
+
+class InferenceService:
+    def __init__(self, timeframes, registry=None):
+        self.timeframes = list(timeframes)
+        self.registry = registry or model_registry.ModelRegistry()
+        self.reloads = 0
+        self.requests = 0
+        self.rows = 0
+        self._stats_lock = threading.Lock()  # handlers run on ThreadingHTTPServer threads
+
+    def warm(self, per_symbol=True):
+        """Load main (and optionally per-symbol) models so the first request does not pay for unpickling."""
+        for timeframe in self.timeframes:
+            self.registry.get_booster(timeframe)
+            if per_symbol:
+                for symbol in self.registry.symbols(timeframe)[:self.registry.capacity]:
+                    self.registry.get_booster(timeframe, symbol)
+
+    def poll(self, interval=RELOAD_INTERVAL, per_symbol=True):
+        while True:
+            time.sleep(interval)
+            if self.registry.reload():
+                self.reloads += 1
+                self.warm(per_symbol)
+                print(f"[RELOAD] Registry changed, models reloaded ({self.registry.cache_info()})")
+
+    def score(self, model, X, column_index, rows):
+        artifact, booster = model
+        features = [column_index[f] for f in artifact['features']]
+        return booster.inplace_predict(X[np.ix_(rows, features)])
+
+    def predict(self, timeframe, columns, data, symbols=None, per_symbol=False):
+        X = np.asarray(data, dtype=np.float32).reshape(len(data), len(columns))
+        column_index = {c: i for i, c in enumerate(columns)}
+        proba = np.empty(len(X))
+        source = np.full(len(X), 'main', dtype=object)
+        remaining = np.ones(len(X), dtype=bool)
+
+        if per_symbol and symbols is not None:
+            codes, uniques = pd.factorize(np.asarray(symbols, dtype=object))
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+            for k, symbol in enumerate(uniques):
+                model = self.registry.get_booster(timeframe, symbol)
+                if model is None:
+                    continue
+                rows = order[bounds[k]:bounds[k + 1]]
+                proba[rows] = self.score(model, X, column_index, rows)
+                source[rows] = 'per_symbol'
+                remaining[rows] = False
+
+        if remaining.any():
+            model = self.registry.get_booster(timeframe)
+            if model is None:
+                raise KeyError(f"No main model registered for {timeframe}")
+            rows = np.flatnonzero(remaining)
+            proba[rows] = self.score(model, X, column_index, rows)
+
+        with self._stats_lock:
+            self.requests += 1
+            self.rows += len(X)
+        return {'proba_up': proba.tolist(), 'pred_up': (proba > 0.5).astype(int).tolist(), 'model': source.tolist()}
+
+    def stats(self):
+        with self._stats_lock:
+            return {'requests': self.requests, 'rows': self.rows}
+
+    def health(self):
+        return {
+            'timeframes': self.timeframes,
+            'registered': len(self.registry.entries()),
+            'cache': self.registry.cache_info(),
+            'reloads': self.reloads,
+            **self.stats()
+        }
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def respond(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self.respond(200, service.health())
+            else:
+                self.respond(404, {'error': f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if self.path == "/predict":
+                    started = time.perf_counter()
+                    body = service.predict(request['timeframe'], request['columns'], request['data'],
+                                           request.get('symbols'), request.get('per_symbol', False))
+                    body['seconds'] = time.perf_counter() - started
+                    self.respond(200, body)
+                elif self.path == "/reload":
+                    changed = service.registry.reload()
+                    service.warm()
+                    self.respond(200, {'changed': changed, **service.health()})
+                else:
+                    self.respond(404, {'error': f"Unknown path {self.path}"})
+            except (KeyError, ValueError, TypeError) as e:
+                self.respond(400, {'error': f"{type(e).__name__}: {e}"})
+            except Exception as e:
+                # e.g. an unreadable artifact or a booster error: still answer with JSON, not a dropped connection
+                self.respond(500, {'error': f"{type(e).__name__}: {e}"})
+
+        def log_message(self, format, *args):
+            pass  # one line per request would dominate the cost of small batches
+
+    return Handler
+
+def predict_remote(df, timeframe, features, per_symbol=False, host=HOST, port=PORT, timeout=30):
+    """Client helper: score a features frame through a running service, returns proba_up as an array."""
+    request = {
+        'timeframe': timeframe,
+        'columns': list(features),
+        'data': df[list(features)].to_numpy(dtype='float64').tolist(),
+        'symbols': df['symbol'].astype(str).tolist() if 'symbol' in df.columns else None,
+        'per_symbol': per_symbol
+    }
+    req = urllib.request.Request(f"http://{host}:{port}/predict", data=json.dumps(request).encode(),
+                                 headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        return np.asarray(json.loads(response.read())['proba_up'])
+
+def serve(timeframes, host=HOST, port=PORT, per_symbol=True, reload_interval=RELOAD_INTERVAL):
+    service = InferenceService(timeframes)
+    started = time.perf_counter()
+    service.warm(per_symbol)
+    print(f"[INFO] Warmed {service.registry.cache_info()['cached']} models in {time.perf_counter() - started:.1f}s")
+    threading.Thread(target=service.poll, args=(reload_interval, per_symbol), daemon=True).start()
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    print(f"[INFO] Serving {', '.join(timeframes)} on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep models in memory and serve predictions on localhost.")
+    parser.add_argument("timeframes", nargs="+")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--main-only", action="store_true", help="Do not preload per-symbol models")
+    parser.add_argument("--reload-interval", type=float, default=RELOAD_INTERVAL)
+    args = parser.parse_args()
+    serve(args.timeframes, args.host, args.port, per_symbol=not args.main_only, reload_interval=args.reload_interval)
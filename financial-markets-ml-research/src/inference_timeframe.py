@@ -1,17 +1,260 @@
 """
 Runs model inference on new data to generate signals/labels.
+
+The main model for a timeframe is loaded once (through the model registry)
+and scores every row of ohlcv_parquet/<tf>_features.parquet in a single
+predict_proba call; --latest scores only each symbol's newest bar for the
+live cycle, and --live scores the newest-bar rows streaming_indicators.py
+wrote to <tf>_live_features.parquet. Only the columns the model uses are read, and predictions go to
+a small sidecar, ohlcv_parquet/<tf>_predictions.parquet (symbol, timestamp,
+pred_up, proba_up), so the features file is never rewritten. --latest and
+--live runs only add a small delta part under <tf>_predictions_delta/, which
+is folded into the sidecar every PREDICTION_DELTA_LIMIT runs.
+load_features_with_predictions() joins the two for the backtester and the
+trade ideas logger. Each run appends its rows/second to
+inference_logs/inference_throughput.csv.
 """
 
-# import joblib
+import argparse
+import os
+import time
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import joblib
+import ensemble
+import model_registry
+
+FEATURES_DIR = 'ohlcv_parquet'
+MODEL_DIR = model_registry.MODEL_DIR
+INFERENCE_LOG_DIR = 'inference_logs'
+THROUGHPUT_LOG = os.path.join(INFERENCE_LOG_DIR, 'inference_throughput.csv')
+PREDICTION_COLUMNS = ['pred_up', 'proba_up', 'proba_main', 'proba_symbol']
+PREDICTION_DELTA_LIMIT = 48  # delta parts (one per --latest/--live run) before they are folded into the sidecar
+
+def predictions_path(timeframe, features_dir=FEATURES_DIR):
+    return os.path.join(features_dir, f"{timeframe}_predictions.parquet")
+
+def prediction_delta_dir(timeframe, features_dir=FEATURES_DIR):
+    return os.path.join(features_dir, f"{timeframe}_predictions_delta")
+
+def prediction_deltas(timeframe, features_dir=FEATURES_DIR):
+    """Delta part files of the sidecar, oldest write first."""
+    delta_dir = prediction_delta_dir(timeframe, features_dir)
+    if not os.path.isdir(delta_dir):
+        return []
+    parts = sorted(f for f in os.listdir(delta_dir) if f.endswith(".parquet") and not f.startswith("."))
+    return [os.path.join(delta_dir, f) for f in parts]
+
+def read_prediction_deltas(timeframe, features_dir=FEATURES_DIR):
+    """Rows of all delta parts, the newest prediction per symbol/timestamp (empty frame when there are none)."""
+    frames = [pd.read_parquet(f) for f in prediction_deltas(timeframe, features_dir)]
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=['symbol', 'timestamp', 'pred_up', 'proba_up'])
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    return df.drop_duplicates(subset=['symbol', 'timestamp'], keep='last').reset_index(drop=True)
+
+def read_predictions(timeframe, features_dir=FEATURES_DIR):
+    """The sidecar with its delta parts applied on top."""
+    path = predictions_path(timeframe, features_dir)
+    base = pd.read_parquet(path) if os.path.exists(path) else pd.DataFrame()
+    deltas = read_prediction_deltas(timeframe, features_dir)
+    if deltas.empty:
+        return base
+    df = pd.concat([base, deltas], ignore_index=True) if not base.empty else deltas
+    return df.drop_duplicates(subset=['symbol', 'timestamp'], keep='last').reset_index(drop=True)
+
+def load_main_model(timeframe, registry=None):
+    """Main model artifact from the registry, or straight from its file if it is not registered."""
+    artifact = (registry or model_registry.ModelRegistry(MODEL_DIR)).get(timeframe)
+    if artifact is None:
+        path = model_registry.model_path(timeframe, model_dir=MODEL_DIR)
+        artifact = joblib.load(path) if os.path.exists(path) else None
+    return artifact
+
+def symbol_row_groups(parquet_file):
+    """{symbol: row group} when every row group holds exactly one symbol, each in its own row group
+    (from the column statistics), else None."""
+    names = parquet_file.schema.names
+    if 'symbol' not in names:
+        return None
+    column = names.index('symbol')
+    groups = {}
+    for i in range(parquet_file.num_row_groups):
+        stats = parquet_file.metadata.row_group(i).column(column).statistics
+        if stats is None or not stats.has_min_max or stats.min != stats.max or stats.min in groups:
+            return None
+        groups[stats.min] = i
+    return groups
+
+def latest_rows(features_path, columns):
+    """Each symbol's newest row.
+
+    The aggregate holds one time-sorted row group per symbol (aggregate_features_by_timeframe.py), so
+    row groups are read one at a time and only their last row is kept. Other layouts locate the newest
+    rows from the symbol/timestamp columns first.
+    """
+    parquet_file = pq.ParquetFile(features_path)
+    if symbol_row_groups(parquet_file) is not None:
+        tails = []
+        for i in range(parquet_file.num_row_groups):
+            table = parquet_file.read_row_group(i, columns=columns)
+            if table.num_rows:
+                tails.append(table.slice(table.num_rows - 1))
+        table = pa.concat_tables(tails) if tails else parquet_file.schema_arrow.empty_table().select(columns)
+        return table.to_pandas()
+    keys = parquet_file.read(columns=['symbol', 'timestamp']).to_pandas()
+    last = keys.reset_index().sort_values('timestamp', kind='stable').groupby('symbol', observed=True)['index'].last()
+    return parquet_file.read(columns=columns).take(np.sort(last.to_numpy())).to_pandas()
+
+def predict_frame(artifact, df):
+    """Vectorized scoring of every row in df: returns (pred_up, proba_up) arrays."""
+    proba = artifact['model'].predict_proba(df[artifact['features']])[:, 1]
+    return (proba > 0.5).astype('int8'), proba
+
+def write_sidecar(predictions, path):
+    """Write predictions sorted by symbol and time, one row group per symbol, like the aggregate, so readers
+    can fetch one symbol's predictions (symbol_row_groups())."""
+    predictions = predictions.sort_values(['symbol', 'timestamp']).reset_index(drop=True)
+    table = pa.Table.from_pandas(predictions, preserve_index=False)
+    bounds = np.flatnonzero(predictions['symbol'].to_numpy()[1:] != predictions['symbol'].to_numpy()[:-1]) + 1
+    tmp_path = path + ".tmp"
+    with pq.ParquetWriter(tmp_path, table.schema) as writer:
+        for lo, hi in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [len(predictions)]))):
+            if hi > lo:
+                writer.write_table(table.slice(lo, hi - lo), row_group_size=hi - lo)
+    os.replace(tmp_path, path)
+
+def compact_predictions(timeframe, features_dir=FEATURES_DIR):
+    """Fold the delta parts into the sidecar. Returns True when there was anything to fold."""
+    deltas = prediction_deltas(timeframe, features_dir)
+    if not deltas:
+        return False
+    write_sidecar(read_predictions(timeframe, features_dir), predictions_path(timeframe, features_dir))
+    # The new sidecar is visible before the parts go away; parts left by a crash only repeat its rows
+    for f in deltas:
+        os.remove(f)
+    return True
+
+def write_predictions(predictions, timeframe, upsert=False, features_dir=FEATURES_DIR):
+    """Replace the sidecar, or with `upsert` add the rows as a delta part without touching the sidecar.
+
+    Deltas are folded in once PREDICTION_DELTA_LIMIT of them have accumulated (or when there is no
+    sidecar yet), so a --latest/--live cycle writes only its own rows.
+    """
+    path = predictions_path(timeframe, features_dir)
+    if upsert:
+        delta_dir = prediction_delta_dir(timeframe, features_dir)
+        os.makedirs(delta_dir, exist_ok=True)
+        name = f"delta-{time.time_ns()}.parquet"
+        predictions.to_parquet(os.path.join(delta_dir, "." + name), index=False)
+        os.replace(os.path.join(delta_dir, "." + name), os.path.join(delta_dir, name))
+        if not os.path.exists(path) or len(prediction_deltas(timeframe, features_dir)) >= PREDICTION_DELTA_LIMIT:
+            compact_predictions(timeframe, features_dir)
+        return path
+    # A full run rescores every row, so older deltas must not override it
+    for f in prediction_deltas(timeframe, features_dir):
+        os.remove(f)
+    write_sidecar(predictions, path)
+    return path
+
+def log_throughput(timeframe, mode, rows, seconds, artifact_sha=None):
+    os.makedirs(INFERENCE_LOG_DIR, exist_ok=True)
+    record = pd.DataFrame([{
+        'run_at': pd.Timestamp.now(tz='UTC').isoformat(),
+        'timeframe': timeframe,
+        'mode': mode,
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_sec': rows / seconds if seconds > 0 else np.nan,
+        'model_sha256': artifact_sha
+    }])
+    record.to_csv(THROUGHPUT_LOG, mode='a', index=False, header=not os.path.exists(THROUGHPUT_LOG))
+
+def features_file(timeframe, live=False, features_dir=FEATURES_DIR):
+    """The aggregated features file, or with `live` the streaming engine's newest-bar rows."""
+    if live:
+        import streaming_indicators  # only the live path needs the feature engineering modules
+        return streaming_indicators.live_features_path(timeframe)
+    return os.path.join(features_dir, f"{timeframe}_features.parquet")
+
+def run_inference(timeframe, latest=False, use_ensemble=False, features_dir=FEATURES_DIR, live=False):
+    """Score the timeframe's features with its main model (or the main + per-symbol ensemble,
+    see ensemble.py) and write the predictions sidecar."""
+    features_path = features_file(timeframe, live, features_dir)
+    if not os.path.exists(features_path):
+        print(f"Features file not found: {features_path}")
+        return None
+    registry = model_registry.ModelRegistry(MODEL_DIR)
+    artifact = load_main_model(timeframe, registry)
+    if artifact is None:
+        print(f"No main model for {timeframe} in {MODEL_DIR}")
+        return None
+
+    started = time.perf_counter()
+    features = artifact['features'] + (ensemble.required_columns(timeframe, registry) if use_ensemble else [])
+    columns = list(dict.fromkeys(['symbol', 'timestamp'] + [c for c in features if c not in ('symbol', 'timestamp')]))
+    missing = [c for c in columns if c not in pq.read_schema(features_path).names]
+    if missing:
+        print(f"Model columns missing from {features_path}: {missing}")
+        return None
+    df = latest_rows(features_path, columns) if latest and not live else pd.read_parquet(features_path, columns=columns)
+    load_seconds = time.perf_counter() - started
+    if use_ensemble:
+        proba_up, proba_main, proba_symbol = ensemble.score_ensemble(df, timeframe, registry, main_artifact=artifact)
+        pred_up = (proba_up > 0.5).astype('int8')
+    else:
+        pred_up, proba_up = predict_frame(artifact, df)
+    predict_seconds = time.perf_counter() - started - load_seconds
+
+    predictions = pd.DataFrame({
+        'symbol': df['symbol'].astype(str).to_numpy(),
+        'timestamp': df['timestamp'].to_numpy(),
+        'pred_up': pred_up,
+        'proba_up': proba_up
+    })
+    if use_ensemble:
+        predictions['proba_main'] = proba_main
+        predictions['proba_symbol'] = proba_symbol
+    path = write_predictions(predictions, timeframe, upsert=latest or live, features_dir=features_dir)
+    seconds = time.perf_counter() - started
+    entry = registry.entry(timeframe)
+    mode = ('live' if live else 'latest' if latest else 'full') + ('_ensemble' if use_ensemble else '')
+    log_throughput(timeframe, mode, len(df), seconds, entry['sha256'] if entry else None)
+    print(f"[DONE] {len(df)} rows scored in {seconds:.2f}s ({len(df) / max(seconds, 1e-9):,.0f} rows/s; "
+          f"load {load_seconds:.2f}s, predict {predict_seconds:.2f}s) -> {path}")
+    return predictions
+
+def load_features_with_predictions(timeframe, columns=None, features_dir=FEATURES_DIR, live=False):
+    """Features frame with pred_up/proba_up joined from the predictions sidecar (left join on symbol, timestamp);
+    with `live`, the streaming engine's newest-bar rows instead of the aggregated features.
 
-def run_inference(X):
-    # model = joblib.load('model_30m.pkl')
-    # preds = model.predict(X)
-    # return preds
-    pass
+    Falls back to prediction columns stored in the features file itself, as older pipelines wrote them.
+    """
+    features_path = features_file(timeframe, live, features_dir)
+    path = predictions_path(timeframe, features_dir)
+    if columns is not None:
+        columns = list(dict.fromkeys(['symbol', 'timestamp'] + [c for c in columns if c not in PREDICTION_COLUMNS]))
+    if not os.path.exists(path):
+        if columns is not None:
+            names = pq.read_schema(features_path).names
+            columns = [c for c in columns + PREDICTION_COLUMNS if c in names]
+        return pd.read_parquet(features_path, columns=columns)
+    df = pd.read_parquet(features_path, columns=columns)
+    df = df.drop(columns=[c for c in PREDICTION_COLUMNS if c in df.columns])
+    df['symbol'] = df['symbol'].astype(str)
+    predictions = read_predictions(timeframe, features_dir)
+    return df.merge(predictions, on=['symbol', 'timestamp'], how='left')
 
 if __name__ == "__main__":
-    # X_new = pd.read_csv('X_new_30m.csv')
-    # predictions = run_inference(X_new)
-    pass
+    parser = argparse.ArgumentParser(description="Score a timeframe's features with its main model.")
+    parser.add_argument("timeframe")
+    parser.add_argument("--latest", action="store_true", help="Only score each symbol's newest bar (live cycle)")
+    parser.add_argument("--ensemble", action="store_true",
+                        help="Blend main and per-symbol models with validation-derived weights")
+    parser.add_argument("--live", action="store_true",
+                        help="Score the newest-bar rows written by streaming_indicators.py")
+    args = parser.parse_args()
+    run_inference(args.timeframe, latest=args.latest, use_ensemble=args.ensemble, live=args.live)
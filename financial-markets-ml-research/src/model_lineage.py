@@ -0,0 +1,81 @@
+"""
+Model artifact lineage and drift checks for incremental retraining.
+
+Artifacts saved by train_timeframe_model.py keep the original
+{'model', 'features'} keys and add:
+- trained_until: timestamp of the last row the model has been fitted on
+- reference: per-feature quantile histograms of the training rows
+- lineage: one entry per full fit, drift refit or warm start
+
+Drift is the population stability index (PSI) of newly arrived rows against
+the reference histograms; warm starts keep the reference of the last full fit
+so drift accumulates until a refit resets it.
+"""
+
+import numpy as np
+import pandas as pd
+
+PSI_BINS = 10
+PSI_FLOOR = 1e-4  # empty bins would make PSI infinite
+
+def finite_values(series):
+    values = series.to_numpy(dtype='float64')
+    return values[np.isfinite(values)]
+
+def bin_proportions(values, edges):
+    counts = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+    return counts / len(values)
+
+def reference_histograms(X, bins=PSI_BINS):
+    """Quantile bin edges and proportions for every column of X."""
+    reference = {}
+    for col in X.columns:
+        values = finite_values(X[col])
+        if len(values) == 0:
+            continue
+        edges = np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1]))
+        reference[col] = {'edges': edges.tolist(), 'proportions': bin_proportions(values, edges).tolist()}
+    return reference
+
+def population_stability(reference, X):
+    """PSI per feature of X against the reference histograms (features absent from either are skipped)."""
+    psi = {}
+    for col, hist in reference.items():
+        if col not in X.columns:
+            continue
+        values = finite_values(X[col])
+        if len(values) == 0:
+            continue
+        actual = np.clip(bin_proportions(values, np.asarray(hist['edges'])), PSI_FLOOR, None)
+        expected = np.clip(np.asarray(hist['proportions']), PSI_FLOOR, None)
+        psi[col] = float(np.sum((actual - expected) * np.log(actual / expected)))
+    return pd.Series(psi, dtype='float64')
+
+def lineage_entry(mode, model, rows, trained_until, features_file, **extra):
+    return {
+        'mode': mode,
+        'trained_at': pd.Timestamp.now(tz='UTC').isoformat(),
+        'trained_until': str(trained_until),
+        'rows': int(rows),
+        'n_trees': int(model.get_booster().num_boosted_rounds()),
+        'features_file': features_file,
+        **extra
+    }
+
+def make_artifact(model, features, trained_until, reference, lineage):
+    return {
+        'model': model,
+        'features': features,
+        'trained_until': trained_until,
+        'reference': reference,
+        'lineage': lineage
+    }
+
+def warm_starts_since_fit(lineage):
+    """Consecutive warm starts at the end of the lineage."""
+    count = 0
+    for entry in reversed(lineage or []):
+        if entry['mode'] != 'warm_start':
+            break
+        count += 1
+    return count
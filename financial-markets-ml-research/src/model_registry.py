@@ -0,0 +1,250 @@
+"""
+Model registry: one manifest for every trained artifact plus a lazy LRU cache.
+
+models/registry.json maps "<tf>/<SYMBOLKEY>" ("<tf>/__main__" for the main
+model) to the artifact's file, feature list, training window, validation
+metrics and content hash. train_timeframe_model.py registers each artifact
+as it is written; rebuild_registry() re-indexes a models/ directory from the
+files alone.
+
+ModelRegistry.get() unpickles an artifact on first use and keeps up to
+`capacity` of them in memory, evicting the least recently used. Cache keys
+include the content hash, so an artifact rewritten by a retrain is loaded
+afresh on its next use; the manifest itself is re-read only when its mtime
+changes, and cached artifacts whose hash it no longer lists are dropped then.
+ModelRegistry.get_booster() also keeps a CPU booster next to the cached
+artifact, so the artifact dict itself is never modified.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+import joblib
+import pandas as pd
+from filelock import FileLock
+import ohlcv_store
+
+MODEL_DIR = "models"
+REGISTRY_NAME = "registry.json"
+MAIN = "__main__"
+CACHE_CAPACITY = 256
+MODEL_FILE_PATTERN = re.compile(r"^(?P<timeframe>[^_]+)_(?:(?P<symbol>.+)_)?model_xgboost\.joblib$")
+
+def model_path(timeframe, symbol=None, model_dir=MODEL_DIR):
+    """Artifact path; symbols are stored under their slash-free key (BTC/USDT -> BTCUSDT)."""
+    if symbol is None:
+        return os.path.join(model_dir, f"{timeframe}_model_xgboost.joblib")
+    return os.path.join(model_dir, f"{timeframe}_{ohlcv_store.symbol_key(symbol)}_model_xgboost.joblib")
+
+def entry_key(timeframe, symbol=None):
+    """Symbols are keyed like their files, so BTC/USDT and BTCUSDT find the same entry."""
+    return f"{timeframe}/{ohlcv_store.symbol_key(symbol) if symbol else MAIN}"
+
+def registry_path(model_dir=MODEL_DIR):
+    return os.path.join(model_dir, REGISTRY_NAME)
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_registry(model_dir=MODEL_DIR):
+    path = registry_path(model_dir)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+def update_registry(update, model_dir=MODEL_DIR):
+    """Apply `update(registry)` under a file lock and write the registry back atomically."""
+    os.makedirs(model_dir, exist_ok=True)
+    path = registry_path(model_dir)
+    with FileLock(path + ".lock", timeout=60):
+        registry = load_registry(model_dir)
+        update(registry)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(registry, f, default=str)
+        os.replace(tmp_path, path)
+    return registry
+
+def describe(artifact, path, timeframe, symbol=None, metrics=None):
+    """Registry entry for an artifact already written to `path`. The symbol is stored as its key
+    (BTC/USDT -> BTCUSDT), the only form rebuild_registry() can recover from a file name."""
+    stat = os.stat(path)
+    last_fit = (artifact.get('lineage') or [{}])[-1]
+    return {
+        'timeframe': timeframe,
+        'symbol': ohlcv_store.symbol_key(symbol) if symbol else None,
+        'kind': 'main' if symbol is None else 'per_symbol',
+        'file': os.path.basename(path),
+        'features': list(artifact['features']),
+        'trained_until': str(artifact['trained_until']) if 'trained_until' in artifact else None,
+        'training_window': {k: last_fit.get(k) for k in ['mode', 'trained_at', 'rows', 'n_trees']},
+        'metrics': metrics or {},
+        'sha256': file_sha256(path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns
+    }
+
+def register(artifact, timeframe, symbol=None, model_dir=MODEL_DIR):
+    """Index an artifact written to model_path(timeframe, symbol); keeps previously attached metrics."""
+    entry = describe(artifact, model_path(timeframe, symbol, model_dir), timeframe, symbol)
+
+    def update(registry):
+        entry['metrics'] = registry.get(entry_key(timeframe, symbol), {}).get('metrics', {})
+        registry[entry_key(timeframe, symbol)] = entry
+    update_registry(update, model_dir)
+    return entry
+
+def attach_metrics(timeframe, validation_df, model_dir=MODEL_DIR):
+    """Copy a model_validation_<tf> frame into the registry: per-symbol rows to their
+    model, the main model's per-symbol rows averaged onto the main entry."""
+    numeric = validation_df.select_dtypes('number').columns
+
+    def update(registry):
+        for _, row in validation_df[validation_df['model'] == 'per_symbol'].iterrows():
+            entry = registry.get(entry_key(timeframe, row['symbol']))
+            if entry is not None:
+                entry['metrics'] = {k: float(row[k]) for k in numeric}
+        main_rows = validation_df[validation_df['model'] == 'main']
+        if entry_key(timeframe) in registry and len(main_rows):
+            metrics = {f'mean_{k}': float(v) for k, v in main_rows[numeric].mean().items()}
+            registry[entry_key(timeframe)]['metrics'] = {**metrics, 'n_symbols': len(main_rows)}
+    update_registry(update, model_dir)
+
+def rebuild_registry(model_dir=MODEL_DIR):
+    """Re-index every *_model_xgboost.joblib in model_dir (symbols are recovered as file keys)."""
+    registry = {}
+    for name in sorted(os.listdir(model_dir)):
+        match = MODEL_FILE_PATTERN.match(name)
+        if not match:
+            continue
+        timeframe, symbol = match.group('timeframe'), match.group('symbol')
+        artifact = joblib.load(os.path.join(model_dir, name))
+        registry[entry_key(timeframe, symbol)] = describe(artifact, os.path.join(model_dir, name), timeframe, symbol)
+
+    def update(current):
+        for key, entry in registry.items():
+            entry['metrics'] = current.get(key, {}).get('metrics', {})
+        current.clear()
+        current.update(registry)
+    return update_registry(update, model_dir)
+
+class ModelRegistry:
+    """Lazy, LRU-cached access to registered artifacts (thread-safe)."""
+
+    def __init__(self, model_dir=MODEL_DIR, capacity=CACHE_CAPACITY):
+        self.model_dir = model_dir
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()  # (entry key, sha256) -> {'artifact': ..., 'booster': ...}
+        self._loading = {}  # (entry key, sha256) -> Event set when its load finishes
+        self._entries = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Re-read the manifest if it changed on disk. Returns True when it was reloaded."""
+        path = registry_path(self.model_dir)
+        mtime = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+        if mtime == self._mtime:
+            return False
+        self._entries = load_registry(self.model_dir)
+        self._mtime = mtime
+        # Evict artifacts whose content hash left the manifest, so a retrain does not keep both versions
+        for key in list(self._cache):
+            entry = self._entries.get(key[0])
+            if entry is None or entry['sha256'] != key[1]:
+                del self._cache[key]
+        return True
+
+    def reload(self):
+        """Thread-safe refresh(); True when the manifest changed."""
+        with self._lock:
+            return self.refresh()
+
+    def entry(self, timeframe, symbol=None):
+        with self._lock:
+            self.refresh()
+            return self._entries.get(entry_key(timeframe, symbol))
+
+    def entries(self, timeframe=None):
+        with self._lock:
+            self.refresh()
+            rows = [e for e in self._entries.values() if timeframe is None or e['timeframe'] == timeframe]
+        return pd.DataFrame(rows)
+
+    def symbols(self, timeframe):
+        with self._lock:
+            self.refresh()
+            return [e['symbol'] for e in self._entries.values()
+                    if e['timeframe'] == timeframe and e['symbol'] is not None]
+
+    def _record(self, timeframe, symbol):
+        """Cache record of a registered model, unpickled on a miss; None if it is not registered.
+
+        The load runs outside the lock so cached lookups are not held up by it, and
+        concurrent misses on the same artifact wait for a single load.
+        """
+        while True:
+            with self._lock:
+                self.refresh()
+                entry = self._entries.get(entry_key(timeframe, symbol))
+                if entry is None:
+                    return None
+                key = (entry_key(timeframe, symbol), entry['sha256'])
+                if key in self._cache:
+                    self.hits += 1
+                    self._cache.move_to_end(key)
+                    return self._cache[key]
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    self.misses += 1
+                    break
+            loading.wait()
+
+        record = None
+        try:
+            record = {'artifact': joblib.load(os.path.join(self.model_dir, entry['file'])), 'booster': None}
+        finally:
+            with self._lock:
+                del self._loading[key]
+                current = self._entries.get(key[0])
+                # A manifest reloaded during the load may already have replaced this version
+                if record is not None and current is not None and current['sha256'] == key[1]:
+                    self._cache[key] = record
+                    while len(self._cache) > self.capacity:
+                        self._cache.popitem(last=False)
+            loading.set()
+        return record
+
+    def get(self, timeframe, symbol=None):
+        """The artifact dict ({'model', 'features', ...}) or None if it is not registered."""
+        record = self._record(timeframe, symbol)
+        return None if record is None else record['artifact']
+
+    def get_booster(self, timeframe, symbol=None):
+        """(artifact, CPU booster) or None; the booster is prepared once per cached artifact."""
+        record = self._record(timeframe, symbol)
+        if record is None:
+            return None
+        if record['booster'] is None:
+            booster = record['artifact']['model'].get_booster()
+            booster.set_param({'device': 'cpu'})
+            record['booster'] = booster
+        return record['artifact'], record['booster']
+
+    def cache_info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'cached': len(self._cache), 'capacity': self.capacity}
+
+if __name__ == "__main__":
+    registry = rebuild_registry()
+    print(f"Indexed {len(registry)} artifacts into {registry_path()}")
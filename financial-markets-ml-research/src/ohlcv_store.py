@@ -0,0 +1,320 @@
+"""
+Append-only, month-partitioned OHLCV store.
+
+Layout: <root>/<SYMBOL>/<timeframe>/<YYYY-MM>/<kind>-<first_ms>-<last_ms>-<written_ns>.parquet
+
+Every update writes only its new bars as small `delta` files. Compaction
+folds a month's files into a single sorted `base` file. Readers stitch the
+partitions back together into one sorted, de-duplicated frame, with later
+writes winning over earlier ones for the same timestamp.
+
+<root>/_manifest.json records, per symbol/timeframe, the covered intervals,
+bar count and last update. It is maintained on every write, so coverage
+questions and gap planning never have to open bar data.
+"""
+
+import json
+import os
+import time
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from filelock import FileLock
+
+OUTPUT_DIR = "ohlcv_parquet"
+COMPACT_MIN_FILES = 24     # compact a month once it has this many files
+LEGACY_SUFFIX = ".parquet"  # pre-partition layout: <root>/<SYMBOL>/<tf>.parquet
+MANIFEST_NAME = "_manifest.json"
+TIMEFRAME_DELTAS = {
+    "30m": pd.Timedelta(minutes=30),
+    "1h": pd.Timedelta(hours=1),
+    "4h": pd.Timedelta(hours=4),
+    "12h": pd.Timedelta(hours=12),
+    "1d": pd.Timedelta(days=1)
+}
+
+def symbol_key(symbol):
+    return symbol.replace('/', '')
+
+def partition_root(symbol, timeframe, root=OUTPUT_DIR):
+    return os.path.join(root, symbol_key(symbol), timeframe)
+
+def legacy_path(symbol, timeframe, root=OUTPUT_DIR):
+    return os.path.join(root, symbol_key(symbol), f"{timeframe}{LEGACY_SUFFIX}")
+
+def parse_part_name(filename):
+    """Return (kind, first_ms, last_ms, written_ns) for a partition file name."""
+    kind, first_ms, last_ms, written_ns = filename[:-len(".parquet")].split("-")
+    return kind, int(first_ms), int(last_ms), int(written_ns)
+
+def list_months(symbol, timeframe, root=OUTPUT_DIR):
+    base = partition_root(symbol, timeframe, root)
+    if not os.path.isdir(base):
+        return []
+    return sorted(m for m in os.listdir(base) if os.path.isdir(os.path.join(base, m)))
+
+def list_parts(month_dir):
+    """Partition files of one month, oldest write first."""
+    parts = [f for f in os.listdir(month_dir) if f.endswith(".parquet") and not f.startswith(".")]
+    return sorted(parts, key=lambda f: parse_part_name(f)[3])
+
+def has_bars(symbol, timeframe, root=OUTPUT_DIR):
+    return bool(list_months(symbol, timeframe, root)) or os.path.exists(legacy_path(symbol, timeframe, root))
+
+def to_ms(ts):
+    return int(pd.Timestamp(ts).value // 10**6)
+
+def series_to_ms(timestamps):
+    """Epoch milliseconds for a datetime Series, whatever its unit."""
+    return ((timestamps - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(milliseconds=1)).to_numpy(dtype='int64')
+
+def write_part(df, month_dir, kind):
+    os.makedirs(month_dir, exist_ok=True)
+    name = f"{kind}-{to_ms(df['timestamp'].iloc[0])}-{to_ms(df['timestamp'].iloc[-1])}-{time.time_ns()}.parquet"
+    tmp_path = os.path.join(month_dir, "." + name)
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, os.path.join(month_dir, name))
+    return name
+
+def append_bars(df, symbol, timeframe, root=OUTPUT_DIR):
+    """Write new bars as one delta file per touched month. Returns the number of bars written."""
+    if df.empty:
+        return 0
+    df = df.drop_duplicates(subset='timestamp', keep='last').sort_values('timestamp').reset_index(drop=True)
+    base = partition_root(symbol, timeframe, root)
+    months = df['timestamp'].dt.strftime('%Y-%m')
+    for month, month_df in df.groupby(months, sort=True):
+        write_part(month_df.reset_index(drop=True), os.path.join(base, month), "delta")
+    timestamps_ms = series_to_ms(df['timestamp'])
+    update_manifest(root, lambda m: record_coverage(m, symbol, timeframe, timestamps_ms))
+    return len(df)
+
+def read_month(month_dir, columns=None):
+    frames = [pd.read_parquet(os.path.join(month_dir, f), columns=columns) for f in list_parts(month_dir)]
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    return df.drop_duplicates(subset='timestamp', keep='last')
+
+def read_bars(symbol, timeframe, root=OUTPUT_DIR, start=None, end=None, columns=None):
+    """Read a symbol/timeframe as one sorted frame, touching only the months in [start, end]."""
+    if columns is not None and 'timestamp' not in columns:
+        columns = ['timestamp'] + list(columns)
+    months = list_months(symbol, timeframe, root)
+    if not months:
+        path = legacy_path(symbol, timeframe, root)
+        if not os.path.exists(path):
+            return pd.DataFrame()
+        df = pd.read_parquet(path, columns=columns)
+    else:
+        first_month = pd.Timestamp(start).strftime('%Y-%m') if start is not None else None
+        last_month = pd.Timestamp(end).strftime('%Y-%m') if end is not None else None
+        base = partition_root(symbol, timeframe, root)
+        frames = [
+            read_month(os.path.join(base, m), columns=columns) for m in months
+            if (first_month is None or m >= first_month) and (last_month is None or m <= last_month)
+        ]
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            return pd.DataFrame()
+        df = pd.concat(frames, ignore_index=True)
+    if df.empty:
+        return df
+    if start is not None:
+        df = df[df['timestamp'] >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df['timestamp'] <= pd.Timestamp(end)]
+    return df.sort_values('timestamp').reset_index(drop=True)
+
+def last_timestamp_ms(symbol, timeframe, root=OUTPUT_DIR):
+    """Newest stored bar in ms since epoch, answered from file names alone."""
+    months = list_months(symbol, timeframe, root)
+    for month in reversed(months):
+        parts = list_parts(os.path.join(partition_root(symbol, timeframe, root), month))
+        if parts:
+            return max(parse_part_name(f)[2] for f in parts)
+    path = legacy_path(symbol, timeframe, root)
+    if os.path.exists(path):
+        df = pd.read_parquet(path, columns=['timestamp'])
+        if not df.empty:
+            return to_ms(df['timestamp'].max())
+    return None
+
+def compact_month(month_dir):
+    """Fold all files of one month into a single sorted base file."""
+    parts = list_parts(month_dir)
+    if len(parts) <= 1:
+        return False
+    df = read_month(month_dir).sort_values('timestamp').reset_index(drop=True)
+    if not df.empty:
+        write_part(df, month_dir, "base")
+    # The new base is visible before the old parts go away, so a crash here only leaves duplicates
+    # that readers already resolve.
+    for f in parts:
+        os.remove(os.path.join(month_dir, f))
+    return True
+
+def compact(symbol, timeframe, root=OUTPUT_DIR, min_files=COMPACT_MIN_FILES):
+    """Compact closed months with more than one file and any month with at least `min_files` files."""
+    months = list_months(symbol, timeframe, root)
+    base = partition_root(symbol, timeframe, root)
+    compacted = 0
+    for i, month in enumerate(months):
+        month_dir = os.path.join(base, month)
+        n_files = len(list_parts(month_dir))
+        closed = i < len(months) - 1
+        if (closed and n_files > 1) or n_files >= min_files:
+            compacted += compact_month(month_dir)
+    return compacted
+
+def migrate_legacy(symbol, timeframe, root=OUTPUT_DIR):
+    """Move a single-file <tf>.parquet into the partitioned layout (one base file per month)."""
+    path = legacy_path(symbol, timeframe, root)
+    if list_months(symbol, timeframe, root) or not os.path.exists(path):
+        return 0
+    df = pd.read_parquet(path)
+    if df.empty:
+        return 0
+    df = df.drop_duplicates(subset='timestamp', keep='last').sort_values('timestamp').reset_index(drop=True)
+    base = partition_root(symbol, timeframe, root)
+    for month, month_df in df.groupby(df['timestamp'].dt.strftime('%Y-%m'), sort=True):
+        write_part(month_df.reset_index(drop=True), os.path.join(base, month), "base")
+    timestamps_ms = series_to_ms(df['timestamp'])
+    update_manifest(root, lambda m: record_coverage(m, symbol, timeframe, timestamps_ms))
+    os.replace(path, path + ".migrated")
+    print(f"Migrated {path} into {base} ({len(df)} bars)")
+    return len(df)
+
+# --- Coverage manifest ---
+
+def timeframe_ms(timeframe):
+    return int(TIMEFRAME_DELTAS[timeframe] / pd.Timedelta(milliseconds=1))
+
+def manifest_path(root=OUTPUT_DIR):
+    return os.path.join(root, MANIFEST_NAME)
+
+def load_manifest(root=OUTPUT_DIR):
+    path = manifest_path(root)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+def update_manifest(root, update):
+    """Apply `update(manifest)` under a file lock and write the manifest back atomically."""
+    os.makedirs(root or ".", exist_ok=True)
+    path = manifest_path(root)
+    with FileLock(path + ".lock", timeout=60):
+        manifest = load_manifest(root)
+        update(manifest)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, path)
+    return manifest
+
+def manifest_entry(manifest, symbol, timeframe):
+    entry = manifest.setdefault(symbol_key(symbol), {}).setdefault(timeframe, {
+        'symbol': symbol, 'intervals': [], 'unavailable': [], 'n_bars': 0, 'updated': None
+    })
+    if '/' in symbol:
+        entry['symbol'] = symbol
+    return entry
+
+def merge_intervals(intervals, step):
+    """Union of closed [start, end] intervals on a grid of `step` ms."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + step:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def runs_from_timestamps(timestamps_ms, step):
+    """Split sorted bar timestamps into contiguous [start, end] runs."""
+    if len(timestamps_ms) == 0:
+        return []
+    ts = np.unique(np.asarray(timestamps_ms, dtype='int64'))
+    breaks = np.flatnonzero(np.diff(ts) > step)
+    starts = np.concatenate(([ts[0]], ts[breaks + 1]))
+    ends = np.concatenate((ts[breaks], [ts[-1]]))
+    return [[int(s), int(e)] for s, e in zip(starts, ends)]
+
+def record_coverage(manifest, symbol, timeframe, timestamps_ms):
+    step = timeframe_ms(timeframe)
+    entry = manifest_entry(manifest, symbol, timeframe)
+    entry['intervals'] = merge_intervals(entry['intervals'] + runs_from_timestamps(timestamps_ms, step), step)
+    entry['n_bars'] = sum((end - start) // step + 1 for start, end in entry['intervals'])
+    entry['updated'] = datetime.now(timezone.utc).isoformat()
+
+def mark_unavailable(symbol, timeframe, start_ms, end_ms, root=OUTPUT_DIR):
+    """Remember that the exchange has no bars in [start_ms, end_ms] so the planner stops asking."""
+    def update(manifest):
+        entry = manifest_entry(manifest, symbol, timeframe)
+        entry['unavailable'] = merge_intervals(entry['unavailable'] + [[int(start_ms), int(end_ms)]], timeframe_ms(timeframe))
+    update_manifest(root, update)
+
+def coverage(symbol, timeframe, root=OUTPUT_DIR, manifest=None):
+    manifest = load_manifest(root) if manifest is None else manifest
+    return manifest.get(symbol_key(symbol), {}).get(timeframe)
+
+def coverage_frame(timeframe=None, root=OUTPUT_DIR, manifest=None):
+    """One row per symbol/timeframe: n_bars, start, end, n_gaps, updated — straight from the manifest."""
+    manifest = load_manifest(root) if manifest is None else manifest
+    rows = []
+    for key, timeframes in manifest.items():
+        for tf, entry in timeframes.items():
+            if (timeframe is not None and tf != timeframe) or not entry['intervals']:
+                continue
+            rows.append({
+                'symbol': entry.get('symbol', key),
+                'timeframe': tf,
+                'n_bars': entry['n_bars'],
+                'start': pd.Timestamp(entry['intervals'][0][0], unit='ms', tz='UTC'),
+                'end': pd.Timestamp(entry['intervals'][-1][1], unit='ms', tz='UTC'),
+                'n_gaps': len(entry['intervals']) - 1,
+                'updated': entry['updated']
+            })
+    return pd.DataFrame(rows, columns=['symbol', 'timeframe', 'n_bars', 'start', 'end', 'n_gaps', 'updated'])
+
+def latest_closed_bar_ms(timeframe, now=None):
+    step = timeframe_ms(timeframe)
+    now_ms = int((now or datetime.now(timezone.utc)).timestamp() * 1000)
+    return (now_ms // step) * step - step
+
+def plan_missing_ranges(symbol, timeframe, root=OUTPUT_DIR, manifest=None, end_ms=None):
+    """Ranges still to fetch as [(since_ms, until_ms), ...].
+
+    Interior gaps between covered intervals come first, then the open-ended
+    tail after the newest bar (until_ms=None). With no coverage at all the
+    plan is a single full-history fetch [(None, None)].
+    """
+    entry = coverage(symbol, timeframe, root=root, manifest=manifest)
+    if not entry or not entry['intervals']:
+        return [(None, None)]
+    step = timeframe_ms(timeframe)
+    end_ms = latest_closed_bar_ms(timeframe) if end_ms is None else end_ms
+    known = merge_intervals(entry['intervals'] + entry.get('unavailable', []), step)
+    ranges = []
+    for (_, prev_end), (next_start, _) in zip(known, known[1:]):
+        ranges.append((prev_end + step, next_start - step))
+    if known[-1][1] < end_ms:
+        ranges.append((known[-1][1] + 1, None))
+    return ranges
+
+def rebuild_manifest(root=OUTPUT_DIR):
+    """Recreate the manifest from the stored bars (timestamps only), e.g. for a pre-manifest lake."""
+    manifest = {}
+    for key in sorted(os.listdir(root)):
+        symbol_dir = os.path.join(root, key)
+        if not os.path.isdir(symbol_dir):
+            continue
+        for tf in TIMEFRAME_DELTAS:
+            if not has_bars(key, tf, root):
+                continue
+            df = read_bars(key, tf, root=root, columns=['symbol'])
+            record_coverage(manifest, df['symbol'].iloc[0], tf, series_to_ms(df['timestamp']))
+    update_manifest(root, lambda m: (m.clear(), m.update(manifest)))
+    return manifest
@@ -1,36 +1,34 @@
+"""
+Bayesian optimization of trade parameters (take profit, stop loss, probability
+threshold) for a robust Sharpe ratio across timeframes.
+
+Each timeframe's backtest frame and trade_params.json are loaded once. The
+optimizer proposes BATCH_SIZE candidates at a time (skopt ask/tell) and the
+whole batch is scored in memory by one param_sweep.sweep_params() pass per
+timeframe, with the timeframes in parallel threads (the compiled kernels
+release the GIL), so trade_params.json is only written once, with the best
+parameters. --grid-points N additionally seeds the optimizer with an N^3
+grid scored in the same way.
+"""
+
+import argparse
+import itertools
 import json
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from skopt import gp_minimize
+import pandas as pd
+from skopt import Optimizer
 from skopt.space import Real
-from skopt.utils import use_named_args
-import os
-from backtest_by_timeframe import run_backtest_for_timeframe
-
-# ---- Import your backtest function here ----
-# If your backtest function is in another script, e.g. backtest_module.py:
-# from backtest_module import run_backtest_for_timeframe
-
-# For demonstration, I'll define a dummy run_backtest_for_timeframe:
-def run_backtest_for_timeframe(timeframe):
-    # This should run your actual backtest and write dashboard_data/summary_{timeframe}.json
-    # Here is a dummy version for demonstration
-    summary = {
-        "final_value": 105000,
-        "total_return": 0.05,
-        "max_drawdown": -0.12,
-        "sharpe": np.random.uniform(0.6, 1.4),  # Random Sharpe for demo
-        "win_rate": 0.53,
-        "avg_hold_hours": 7.4,
-        "trade_count": 33
-    }
-    os.makedirs('dashboard_data', exist_ok=True)
-    with open(f'dashboard_data/summary_{timeframe}.json', 'w') as f:
-        json.dump(summary, f)
-
-# ---------------
+import backtest_by_timeframe as bt
+import param_sweep
 
 # Timeframes to test
 TIMEFRAMES = ['30m', '1h', '4h', '12h', '1d']  # Update with your timeframes
+N_CALLS = 100          # You can increase for more thorough search
+N_INITIAL_POINTS = 10  # More random points to start
+BATCH_SIZE = 10        # Candidates scored per sweep
 
 # Space of hyperparameters
 space = [
@@ -38,6 +36,7 @@ space = [
     Real(-0.15, -0.03, name='stop_loss_pct'),
     Real(0.50, 0.75, name='proba_threshold')
 ]
+PARAM_NAMES = [dim.name for dim in space]
 
 def load_trade_params(path="trade_params.json"):
     with open(path, "r") as f:
@@ -47,41 +46,59 @@ def save_trade_params(params, path="trade_params.json"):
     with open(path, "w") as f:
         json.dump(params, f, indent=2)
 
-@use_named_args(space)
-def robust_objective(take_profit_pct, stop_loss_pct, proba_threshold):
-    # Load existing params and update the tuned ones
-    params = load_trade_params()
-    params['take_profit_pct'] = float(take_profit_pct)
-    params['stop_loss_pct'] = float(stop_loss_pct)
-    params['proba_threshold'] = float(proba_threshold)
-    save_trade_params(params)
-    sharpes = []
-    for tf in TIMEFRAMES:
-        run_backtest_for_timeframe(tf)
-        result_path = f'dashboard_data/summary_{tf}.json'
-        if os.path.exists(result_path):
-            with open(result_path, 'r') as f:
-                res = json.load(f)
-            sharpe = res.get('sharpe', np.nan)
-            if not np.isnan(sharpe):
-                sharpes.append(sharpe)
-    if not sharpes:
-        return 1e6  # Penalize if no sharpes collected (bad params)
-    # Robust metric: mean Sharpe minus std Sharpe (can customize)
-    robust_score = -(np.mean(sharpes) - np.std(sharpes))
-    print(f"Params: TP={take_profit_pct:.3f}, SL={stop_loss_pct:.3f}, PROBA={proba_threshold:.3f} -> Robust Score={-robust_score:.4f}")
-    return robust_score  # Minimize negative of robust metric
+def load_frames(timeframes=TIMEFRAMES):
+    frames = {}
+    for tf in timeframes:
+        df = bt.load_backtest_frame(tf)
+        if df is not None:
+            frames[tf] = df
+    return frames
+
+def robust_scores(frames, candidates, base_params, workers=None):
+    """Objective per candidate: -(mean - std) of the timeframes' Sharpe ratios, ignoring NaN Sharpes;
+    1e6 when a candidate has none (bad params)."""
+    param_sets = pd.DataFrame(candidates, columns=PARAM_NAMES)
+    workers = workers or min(len(frames), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        sweeps = pool.map(lambda df: param_sweep.sweep_params(df, param_sets, base_params), frames.values())
+        sharpes = np.array([sweep['sharpe'].to_numpy() for sweep in sweeps])
+    valid = ~np.isnan(sharpes)
+    n_valid = valid.sum(axis=0)
+    values = np.where(valid, sharpes, 0.0)
+    mean = values.sum(axis=0) / np.maximum(n_valid, 1)
+    std = np.sqrt((np.where(valid, sharpes - mean, 0.0) ** 2).sum(axis=0) / np.maximum(n_valid, 1))
+    return np.where(n_valid > 0, -(mean - std), 1e6)  # Minimize negative of robust metric
+
+def optimize(n_calls=N_CALLS, batch_size=BATCH_SIZE, grid_points=0, timeframes=TIMEFRAMES, base_params=None):
+    base_params = load_trade_params() if base_params is None else base_params
+    frames = load_frames(timeframes)
+    if not frames:
+        print("No backtest data for any timeframe")
+        return None
+    optimizer = Optimizer(space, base_estimator="GP", n_initial_points=N_INITIAL_POINTS, random_state=42)
+    if grid_points:
+        grid = [list(p) for p in itertools.product(*[np.linspace(d.low, d.high, grid_points) for d in space])]
+        optimizer.tell(grid, robust_scores(frames, grid, base_params).tolist())
+        print(f"Seeded with a {len(grid)}-point grid")
+    for _ in range(math.ceil(n_calls / batch_size)):
+        candidates = optimizer.ask(n_points=batch_size)
+        scores = robust_scores(frames, candidates, base_params)
+        optimizer.tell(candidates, scores.tolist())
+        for (tp, sl, proba), score in zip(candidates, scores):
+            print(f"Params: TP={tp:.3f}, SL={sl:.3f}, PROBA={proba:.3f} -> Robust Score={-score:.4f}")
+    return optimizer.get_result()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Optimize trade parameters for a robust Sharpe ratio.")
+    parser.add_argument("--calls", type=int, default=N_CALLS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--grid-points", type=int, default=0, help="Seed with a grid of N points per parameter")
+    args = parser.parse_args()
+
     print("Starting Bayesian Optimization for trade parameters...")
-    result = gp_minimize(
-        robust_objective,
-        space,
-        n_calls=100,         # You can increase for more thorough search
-        n_initial_points=10, # More random points to start
-        random_state=42,
-        verbose=True
-    )
+    result = optimize(args.calls, args.batch_size, args.grid_points)
+    if result is None:
+        raise SystemExit(1)
 
     # Save the best found params to file
     best_tp, best_sl, best_proba = result.x
@@ -98,4 +115,4 @@ if __name__ == "__main__":
         "proba_threshold": best_proba,
         "robust_score": -result.fun
     }, indent=2))
-    print("Saved to trade_params.json!")
\ No newline at end of file
+    print("Saved to trade_params.json!")
@@ -0,0 +1,103 @@
+"""
+Panel feature engine: rolling features for many symbols in one NumPy pass.
+
+Cleaned bars of a block of symbols are stacked into (bar index x symbol)
+arrays, left-aligned so row i is every symbol's i-th bar. Rolling windows in
+the per-symbol path count rows, not wall-clock time, so row alignment gives
+the same windows; shorter symbols are NaN-padded at the end and the padding
+is cut off again. The results are handed to feature_registry.compute_features
+as precomputed nodes, which leaves TA-Lib, calendar and target columns to the
+registry, so the output matches the per-symbol files column for column.
+"""
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+import feature_registry
+
+WINDOWS = feature_registry.WINDOWS
+RETURN_LAGS = [1, 3, 6, 12]
+# Largest (bars x symbols) block per pass; rolling std materialises block x window doubles
+PANEL_BLOCK_CELLS = 2_000_000
+
+def stack(frames, column):
+    """(max bars x symbols) float64 array, left-aligned and NaN-padded."""
+    out = np.full((max(len(df) for df in frames), len(frames)), np.nan)
+    for j, df in enumerate(frames):
+        out[:len(df), j] = df[column].to_numpy(dtype='float64')
+    return out
+
+def rolling(arr, win, how):
+    """Trailing rolling statistic down axis 0; NaN until a full window (pandas min_periods=win)."""
+    out = np.full(arr.shape, np.nan)
+    if len(arr) < win:
+        return out
+    view = sliding_window_view(arr, win, axis=0)
+    if how == 'mean':
+        out[win - 1:] = view.mean(axis=-1)
+    elif how == 'std':
+        out[win - 1:] = view.std(axis=-1, ddof=1)
+    elif how == 'max':
+        out[win - 1:] = view.max(axis=-1)
+    elif how == 'min':
+        out[win - 1:] = view.min(axis=-1)
+    else:
+        raise ValueError(f"Unknown rolling statistic: {how}")
+    return out
+
+def pct_change(arr, lag):
+    out = np.full(arr.shape, np.nan)
+    out[lag:] = arr[lag:] / arr[:-lag] - 1
+    return out
+
+def compute_panel(frames):
+    """Registry rolling/return nodes as 2-D arrays for a block of cleaned, time-sorted OHLCV frames."""
+    close, volume = stack(frames, 'close'), stack(frames, 'volume')
+    hl = stack(frames, 'high') - stack(frames, 'low')
+    out = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for lag in RETURN_LAGS:
+            out[f'return_{lag}'] = pct_change(close, lag)
+        for win in WINDOWS:
+            mean, std = rolling(close, win, 'mean'), rolling(close, win, 'std')
+            out[f'close_mean_{win}'] = mean
+            out[f'close_std_{win}'] = std
+            out[f'close_z_{win}'] = (close - mean) / std
+            out[f'hl_range_{win}'] = rolling(hl, win, 'mean') / close
+            out[f'volume_mean_{win}'] = rolling(volume, win, 'mean')
+            out[f'volume_std_{win}'] = rolling(volume, win, 'std')
+        cmax = rolling(close, 20, 'max')
+        vmean = rolling(volume, 20, 'mean')
+        out['_close_max_20'] = cmax
+        out['_volume_mean_20'] = vmean
+        out['drawdown_20'] = close / cmax - 1
+        out['rolling_std_14'] = rolling(out['return_1'], 14, 'std')
+        out['low_vol_liquidity'] = (volume < vmean * 0.5).astype(int)
+        out['rolling_max_20'] = cmax
+        out['rolling_min_20'] = rolling(close, 20, 'min')
+    return out
+
+def blocks(frames, max_cells=PANEL_BLOCK_CELLS):
+    """Split frames into blocks of similar length whose padded panel stays under max_cells."""
+    order = sorted(range(len(frames)), key=lambda j: len(frames[j]))
+    block = []
+    for j in order:
+        # Sorted by length, so the current frame sets the block's row count
+        if block and len(frames[j]) * (len(block) + 1) > max_cells:
+            yield block
+            block = []
+        block.append(j)
+    if block:
+        yield block
+
+def iter_panel_features(frames, columns=None):
+    """Yield (position, feature frame) for each input frame, one panel block at a time.
+
+    Each feature frame is what feature_registry.compute_features(frame, columns) returns.
+    """
+    for block in blocks(frames):
+        panel = compute_panel([frames[j] for j in block])
+        for k, j in enumerate(block):
+            df = frames[j]
+            precomputed = {name: pd.Series(arr[:len(df), k], index=df.index) for name, arr in panel.items()}
+            yield j, feature_registry.compute_features(df, columns=columns, precomputed=precomputed)
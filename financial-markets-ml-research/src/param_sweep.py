@@ -0,0 +1,267 @@
+"""
+Batched parameter sweep for the per-symbol backtest.
+
+sweep_params() simulates K parameter sets (take_profit_pct, stop_loss_pct,
+proba_threshold, and optionally trade_pct, leverage, scale_out_pct) in one
+pass over the data: sweep_kernel() walks each bar once and advances K
+copies of backtest_kernel()'s state machine held in (K,) state arrays. Every
+closed trade is recorded as (set, exit time, holding time, pnl_net) in flat
+arrays, and summary_kernel() rebuilds each set's portfolio curve in
+exit-time order to compute the same statistics as backtest_summary().
+
+The backtest threads one portfolio value through the symbols in turn, so
+state is reset per symbol and carried per set rather than kept as a
+(K, symbols) panel. Both kernels are compiled with numba when it is
+installed (see backtest_by_timeframe.jit).
+"""
+
+import argparse
+import itertools
+import os
+import time
+import numpy as np
+import pandas as pd
+import backtest_by_timeframe as bt
+import ohlcv_store
+
+SWEEP_PARAMS = ['take_profit_pct', 'stop_loss_pct', 'proba_threshold', 'trade_pct', 'leverage', 'scale_out_pct']
+SUMMARY_COLUMNS = ['final_value', 'total_return', 'max_drawdown', 'sharpe', 'win_rate', 'avg_hold_hours',
+                   'trade_count']
+DASHBOARD_DIR = bt.DASHBOARD_DIR
+
+def parameter_grid(**axes):
+    """Cartesian product of value lists, e.g. parameter_grid(take_profit_pct=[.02, .04], stop_loss_pct=[-.05])."""
+    names = list(axes)
+    return pd.DataFrame(list(itertools.product(*axes.values())), columns=names)
+
+def parameter_sets(param_sets, base_params):
+    """(K, len(SWEEP_PARAMS)) frame: `param_sets` (frame or list of dicts), gaps filled from base_params."""
+    sets = pd.DataFrame(param_sets).reset_index(drop=True)
+    unknown = set(sets.columns) - set(SWEEP_PARAMS)
+    if unknown:
+        raise ValueError(f"Parameters cannot be swept: {sorted(unknown)}")
+    for name in SWEEP_PARAMS:
+        sets[name] = sets[name].fillna(base_params[name]) if name in sets.columns else base_params[name]
+    return sets[SWEEP_PARAMS].astype('float64')
+
+@bt.jit
+def grown(a, size):
+    out = np.empty(size, dtype=a.dtype)
+    out[:len(a)] = a
+    return out
+
+@bt.jit
+def record_trade(out_set, out_bar, out_pnl, hold_ms, t, k, exit_bar, net_pnl, held_ms):
+    out_set[t] = k
+    out_bar[t] = exit_bar
+    out_pnl[t] = net_pnl
+    hold_ms[k] += held_ms
+    return t + 1
+
+@bt.jit
+def sweep_kernel(close, pred_up, proba_up, vol_spike, ms, bar, starts, starting_cash, trade_pct, leverage,
+                 scale_out_pct, take_profit_pct, stop_loss_pct, proba_threshold, trade_cost, capacity):
+    """backtest_kernel() for K parameter sets at once.
+
+    Returns trades as (set, exit bar rank, pnl_net) arrays in (symbol, bar) order, and each set's
+    summed holding time in ms.
+    """
+    n_sets = len(take_profit_pct)
+    out_set = np.empty(capacity, dtype=np.int32)
+    out_bar = np.empty(capacity, dtype=np.int32)
+    out_pnl = np.empty(capacity, dtype=np.float64)
+    hold_ms = np.zeros(n_sets, dtype=np.int64)
+    portfolio_value = np.full(n_sets, starting_cash)
+    position = np.zeros(n_sets)
+    entry = np.zeros(n_sets, dtype=np.int64)
+    entry_price = np.zeros(n_sets)
+    max_price = np.zeros(n_sets)
+    scale_out_done = np.zeros(n_sets, dtype=np.bool_)
+    t = 0
+    for s in range(len(starts) - 1):
+        position[:] = 0.0
+        scale_out_done[:] = False
+        for i in range(starts[s], starts[s + 1]):
+            if t + 2 * n_sets > len(out_set):  # a bar closes at most a scale-out and an exit per set
+                size = 2 * len(out_set) + 2 * n_sets
+                out_set, out_bar, out_pnl = grown(out_set, size), grown(out_bar, size), grown(out_pnl, size)
+            price = close[i]
+            for k in range(n_sets):
+                if position[k] == 0.0:
+                    if pred_up[i] == 1 and proba_up[i] >= proba_threshold[k]:
+                        position[k] = 1.0
+                        entry[k] = i
+                        entry_price[k] = price
+                        max_price[k] = price
+                        scale_out_done[k] = False
+                        notional = trade_pct[k] * leverage[k] * portfolio_value[k]
+                        portfolio_value[k] -= notional * trade_cost
+                    continue
+                if price > max_price[k]:
+                    max_price[k] = price
+                if price <= entry_price[k] * (1 - 1.0 / leverage[k]):
+                    net_pnl = -trade_pct[k] * position[k] * portfolio_value[k]
+                    t = record_trade(out_set, out_bar, out_pnl, hold_ms, t, k, bar[i], net_pnl, ms[i] - ms[entry[k]])
+                    portfolio_value[k] += net_pnl
+                    position[k] = 0.0
+                    scale_out_done[k] = False
+                    continue
+                if not scale_out_done[k] and (price / entry_price[k] - 1) >= take_profit_pct[k]:
+                    trade_value = trade_pct[k] * scale_out_pct[k] * leverage[k] * portfolio_value[k]
+                    gross_pnl = (price - entry_price[k]) / entry_price[k] * trade_value
+                    net_pnl = gross_pnl - trade_value * trade_cost
+                    t = record_trade(out_set, out_bar, out_pnl, hold_ms, t, k, bar[i], net_pnl, ms[i] - ms[entry[k]])
+                    portfolio_value[k] += net_pnl
+                    position[k] = 1.0 - scale_out_pct[k]
+                    scale_out_done[k] = True
+                if not (price / max_price[k] - 1 < stop_loss_pct[k] or vol_spike[i]
+                        or (pred_up[i] == 0 and proba_up[i] < (1 - proba_threshold[k]))):
+                    continue
+                trade_value = trade_pct[k] * position[k] * leverage[k] * portfolio_value[k]
+                gross_pnl = (price - entry_price[k]) / entry_price[k] * trade_value
+                net_pnl = gross_pnl - trade_value * trade_cost
+                t = record_trade(out_set, out_bar, out_pnl, hold_ms, t, k, bar[i], net_pnl, ms[i] - ms[entry[k]])
+                portfolio_value[k] += net_pnl
+                position[k] = 0.0
+                scale_out_done[k] = False
+    return out_set[:t], out_bar[:t], out_pnl[:t], hold_ms
+
+@bt.jit
+def counting_order(keys, n_keys, rows):
+    """`rows` stably reordered by keys[rows] (counting sort); also returns each key's start offset."""
+    bounds = np.zeros(n_keys + 1, dtype=np.int64)
+    for r in rows:
+        bounds[keys[r] + 1] += 1
+    for key in range(n_keys):
+        bounds[key + 1] += bounds[key]
+    fill = bounds[:-1].copy()
+    out = np.empty(len(rows), dtype=np.int64)
+    for r in rows:
+        out[fill[keys[r]]] = r
+        fill[keys[r]] += 1
+    return out, bounds
+
+@bt.jit
+def summary_kernel(bounds, order, pnl_net, hold_ms, starting_cash):
+    """backtest_summary() statistics per set: set k's trades are pnl_net[order[bounds[k]:bounds[k + 1]]]
+    in exit-time order, hold_ms is each set's summed holding time."""
+    pnl = pnl_net[order]
+    n_sets = len(bounds) - 1
+    out = np.full((n_sets, 6), np.nan)  # final_value, max_drawdown, sharpe, win_rate, avg_hold_hours, trade_count
+    for k in range(n_sets):
+        lo, hi = bounds[k], bounds[k + 1]
+        n = hi - lo
+        out[k, 5] = n
+        if n == 0:
+            out[k, 0], out[k, 3], out[k, 4] = starting_cash, 0.0, 0.0
+            continue
+        # Returns are the curve's pct_change with the first one filled as 0, as in backtest_summary()
+        value = starting_cash + pnl[lo]
+        peak, max_dd, total, wins = value, 0.0, 0.0, 0
+        for j in range(lo, hi):
+            if j > lo:
+                previous = value
+                value = value + pnl[j]
+                total += value / previous - 1
+                if value > peak:
+                    peak = value
+            max_dd = min(max_dd, value / peak - 1)
+            if pnl[j] > 0:
+                wins += 1
+        mean = total / n
+        value = starting_cash + pnl[lo]
+        squares = mean * mean
+        for j in range(lo + 1, hi):
+            previous = value
+            value = value + pnl[j]
+            squares += (value / previous - 1 - mean) ** 2
+        std = np.sqrt(squares / (n - 1)) if n > 1 else np.nan
+        out[k, 0] = value
+        out[k, 1] = max_dd
+        out[k, 2] = mean / std * (252 ** 0.5) if std > 0 else np.nan
+        out[k, 3] = wins / n
+        out[k, 4] = hold_ms[k] / n / 3_600_000
+    return out
+
+def sweep_params(df, param_sets, base_params):
+    """Summary row (SUMMARY_COLUMNS) per parameter set for a load_backtest_frame() frame, in one data pass.
+
+    base_params supplies the parameters a set leaves out and starting_cash, trade_cost, vol_spike_pctl.
+    """
+    base = bt.resolve_params(base_params)
+    sets = parameter_sets(param_sets, base)
+    starting_cash = base['starting_cash']
+    codes, symbols = pd.factorize(df.index.get_level_values('symbol'))
+    order = np.argsort(codes, kind='stable')
+    starts = np.searchsorted(codes[order], np.arange(len(symbols) + 1))
+    ms = ohlcv_store.series_to_ms(pd.Series(df.index.get_level_values('datetime')))[order]
+    bar_times, bar = np.unique(ms, return_inverse=True)  # exit times are recorded as bar ranks
+    arrays = [df['close'].to_numpy(dtype='float64')[order], df['pred_up'].to_numpy(dtype='float64')[order],
+              df['proba_up'].to_numpy(dtype='float64')[order], bt.vol_spike_flags(df, base['vol_spike_pctl'])[order], ms,
+              bar.astype(np.int32), starts]
+    param_arrays = [np.ascontiguousarray(sets[name].to_numpy()) for name in
+                    ['trade_pct', 'leverage', 'scale_out_pct', 'take_profit_pct', 'stop_loss_pct', 'proba_threshold']]
+
+    capacity = max(1024, min(len(sets) * len(df) // 8, 1 << 22))
+    set_ids, exit_bar, pnl, hold_ms = sweep_kernel(*arrays, float(starting_cash), *param_arrays,
+                                                   float(base['trade_cost']), capacity)
+
+    # Trades come out in (symbol, bar) order; counting sorts by exit bar, then by set, give (set, exit time)
+    # order with same-bar exits in symbol order, as in backtest_by_timeframe.simulate()
+    by_bar, _ = counting_order(exit_bar, len(bar_times), np.arange(len(set_ids)))
+    by_set, bounds = counting_order(set_ids, len(sets), by_bar)
+    stats = summary_kernel(bounds, by_set, pnl, hold_ms, float(starting_cash))
+    summary = pd.DataFrame(stats, columns=['final_value', 'max_drawdown', 'sharpe', 'win_rate', 'avg_hold_hours',
+                                           'trade_count'])
+    summary['total_return'] = summary['final_value'] / starting_cash - 1
+    summary['trade_count'] = summary['trade_count'].astype('int64')
+    return pd.concat([sets, summary[SUMMARY_COLUMNS]], axis=1)
+
+def verify_sweep(df, param_sets, base_params, checks=3, rtol=1e-9):
+    """Compare sweep rows with single backtest_by_timeframe.backtest() runs for the first `checks` sets.
+
+    The Sharpe ratio's mean and variance are accumulated in a different order than pandas does, hence rtol.
+    """
+    sweep = sweep_params(df, param_sets, base_params)
+    ok = True
+    for k in range(min(checks, len(sweep))):
+        _, _, expected = bt.backtest(df, {**base_params, **sweep.loc[k, SWEEP_PARAMS].to_dict()})
+        for column in SUMMARY_COLUMNS:
+            a, b = float(sweep.loc[k, column]), float(expected[column])
+            if not (np.isclose(a, b, rtol=rtol, atol=0) or (np.isnan(a) and np.isnan(b))):
+                print(f"[FAIL] set {k} {column}: sweep {a!r} vs single run {b!r}")
+                ok = False
+    print(f"[{'OK' if ok else 'FAIL'}] Sweep matches single runs for {min(checks, len(sweep))} parameter sets")
+    return ok
+
+def run_sweep(timeframe, param_sets, base_params=None, verify=False):
+    """Sweep a timeframe and write dashboard_data/param_sweep_<tf>.csv; base_params default to trade_params.json."""
+    base_params = bt.load_trade_params() if base_params is None else base_params
+    df = bt.load_backtest_frame(timeframe)
+    if df is None:
+        return None
+    started = time.perf_counter()
+    summary = sweep_params(df, param_sets, base_params)
+    seconds = time.perf_counter() - started
+    summary.insert(0, 'timeframe', timeframe)
+    os.makedirs(DASHBOARD_DIR, exist_ok=True)
+    out_path = os.path.join(DASHBOARD_DIR, f"param_sweep_{timeframe}.csv")
+    summary.to_csv(out_path, index=False)
+    print(summary.sort_values('sharpe', ascending=False).head(10).to_string(index=False))
+    print(f"[DONE] {len(summary)} parameter sets x {len(df)} rows in {seconds:.2f}s -> {out_path}")
+    if verify:
+        verify_sweep(df, param_sets, base_params)
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest a grid of trade parameters in one pass.")
+    parser.add_argument("timeframe")
+    parser.add_argument("--take-profit", type=float, nargs="+", default=list(np.linspace(0.02, 0.10, 10)))
+    parser.add_argument("--stop-loss", type=float, nargs="+", default=list(np.linspace(-0.15, -0.03, 10)))
+    parser.add_argument("--proba-threshold", type=float, nargs="+", default=list(np.linspace(0.50, 0.75, 10)))
+    parser.add_argument("--verify", action="store_true", help="Check the first sets against single backtests")
+    parser.add_argument("--params", default="trade_params.json", help="Trade parameters JSON file (base values)")
+    args = parser.parse_args()
+    grid = parameter_grid(take_profit_pct=args.take_profit, stop_loss_pct=args.stop_loss,
+                          proba_threshold=args.proba_threshold)
+    run_sweep(args.timeframe, grid, bt.load_trade_params(args.params), verify=args.verify)
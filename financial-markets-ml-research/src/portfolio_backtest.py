@@ -0,0 +1,351 @@
+"""
+Portfolio-level, event-driven backtest across all symbols of a timeframe.
+
+backtest_by_timeframe.py simulates symbols one after another against a
+shared portfolio value, so sizing depends on symbol order and
+MAX_OPEN_TRADES is never applied. Here every symbol's bars are merged in
+time order with a heap (k-way merge, one cursor per symbol) and each bar
+time is processed as one event:
+
+  1. open positions run the same exit rules as the per-symbol backtest
+     (liquidation, scale-out, trailing stop, volatility spike, signal flip);
+  2. symbols that were flat at the start of the bar and signal an entry are
+     opened in order of proba_up while fewer than max_open_trades positions
+     are open and cash covers margin plus entry fee.
+
+A position's margin is trade_pct of equity (cash plus margin in open
+positions) at entry and its notional is margin x leverage; exits return
+their share of the margin plus the net P&L to cash, a liquidation loses it.
+Positions still open at the end are marked to market at their last close
+in the final equity point.
+
+Each cursor pulls its symbol's bars in batches from a source. For a
+timeframe's files (stream_portfolio()) the sources read only the columns
+the simulation needs from the symbol's row group of the aggregate (one row
+group per symbol, see aggregate_features_by_timeframe.py) and of the
+predictions sidecar, BATCH_SIZE rows at a time; the vol-spike thresholds
+come from a first pass over the same columns. Memory then grows with the
+number of symbols and open positions rather than with the number of bars.
+simulate_portfolio() runs the same loop over an in-memory
+load_backtest_frame() frame.
+"""
+
+import argparse
+import heapq
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import backtest_by_timeframe as bt
+import inference_timeframe
+import ohlcv_store
+
+DASHBOARD_DIR = bt.DASHBOARD_DIR
+BATCH_SIZE = 4096
+# load_backtest_frame() drops rows missing any of these (or a prediction); the streamed sources do the same
+FRAME_COLUMNS = ['symbol', 'timestamp', 'timeframe', 'close', 'target_return_1', 'drawdown_20', 'rolling_std_14',
+                 'low_vol_liquidity']
+PREDICTION_COLUMNS = ['pred_up', 'proba_up']
+BATCH_COLUMNS = ['ms', 'close', 'pred_up', 'proba_up', 'rolling_std_14']
+
+def frame_sources(df):
+    """(symbols, sources, time index template) for a load_backtest_frame() frame: each source yields its
+    symbol's rows as one batch."""
+    codes, symbols = pd.factorize(df.index.get_level_values('symbol'))
+    order = np.argsort(codes, kind='stable')  # rows are already time-sorted within each symbol
+    starts = np.searchsorted(codes[order], np.arange(len(symbols) + 1))
+    times = df.index.get_level_values('datetime')
+    columns = {
+        'ms': ohlcv_store.series_to_ms(pd.Series(times[order])),
+        'close': df['close'].to_numpy(dtype='float64')[order],
+        'pred_up': df['pred_up'].to_numpy(dtype='float64')[order],
+        'proba_up': df['proba_up'].to_numpy(dtype='float64')[order],
+        'rolling_std_14': df['rolling_std_14'].to_numpy(dtype='float64')[order]
+    }
+
+    def source(lo, hi):
+        return lambda: iter([{k: v[lo:hi] for k, v in columns.items()}])
+    return list(symbols), [source(starts[c], starts[c + 1]) for c in range(len(symbols))], times[:0]
+
+def batch_arrays(df):
+    return {
+        'ms': ohlcv_store.series_to_ms(pd.to_datetime(df['timestamp'])),
+        'close': df['close'].to_numpy(dtype='float64'),
+        'pred_up': df['pred_up'].to_numpy(dtype='float64'),
+        'proba_up': df['proba_up'].to_numpy(dtype='float64'),
+        'rolling_std_14': df['rolling_std_14'].to_numpy(dtype='float64')
+    }
+
+def symbol_batches(features_path, group, predictions_path=None, prediction_group=None, batch_size=BATCH_SIZE,
+                   prediction_deltas=None):
+    """One symbol's usable rows, time-sorted, in batches of BATCH_COLUMNS arrays.
+
+    Feature rows come from row group `group` of the aggregate; predictions are merged in from row group
+    `prediction_group` of the sidecar, read alongside in batches (both are sorted by timestamp), then
+    overridden by the symbol's not yet compacted `prediction_deltas` rows, or taken from the features
+    file itself when there is no sidecar.
+    """
+    columns = FRAME_COLUMNS + (PREDICTION_COLUMNS if predictions_path is None else [])
+    features = pq.ParquetFile(features_path)
+    pending = pd.DataFrame(columns=['timestamp'] + PREDICTION_COLUMNS)
+    prediction_batches = None
+    if predictions_path is not None and prediction_group is not None:
+        prediction_batches = pq.ParquetFile(predictions_path).iter_batches(
+            batch_size, row_groups=[prediction_group], columns=['timestamp'] + PREDICTION_COLUMNS)
+    last_ms = None
+    for batch in features.iter_batches(batch_size, row_groups=[group], columns=columns):
+        df = batch.to_pandas()
+        if predictions_path is not None:
+            last_ts = df['timestamp'].iloc[-1]
+            while prediction_batches is not None and (pending.empty or pending['timestamp'].iloc[-1] < last_ts):
+                more = next(prediction_batches, None)
+                if more is None:
+                    prediction_batches = None
+                    break
+                more = more.to_pandas()
+                pending = more if pending.empty else pd.concat([pending, more], ignore_index=True)
+            df = df.merge(pending, on='timestamp', how='left')
+            pending = pending[pending['timestamp'] > last_ts]
+            if prediction_deltas is not None:
+                newer = df[['timestamp']].merge(prediction_deltas, on='timestamp', how='left')
+                hit = newer['proba_up'].notna().to_numpy()
+                df.loc[hit, PREDICTION_COLUMNS] = newer.loc[hit, PREDICTION_COLUMNS].to_numpy()
+        df = df.dropna(subset=FRAME_COLUMNS + PREDICTION_COLUMNS)
+        arrays = batch_arrays(df)
+        if last_ms is not None:  # duplicate bars: keep the first, as load_backtest_frame() does
+            keep = arrays['ms'] > last_ms
+            arrays = {k: v[keep] for k, v in arrays.items()}
+        if len(arrays['ms']):
+            last_ms = arrays['ms'][-1]
+            yield arrays
+
+def file_sources(timeframe, batch_size=BATCH_SIZE, features_dir=bt.FEATURES_DIR):
+    """(symbols, sources, time index template) streaming a timeframe's aggregate and predictions sidecar,
+    one source per symbol."""
+    features_path = os.path.join(features_dir, f"{timeframe}_features.parquet")
+    features = pq.ParquetFile(features_path)
+    groups = inference_timeframe.symbol_row_groups(features)
+    if groups is None:
+        raise ValueError(f"{features_path} is not one row group per symbol; rebuild it with "
+                         f"aggregate_features_by_timeframe.py {timeframe} --full")
+    predictions_path = inference_timeframe.predictions_path(timeframe, features_dir)
+    prediction_groups, deltas = {}, {}
+    if os.path.exists(predictions_path):
+        prediction_groups = inference_timeframe.symbol_row_groups(pq.ParquetFile(predictions_path))
+        if prediction_groups is None:
+            raise ValueError(f"{predictions_path} is not one row group per symbol; rerun inference_timeframe.py")
+        newest = inference_timeframe.read_prediction_deltas(timeframe, features_dir)
+        deltas = {symbol: rows[['timestamp'] + PREDICTION_COLUMNS] for symbol, rows in newest.groupby('symbol')}
+    elif not set(PREDICTION_COLUMNS) <= set(features.schema.names):
+        raise ValueError(f"No predictions for {timeframe}: run inference_timeframe.py {timeframe}")
+    else:
+        predictions_path = None
+    symbols = sorted(groups)  # same symbol order as load_backtest_frame()
+
+    def source(symbol):
+        return lambda: symbol_batches(features_path, groups[symbol], predictions_path,
+                                      prediction_groups.get(symbol), batch_size, deltas.get(symbol))
+    like = pd.DatetimeIndex(pd.to_datetime(features.schema_arrow.empty_table().to_pandas()['timestamp']))
+    return symbols, [source(symbol) for symbol in symbols], like
+
+def vol_spike_thresholds(sources, vol_spike_pctl):
+    """Each symbol's rolling_std_14 quantile, from a first pass that keeps only that column."""
+    thresholds = np.full(len(sources), np.nan)
+    for c, source in enumerate(sources):
+        values = [batch['rolling_std_14'] for batch in source()]
+        if values:
+            thresholds[c] = np.quantile(np.concatenate(values), vol_spike_pctl)
+    return thresholds
+
+def to_times(ms, like):
+    """Epoch-ms values as a DatetimeIndex with the unit and time zone of `like`."""
+    times = pd.to_datetime(np.asarray(ms, dtype='int64'), unit='ms', utc=True).as_unit(like.unit)
+    return times.tz_convert(like.tz) if like.tz is not None else times.tz_localize(None)
+
+def simulate_events(symbols, sources, thresholds, like, params):
+    """Event-driven simulation over per-symbol batch sources (frame_sources() or file_sources())."""
+    p = bt.resolve_params(params)
+    starting_cash, trade_cost = p['starting_cash'], p['trade_cost']
+    max_open, leverage, trade_pct = int(p['max_open_trades']), float(p['leverage']), float(p['trade_pct'])
+    scale_out_pct, take_profit_pct = float(p['scale_out_pct']), float(p['take_profit_pct'])
+    stop_loss_pct, proba_threshold = float(p['stop_loss_pct']), float(p['proba_threshold'])
+
+    cursors = [source() for source in sources]
+    batches = [None] * len(symbols)
+
+    def advance(c):
+        """Push symbol c's next row onto the heap, pulling its next batch when the current one is used up."""
+        batch = next(cursors[c], None)
+        if batch is None:
+            batches[c] = None
+            return
+        batch['vol_spike'] = batch['rolling_std_14'] > thresholds[c]
+        batches[c] = batch
+        heapq.heappush(heap, (int(batch['ms'][0]), c, 0))
+
+    heap = []
+    for c in range(len(symbols)):
+        advance(c)
+    cash, locked = float(starting_cash), 0.0
+    positions = {}  # symbol code -> open position state
+    trades, curve_ms, curve_values = [], [], []
+    skipped_slots = skipped_cash = max_concurrent = 0
+    now = None
+
+    def close_trade(c, pos, exit_ms, price, exit_type, size, gross_pnl, fee, net_pnl, returned):
+        nonlocal cash, locked
+        cash += returned
+        locked -= pos['margin'] * size
+        trades.append((c, pos['entry_ms'], pos['entry_price'], exit_ms, price, exit_type, gross_pnl, fee, net_pnl,
+                       size))
+        curve_ms.append(exit_ms)
+        curve_values.append(cash + locked)
+
+    while heap:
+        now = heap[0][0]
+        bar = []
+        while heap and heap[0][0] == now:
+            _, c, i = heapq.heappop(heap)
+            batch = batches[c]
+            bar.append((c, batch['close'][i], batch['pred_up'][i], batch['proba_up'][i], batch['vol_spike'][i]))
+            if i + 1 < len(batch['ms']):
+                heapq.heappush(heap, (int(batch['ms'][i + 1]), c, i + 1))
+            else:
+                advance(c)
+
+        # Exits first, so positions closed on this bar free their slot and cash for this bar's entries
+        flat = []
+        for c, price, pred_up, proba_up, vol_spike in bar:
+            pos = positions.get(c)
+            if pos is None:
+                flat.append((c, price, pred_up, proba_up))
+                continue
+            entry_price = pos['entry_price']
+            pos['last_price'] = price
+            if price > pos['max_price']:
+                pos['max_price'] = price
+            if price <= entry_price * (1 - 1.0 / leverage):
+                net_pnl = -pos['margin'] * pos['position']
+                close_trade(c, pos, now, price, 'Liquidation', pos['position'], net_pnl, pos['entry_fee'], net_pnl,
+                            0.0)
+                del positions[c]
+                continue
+            if not pos['scale_out_done'] and (price / entry_price - 1) >= take_profit_pct:
+                trade_value = pos['notional'] * scale_out_pct
+                gross_pnl = (price - entry_price) / entry_price * trade_value
+                exit_fee = trade_value * trade_cost
+                net_pnl = gross_pnl - exit_fee
+                close_trade(c, pos, now, price, 'TakeProfit70%', scale_out_pct, gross_pnl, exit_fee, net_pnl,
+                            pos['margin'] * scale_out_pct + net_pnl)
+                pos['position'] = 1.0 - scale_out_pct
+                pos['scale_out_done'] = True
+            if price / pos['max_price'] - 1 < stop_loss_pct:
+                exit_type = 'TrailingStop'
+            elif vol_spike:
+                exit_type = 'VolSpike'
+            elif pred_up == 0 and proba_up < (1 - proba_threshold):
+                exit_type = 'SignalFlip'
+            else:
+                continue
+            trade_value = pos['notional'] * pos['position']
+            gross_pnl = (price - entry_price) / entry_price * trade_value
+            exit_fee = trade_value * trade_cost
+            net_pnl = gross_pnl - exit_fee
+            close_trade(c, pos, now, price, exit_type, pos['position'], gross_pnl, exit_fee, net_pnl,
+                        pos['margin'] * pos['position'] + net_pnl)
+            del positions[c]
+
+        signals = [s for s in flat if s[2] == 1 and s[3] >= proba_threshold]
+        signals.sort(key=lambda s: (-s[3], s[0]))
+        for c, price, _, _ in signals:
+            if len(positions) >= max_open:
+                skipped_slots += 1
+                continue
+            margin = trade_pct * (cash + locked)
+            entry_fee = margin * leverage * trade_cost
+            if margin <= 0 or cash < margin + entry_fee:
+                skipped_cash += 1
+                continue
+            cash -= margin + entry_fee
+            locked += margin
+            positions[c] = {'entry_ms': now, 'entry_price': price, 'max_price': price, 'last_price': price,
+                            'position': 1.0, 'scale_out_done': False, 'margin': margin,
+                            'notional': margin * leverage, 'entry_fee': entry_fee}
+        max_concurrent = max(max_concurrent, len(positions))
+
+    # Positions still open are worth their margin plus unrealized P&L at their last close
+    unrealized = sum((pos['last_price'] - pos['entry_price']) / pos['entry_price'] * pos['notional'] * pos['position']
+                     for pos in positions.values())
+    if positions:
+        curve_ms.append(now)
+        curve_values.append(cash + locked + unrealized)
+
+    trade_log_df = pd.DataFrame({
+        'symbol': [symbols[t[0]] for t in trades],
+        'entry_time': to_times([t[1] for t in trades], like),
+        'entry_price': [t[2] for t in trades],
+        'exit_time': to_times([t[3] for t in trades], like),
+        'exit_price': [t[4] for t in trades],
+        'exit_type': [t[5] for t in trades],
+        'pnl_gross': [t[6] for t in trades],
+        'fee': [t[7] for t in trades],
+        'pnl_net': [t[8] for t in trades],
+        'position_pct': [t[9] for t in trades]
+    }, columns=bt.TRADE_LOG_COLUMNS)
+    curve = pd.Series(curve_values, index=to_times(curve_ms, like), name='portfolio_value', dtype='float64')
+    counters = {'skipped_max_open': skipped_slots, 'skipped_cash': skipped_cash, 'max_concurrent': max_concurrent,
+                'open_at_end': len(positions), 'cash_at_end': float(cash), 'unrealized_pnl_at_end': float(unrealized)}
+    return trade_log_df, curve, counters
+
+def simulate_portfolio(df, params):
+    """Event-driven simulation of an in-memory load_backtest_frame() frame with trade parameters `params`
+    (backtest_by_timeframe.resolve_params() keys plus max_open_trades).
+
+    Returns (trade log, equity curve indexed by exit time, counters).
+    """
+    symbols, sources, like = frame_sources(df)
+    thresholds = vol_spike_thresholds(sources, bt.resolve_params(params)['vol_spike_pctl'])
+    return simulate_events(symbols, sources, thresholds, like, params)
+
+def stream_portfolio(timeframe, params, batch_size=BATCH_SIZE, features_dir=bt.FEATURES_DIR):
+    """simulate_portfolio() over a timeframe's files, streamed per symbol without loading the panel."""
+    symbols, sources, like = file_sources(timeframe, batch_size, features_dir)
+    thresholds = vol_spike_thresholds(sources, bt.resolve_params(params)['vol_spike_pctl'])
+    return simulate_events(symbols, sources, thresholds, like, params)
+
+def run_portfolio_backtest(timeframe, params=None):
+    """Portfolio backtest of a timeframe with its file outputs; params default to trade_params.json."""
+    params = bt.load_trade_params() if params is None else params
+    started = time.perf_counter()
+    features_path = os.path.join(bt.FEATURES_DIR, f"{timeframe}_features.parquet")
+    if not os.path.exists(features_path):
+        print(f"No aggregated features file: {features_path}")
+        return None
+    trade_log_df, curve, counters = stream_portfolio(timeframe, params)
+    summary = {**bt.backtest_summary(curve, trade_log_df, bt.resolve_params(params)['starting_cash']), **counters}
+    print(f"[{timeframe}] Portfolio: final value ${summary['final_value']:,.2f} ({summary['total_return']:.2%}), "
+          f"max drawdown {summary['max_drawdown']:.2%}, Sharpe {summary['sharpe']:.2f}, "
+          f"{summary['trade_count']} trades, max {summary['max_concurrent']} open, "
+          f"{summary['skipped_max_open']} entries skipped at the limit, {summary['skipped_cash']} for cash "
+          f"({time.perf_counter() - started:.1f}s)")
+
+    os.makedirs(DASHBOARD_DIR, exist_ok=True)
+    trade_log_df.to_csv(os.path.join(DASHBOARD_DIR, f"portfolio_trade_log_{timeframe}.csv"), index=False)
+    curve.to_csv(os.path.join(DASHBOARD_DIR, f"portfolio_equity_{timeframe}.csv"), header=['portfolio_value'])
+    with open(os.path.join(DASHBOARD_DIR, f"portfolio_summary_{timeframe}.json"), "w") as f:
+        json.dump(summary, f)
+    print(f"Portfolio backtest files saved in {DASHBOARD_DIR}/ for {timeframe}")
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Portfolio-level backtest honoring max open trades and cash.")
+    parser.add_argument("timeframe")
+    parser.add_argument("--params", default="trade_params.json", help="Trade parameters JSON file")
+    parser.add_argument("--max-open-trades", type=int, default=None)
+    args = parser.parse_args()
+    params = bt.load_trade_params(args.params)
+    if args.max_open_trades is not None:
+        params['max_open_trades'] = args.max_open_trades
+    run_portfolio_backtest(args.timeframe, params)
@@ -0,0 +1,115 @@
+"""
+Builds higher-timeframe OHLCV bars locally from the finest fetched timeframe.
+
+A higher bar is written only once every base bar of its bucket is stored, so
+an exchange outage never produces a short bar with too little volume and the
+wrong high/low. Which buckets to build is planned from the coverage manifest
+alone (ohlcv_store.py): buckets fully inside a covered base interval that
+are not derived yet. That covers both the new tail and buckets whose base
+bars a gap repair has just filled, so fetching 30m alone is enough for
+1h/4h/12h/1d.
+"""
+
+import sys
+import pandas as pd
+import ohlcv_store
+
+OUTPUT_DIR = "ohlcv_parquet"
+BASE_TIMEFRAME = "30m"
+DERIVED_TIMEFRAMES = ["1h", "4h", "12h", "1d"]
+TIMEFRAME_DELTAS = ohlcv_store.TIMEFRAME_DELTAS
+
+def resample_bars(df, base_timeframe, target_timeframe):
+    """Aggregate sorted base bars into the complete bars of `target_timeframe` (UTC-aligned)."""
+    if df.empty:
+        return pd.DataFrame()
+    base_delta = TIMEFRAME_DELTAS[base_timeframe]
+    target_delta = TIMEFRAME_DELTAS[target_timeframe]
+    if target_delta <= base_delta or target_delta % base_delta:
+        raise ValueError(f"Cannot derive {target_timeframe} from {base_timeframe}")
+
+    bucket = df['timestamp'].dt.floor(target_delta)
+    out = df.groupby(bucket, sort=True).agg(
+        open=('open', 'first'),
+        high=('high', 'max'),
+        low=('low', 'min'),
+        close=('close', 'last'),
+        volume=('volume', 'sum'),
+        n_bars=('close', 'size')
+    )
+    # Buckets missing base bars (history starting mid-bucket, outages, the still-open bar) are not bars yet
+    out = out[out['n_bars'] == target_delta // base_delta]
+
+    out = out.drop(columns='n_bars').rename_axis('timestamp').reset_index()
+    if 'symbol' in df.columns:
+        out['symbol'] = df['symbol'].iloc[0]
+    out['timeframe'] = target_timeframe
+    return out
+
+def subtract_intervals(spans, intervals):
+    """Parts of half-open [start, end) spans not covered by sorted half-open intervals."""
+    out = []
+    for start, end in spans:
+        for lo, hi in intervals:
+            if hi <= start or lo >= end:
+                continue
+            if lo > start:
+                out.append([start, lo])
+            start = max(start, hi)
+            if start >= end:
+                break
+        if start < end:
+            out.append([start, end])
+    return out
+
+def pending_spans(symbol, target_timeframe, base_timeframe=BASE_TIMEFRAME, root=OUTPUT_DIR, manifest=None):
+    """[start_ms, end_ms) spans of target bars whose base bars are all stored but which are not derived yet."""
+    manifest = ohlcv_store.load_manifest(root) if manifest is None else manifest
+    base = ohlcv_store.coverage(symbol, base_timeframe, manifest=manifest)
+    if not base:
+        return []
+    base_step = ohlcv_store.timeframe_ms(base_timeframe)
+    step = ohlcv_store.timeframe_ms(target_timeframe)
+    complete = []
+    for start, end in base['intervals']:  # closed intervals of base bar open times
+        first = -(-start // step) * step
+        last = (end + base_step) // step * step
+        if first < last:
+            complete.append([first, last])
+    derived = ohlcv_store.coverage(symbol, target_timeframe, manifest=manifest)
+    derived = [[start, end + step] for start, end in derived['intervals']] if derived else []
+    return subtract_intervals(complete, derived)
+
+def update_derived(symbol, target_timeframe, base_timeframe=BASE_TIMEFRAME, root=OUTPUT_DIR, manifest=None):
+    """Write the higher bars that became complete since the last run. Returns the number of bars written."""
+    manifest = ohlcv_store.load_manifest(root) if manifest is None else manifest
+    if not ohlcv_store.coverage(symbol, base_timeframe, manifest=manifest) \
+            and ohlcv_store.has_bars(symbol, base_timeframe, root=root):
+        print(f"[WARN] No coverage manifest entry for {symbol} - {base_timeframe}; "
+              f"run fetch_market_data.py --rebuild-manifest")
+        return 0
+    base_delta = TIMEFRAME_DELTAS[base_timeframe]
+    written = 0
+    for start_ms, end_ms in pending_spans(symbol, target_timeframe, base_timeframe, root, manifest):
+        start = pd.Timestamp(start_ms, unit='ms', tz='UTC')
+        end = pd.Timestamp(end_ms, unit='ms', tz='UTC') - base_delta
+        base = ohlcv_store.read_bars(symbol, base_timeframe, root=root, start=start, end=end)
+        derived = resample_bars(base, base_timeframe, target_timeframe)
+        written += ohlcv_store.append_bars(derived, symbol, target_timeframe, root=root)
+    return written
+
+def derive_all(symbols, target_timeframes=DERIVED_TIMEFRAMES, base_timeframe=BASE_TIMEFRAME, root=OUTPUT_DIR):
+    for symbol in symbols:
+        for target_timeframe in target_timeframes:
+            written = update_derived(symbol, target_timeframe, base_timeframe=base_timeframe, root=root)
+            if written:
+                ohlcv_store.compact(symbol, target_timeframe, root=root)
+                print(f"Derived {written} {target_timeframe} bars for {symbol} from {base_timeframe}")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python resample_ohlcv.py [symbols_file] [target timeframes...]")
+        sys.exit(1)
+    with open(sys.argv[1]) as f:
+        symbols = [line.strip() for line in f if line.strip()]
+    derive_all(symbols, sys.argv[2:] or DERIVED_TIMEFRAMES)
@@ -0,0 +1,612 @@
+"""
+Streaming O(1)-per-bar indicator engine for the live path.
+
+Each indicator is a small state object whose update() consumes one bar and
+returns the value TA-Lib (or pandas rolling) would produce for that bar in a
+batch call over the same history: the same SMA seeding, Wilder smoothing and
+warm-up lengths, with NaN until the batch output would be defined.
+FeatureStream bundles them into the per-symbol feature row of
+feature_engineering_timeframe.py (targets excluded, they need the future).
+States pickle with joblib, so the live cycle only feeds bars that arrived
+since the last snapshot.
+"""
+
+import math
+import os
+import sys
+from collections import deque
+import joblib
+import numpy as np
+import pandas as pd
+import feature_registry
+import ohlcv_store
+from feature_engineering_timeframe import bad_bar_mask, compute_features, DATA_DIR
+
+NAN = float('nan')
+STREAM_COLUMNS = [c for c in feature_registry.FEATURE_COLUMNS if not c.startswith('target_')]
+STATE_TEMPLATE = "{tf}_stream_state.joblib"
+LIVE_FEATURES_TEMPLATE = "{tf}_live_features.parquet"
+
+def ta_is_zero(value):
+    return -0.00000001 < value < 0.00000001
+
+def divide(numerator, denominator):
+    """Float division with NumPy semantics (x/0 -> +-inf, 0/0 -> nan) to match the batch columns."""
+    if denominator == 0:
+        if numerator == 0 or math.isnan(numerator):
+            return NAN
+        return math.copysign(math.inf, numerator) * math.copysign(1.0, denominator)
+    return numerator / denominator
+
+def true_range(high, low, prev_close):
+    out = high - low
+    out = max(out, abs(high - prev_close))
+    return max(out, abs(low - prev_close))
+
+# --- Rolling windows ---
+
+class RollingMax:
+    """Max over the last `window` values via a monotonic deque."""
+
+    def __init__(self, window):
+        self.window = window
+        self.n = 0
+        self.items = deque()  # (index, value), values decreasing
+
+    def better(self, new, old):
+        return new >= old
+
+    def update(self, value):
+        while self.items and self.better(value, self.items[-1][1]):
+            self.items.pop()
+        self.items.append((self.n, value))
+        if self.items[0][0] <= self.n - self.window:
+            self.items.popleft()
+        self.n += 1
+        return self.items[0][1] if self.n >= self.window else NAN
+
+class RollingMin(RollingMax):
+    """Min over the last `window` values via a monotonic deque."""
+
+    def better(self, new, old):
+        return new <= old
+
+class RollingMean:
+    """pandas rolling(window).mean(): Kahan-compensated running sum."""
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque()
+        self.total = 0.0
+        self.compensation = 0.0
+        self.prev_value = NAN
+        self.same_count = 0
+
+    def add(self, value):
+        y = value - self.compensation
+        t = self.total + y
+        self.compensation = t - self.total - y
+        self.total = t
+
+    def update(self, value):
+        if len(self.values) == self.window:
+            self.add(-self.values.popleft())
+        self.values.append(value)
+        self.add(value)
+        self.same_count = self.same_count + 1 if value == self.prev_value else 1
+        self.prev_value = value
+        if len(self.values) < self.window:
+            return NAN
+        if self.same_count >= self.window:
+            return value
+        return self.total / self.window
+
+class RollingStd:
+    """pandas rolling(window).std() (ddof=1): Welford add/remove of one value per bar."""
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque()
+        self.mean = 0.0
+        self.ssqdm = 0.0
+        self.prev_value = NAN
+        self.same_count = 0
+
+    def update(self, value):
+        if len(self.values) == self.window:
+            old = self.values.popleft()
+            n = len(self.values)
+            if n:
+                delta = old - self.mean
+                self.mean -= delta / n
+                self.ssqdm -= ((n + 1) * delta * delta) / n
+            else:
+                self.mean = 0.0
+                self.ssqdm = 0.0
+        self.values.append(value)
+        n = len(self.values)
+        delta = value - self.mean
+        self.mean += delta / n
+        self.ssqdm += ((n - 1) * delta * delta) / n
+        self.same_count = self.same_count + 1 if value == self.prev_value else 1
+        self.prev_value = value
+        if n < self.window:
+            return NAN
+        if self.same_count >= n:
+            return 0.0
+        return math.sqrt(max(self.ssqdm / (n - 1), 0.0))
+
+# --- TA-Lib indicators ---
+
+class SMA:
+    """TA-Lib SMA: running total, the trailing value is removed after each output."""
+
+    def __init__(self, period):
+        self.period = period
+        self.values = deque()
+        self.total = 0.0
+
+    def update(self, value):
+        self.values.append(value)
+        self.total += value
+        if len(self.values) < self.period:
+            return NAN
+        out = self.total / self.period
+        self.total -= self.values.popleft()
+        return out
+
+class EMA:
+    """TA-Lib EMA: seeded with the SMA of the first `period` values."""
+
+    def __init__(self, period):
+        self.period = period
+        self.k = 2.0 / (period + 1)
+        self.n = 0
+        self.total = 0.0
+        self.value = NAN
+
+    def update(self, value):
+        self.n += 1
+        if self.n <= self.period:
+            self.total += value
+            if self.n < self.period:
+                return NAN
+            self.value = self.total / self.period
+            return self.value
+        self.value = ((value - self.value) * self.k) + self.value
+        return self.value
+
+class MACD:
+    """TA-Lib MACD. The fast EMA is seeded on the `fast` bars ending where the slow EMA
+    starts, and the signal EMA is seeded on the first `signal` MACD values."""
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.fast_ema = EMA(fast)
+        self.slow_ema = EMA(slow)
+        self.signal_ema = EMA(signal)
+        self.fast_offset = slow - fast
+        self.n = 0
+
+    def update(self, value):
+        slow = self.slow_ema.update(value)
+        fast = self.fast_ema.update(value) if self.n >= self.fast_offset else NAN
+        self.n += 1
+        if math.isnan(slow):
+            return NAN, NAN, NAN
+        macd = fast - slow
+        signal = self.signal_ema.update(macd)
+        if math.isnan(signal):
+            return NAN, NAN, NAN
+        return macd, signal, macd - signal
+
+class RSI:
+    """TA-Lib RSI: average gain/loss over the first `period` changes, then Wilder smoothing."""
+
+    def __init__(self, period=14):
+        self.period = period
+        self.n = 0
+        self.prev = None
+        self.gain = 0.0
+        self.loss = 0.0
+
+    def update(self, value):
+        if self.prev is None:
+            self.prev = value
+            return NAN
+        diff = value - self.prev
+        self.prev = value
+        self.n += 1
+        if self.n > self.period:
+            self.loss *= (self.period - 1)
+            self.gain *= (self.period - 1)
+        if diff < 0:
+            self.loss -= diff
+        else:
+            self.gain += diff
+        if self.n < self.period:
+            return NAN
+        self.loss /= self.period
+        self.gain /= self.period
+        total = self.gain + self.loss
+        return 100.0 * (self.gain / total) if not ta_is_zero(total) else 0.0
+
+class ATR:
+    """TA-Lib ATR: SMA of the first `period` true ranges, then Wilder smoothing."""
+
+    def __init__(self, period=14):
+        self.period = period
+        self.n = 0
+        self.prev_close = None
+        self.total = 0.0
+        self.value = NAN
+
+    def update(self, high, low, close):
+        if self.prev_close is None:
+            self.prev_close = close
+            return NAN
+        tr = true_range(high, low, self.prev_close)
+        self.prev_close = close
+        self.n += 1
+        if self.n <= self.period:
+            self.total += tr
+            if self.n < self.period:
+                return NAN
+            self.value = self.total / self.period
+            return self.value
+        self.value = (self.value * (self.period - 1) + tr) / self.period
+        return self.value
+
+class ADX:
+    """TA-Lib ADX. DM/TR are summed over period-1 bars, Wilder-smoothed over the next
+    `period` bars while DX is summed, and the first ADX is their mean."""
+
+    def __init__(self, period=14):
+        self.period = period
+        self.n = 0
+        self.prev_high = self.prev_low = self.prev_close = None
+        self.plus_dm = self.minus_dm = self.tr = 0.0
+        self.sum_dx = 0.0
+        self.value = NAN
+
+    def directional_indices(self):
+        if ta_is_zero(self.tr):
+            return None
+        minus_di = 100.0 * (self.minus_dm / self.tr)
+        plus_di = 100.0 * (self.plus_dm / self.tr)
+        total = minus_di + plus_di
+        if ta_is_zero(total):
+            return None
+        return 100.0 * (abs(minus_di - plus_di) / total)
+
+    def update(self, high, low, close):
+        if self.prev_high is None:
+            self.prev_high, self.prev_low, self.prev_close = high, low, close
+            return NAN
+        self.n += 1
+        period = self.period
+        diff_p = high - self.prev_high
+        diff_m = self.prev_low - low
+        self.prev_high, self.prev_low = high, low
+        if self.n >= period:
+            self.minus_dm -= self.minus_dm / period
+            self.plus_dm -= self.plus_dm / period
+        if diff_m > 0 and diff_p < diff_m:
+            self.minus_dm += diff_m
+        elif diff_p > 0 and diff_p > diff_m:
+            self.plus_dm += diff_p
+        tr = true_range(high, low, self.prev_close)
+        self.prev_close = close
+        if self.n < period:
+            self.tr += tr
+            return NAN
+        self.tr = self.tr - (self.tr / period) + tr
+        dx = self.directional_indices()
+        if self.n < 2 * period - 1:
+            if dx is not None:
+                self.sum_dx += dx
+            return NAN
+        if self.n == 2 * period - 1:
+            if dx is not None:
+                self.sum_dx += dx
+            self.value = self.sum_dx / period
+        elif dx is not None:
+            self.value = ((self.value * (period - 1)) + dx) / period
+        return self.value
+
+class BBANDS:
+    """TA-Lib BBANDS with SMA middle band and population stddev from running squares."""
+
+    def __init__(self, period=20, nbdev=2.0):
+        self.period = period
+        self.nbdev = nbdev
+        self.sma = SMA(period)
+        self.squares = deque()
+        self.total2 = 0.0
+
+    def update(self, value):
+        middle = self.sma.update(value)
+        square = value * value
+        self.squares.append(square)
+        self.total2 += square
+        if len(self.squares) < self.period:
+            return NAN, NAN, NAN
+        mean2 = self.total2 / self.period
+        self.total2 -= self.squares.popleft()
+        mean2 -= middle * middle
+        std = math.sqrt(mean2) if not mean2 < 0.00000001 else 0.0
+        band = std * self.nbdev
+        return middle + band, middle, middle - band
+
+class STOCH:
+    """TA-Lib STOCH(fastk=5, slowk=3 SMA, slowd=3 SMA)."""
+
+    def __init__(self, fastk=5, slowk=3, slowd=3):
+        self.highest = RollingMax(fastk)
+        self.lowest = RollingMin(fastk)
+        self.slowk = SMA(slowk)
+        self.slowd = SMA(slowd)
+
+    def update(self, high, low, close):
+        hh = self.highest.update(high)
+        ll = self.lowest.update(low)
+        if math.isnan(hh):
+            return NAN, NAN
+        diff = (hh - ll) / 100.0
+        fastk = (close - ll) / diff if diff != 0 else 0.0
+        k = self.slowk.update(fastk)
+        if math.isnan(k):
+            return NAN, NAN
+        d = self.slowd.update(k)
+        if math.isnan(d):
+            return NAN, NAN
+        return k, d
+
+class WILLR:
+    def __init__(self, period=14):
+        self.highest = RollingMax(period)
+        self.lowest = RollingMin(period)
+
+    def update(self, high, low, close):
+        hh = self.highest.update(high)
+        ll = self.lowest.update(low)
+        if math.isnan(hh):
+            return NAN
+        diff = (hh - ll) / (-100.0)
+        return (hh - close) / diff if diff != 0 else 0.0
+
+class CCI:
+    """TA-Lib CCI: mean deviation over the typical-price window (O(period) per bar)."""
+
+    def __init__(self, period=14):
+        self.period = period
+        self.prices = deque(maxlen=period)
+
+    def update(self, high, low, close):
+        typical = (high + low + close) / 3
+        self.prices.append(typical)
+        if len(self.prices) < self.period:
+            return NAN
+        average = sum(self.prices) / self.period
+        deviation = sum(abs(p - average) for p in self.prices)
+        diff = typical - average
+        if diff != 0.0 and deviation != 0.0:
+            return diff / (0.015 * (deviation / self.period))
+        return 0.0
+
+class MFI:
+    """TA-Lib MFI: running positive/negative money flow over the last `period` changes."""
+
+    def __init__(self, period=14):
+        self.period = period
+        self.prev_typical = None
+        self.flows = deque()
+        self.pos = 0.0
+        self.neg = 0.0
+
+    def update(self, high, low, close, volume):
+        typical = (high + low + close) / 3
+        if self.prev_typical is None:
+            self.prev_typical = typical
+            return NAN
+        if len(self.flows) == self.period:
+            old_pos, old_neg = self.flows.popleft()
+            self.pos -= old_pos
+            self.neg -= old_neg
+        change = typical - self.prev_typical
+        self.prev_typical = typical
+        flow = typical * volume
+        if change < 0:
+            self.flows.append((0.0, flow))
+            self.neg += flow
+        elif change > 0:
+            self.flows.append((flow, 0.0))
+            self.pos += flow
+        else:
+            self.flows.append((0.0, 0.0))
+        if len(self.flows) < self.period:
+            return NAN
+        total = self.pos + self.neg
+        return 0.0 if total < 1.0 else 100.0 * (self.pos / total)
+
+class OBV:
+    def __init__(self):
+        self.prev_close = None
+        self.value = NAN
+
+    def update(self, close, volume):
+        if self.prev_close is None:
+            self.value = volume
+        elif close > self.prev_close:
+            self.value += volume
+        elif close < self.prev_close:
+            self.value -= volume
+        self.prev_close = close
+        return self.value
+
+# --- Per-symbol feature stream ---
+
+class FeatureStream:
+    """All streaming indicators for one symbol; update() returns that bar's feature row."""
+
+    def __init__(self):
+        self.last_timestamp = None
+        self.closes = deque(maxlen=13)
+        self.close_mean = {w: RollingMean(w) for w in feature_registry.WINDOWS}
+        self.close_std = {w: RollingStd(w) for w in feature_registry.WINDOWS}
+        self.hl_mean = {w: RollingMean(w) for w in feature_registry.WINDOWS}
+        self.volume_mean = {w: RollingMean(w) for w in feature_registry.WINDOWS}
+        self.volume_std = {w: RollingStd(w) for w in feature_registry.WINDOWS}
+        self.rsi = RSI(14)
+        self.ema_12 = EMA(12)
+        self.ema_26 = EMA(26)
+        self.macd = MACD(12, 26, 9)
+        self.bbands = BBANDS(20, 2.0)
+        self.atr = ATR(14)
+        self.adx = ADX(14)
+        self.stoch = STOCH(5, 3, 3)
+        self.willr = WILLR(14)
+        self.cci = CCI(14)
+        self.mfi = MFI(14)
+        self.obv = OBV()
+        self.close_max_20 = RollingMax(20)
+        self.close_min_20 = RollingMin(20)
+        self.volume_mean_20 = RollingMean(20)
+        self.return_std_14 = RollingStd(14)
+
+    def update(self, timestamp, open_, high, low, close, volume):
+        row = {}
+        self.closes.append(close)
+        for lag in [1, 3, 6, 12]:
+            row[f'return_{lag}'] = close / self.closes[-1 - lag] - 1 if len(self.closes) > lag else NAN
+
+        for win in feature_registry.WINDOWS:
+            mean = self.close_mean[win].update(close)
+            std = self.close_std[win].update(close)
+            row[f'close_mean_{win}'] = mean
+            row[f'close_std_{win}'] = std
+            row[f'close_z_{win}'] = divide(close - mean, std)
+            row[f'hl_range_{win}'] = self.hl_mean[win].update(high - low) / close
+        for win in feature_registry.WINDOWS:
+            row[f'volume_mean_{win}'] = self.volume_mean[win].update(volume)
+            row[f'volume_std_{win}'] = self.volume_std[win].update(volume)
+
+        row['rsi_14'] = self.rsi.update(close)
+        row['ema_12'] = self.ema_12.update(close)
+        row['ema_26'] = self.ema_26.update(close)
+        row['macd'], row['macd_signal'], row['macd_hist'] = self.macd.update(close)
+        upper, middle, lower = self.bbands.update(close)
+        row['bb_upper_20'], row['bb_middle_20'], row['bb_lower_20'] = upper, middle, lower
+        row['bb_width_20'] = divide(upper - lower, middle)
+        row['atr_14'] = self.atr.update(high, low, close)
+        row['adx_14'] = self.adx.update(high, low, close)
+        row['stoch_k'], row['stoch_d'] = self.stoch.update(high, low, close)
+        row['willr_14'] = self.willr.update(high, low, close)
+        row['cci_14'] = self.cci.update(high, low, close)
+        row['mfi_14'] = self.mfi.update(high, low, close, volume)
+        row['obv'] = self.obv.update(close, volume)
+
+        ts = pd.Timestamp(timestamp)
+        row['hour'] = ts.hour
+        row['dayofweek'] = ts.dayofweek
+
+        close_max = self.close_max_20.update(close)
+        row['drawdown_20'] = close / close_max - 1
+        ret = row['return_1']
+        row['rolling_std_14'] = self.return_std_14.update(ret) if not math.isnan(ret) else NAN
+        row['low_vol_liquidity'] = int(volume < self.volume_mean_20.update(volume) * 0.5)
+        row['rolling_max_20'] = close_max
+        row['rolling_min_20'] = self.close_min_20.update(close)
+
+        self.last_timestamp = ts
+        return row
+
+    def update_frame(self, df):
+        """Feed a cleaned, time-sorted OHLCV frame; returns one feature row per bar."""
+        rows = [
+            self.update(ts, o, h, l, c, v)
+            for ts, o, h, l, c, v in zip(df['timestamp'], df['open'].to_numpy(float), df['high'].to_numpy(float),
+                                         df['low'].to_numpy(float), df['close'].to_numpy(float),
+                                         df['volume'].to_numpy(float))
+        ]
+        out = pd.DataFrame(rows, columns=STREAM_COLUMNS, index=df.index)
+        return pd.concat([df, out], axis=1)
+
+def save_stream(stream, path):
+    joblib.dump(stream, path)
+
+def load_stream(path):
+    return joblib.load(path) if os.path.exists(path) else FeatureStream()
+
+# --- Validation against the batch (TA-Lib) path ---
+
+def validate_against_batch(df, rtol=1e-9, atol=1e-9):
+    """Compare streaming outputs to compute_features() on the same cleaned bars.
+
+    Returns one row per column with the worst absolute/relative error and the
+    number of bars where one side is NaN and the other is not.
+    """
+    batch = compute_features(df)
+    streamed = FeatureStream().update_frame(df)
+    report = []
+    for col in STREAM_COLUMNS:
+        b = batch[col].to_numpy(float)
+        s = streamed[col].to_numpy(float)
+        both = ~np.isnan(b) & ~np.isnan(s)
+        nan_mismatch = int((np.isnan(b) != np.isnan(s)).sum())
+        abs_err = np.abs(b[both] - s[both])
+        rel_err = abs_err / np.maximum(np.abs(b[both]), 1e-300)
+        report.append({
+            'column': col,
+            'compared': int(both.sum()),
+            'nan_mismatch': nan_mismatch,
+            'max_abs_err': float(abs_err.max()) if both.any() else 0.0,
+            'max_rel_err': float(rel_err.max()) if both.any() else 0.0,
+            'ok': nan_mismatch == 0 and bool(np.allclose(s[both], b[both], rtol=rtol, atol=atol))
+        })
+    return pd.DataFrame(report)
+
+# --- Live update ---
+
+def update_symbol_stream(symbol_folder, timeframe):
+    """Feed closed bars newer than the saved snapshot and return the newest feature row (or None).
+
+    A bar is fed exactly once, so the still-forming bar is left out until it has closed.
+    """
+    state_path = os.path.join(DATA_DIR, symbol_folder, STATE_TEMPLATE.format(tf=timeframe))
+    stream = load_stream(state_path)
+    start = None if stream.last_timestamp is None else stream.last_timestamp + pd.Timedelta(microseconds=1)
+    end = pd.Timestamp(ohlcv_store.latest_closed_bar_ms(timeframe), unit='ms', tz='UTC')
+    df = ohlcv_store.read_bars(symbol_folder, timeframe, root=DATA_DIR, start=start, end=end)
+    if df.empty:
+        return None
+    df = df[~bad_bar_mask(df)].reset_index(drop=True)
+    if df.empty:
+        return None
+    rows = stream.update_frame(df)
+    save_stream(stream, state_path)
+    return rows.iloc[-1]
+
+def live_features_path(timeframe):
+    return os.path.join(DATA_DIR, LIVE_FEATURES_TEMPLATE.format(tf=timeframe))
+
+def update_streams(timeframe):
+    """Newest feature row of every symbol folder, written to live_features_path() for
+    `inference_timeframe.py --live` and `trade_ideas_logger.py --live`."""
+    live_rows = []
+    for symbol_folder in sorted(os.listdir(DATA_DIR)):
+        if not os.path.isdir(os.path.join(DATA_DIR, symbol_folder)):
+            continue
+        row = update_symbol_stream(symbol_folder, timeframe)
+        if row is not None:
+            live_rows.append(row)
+    live_df = pd.DataFrame(live_rows).reset_index(drop=True)
+    out_path = live_features_path(timeframe)
+    live_df.to_parquet(out_path, index=False)
+    print(f"Live features for {len(live_df)} symbols saved to: {out_path}")
+    return live_df
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python streaming_indicators.py [timeframe]")
+        sys.exit(1)
+    update_streams(sys.argv[1])
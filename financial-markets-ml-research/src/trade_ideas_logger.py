@@ -5,6 +5,7 @@ import numpy as np
 import json
 import uuid
 from filelock import FileLock, Timeout
+from inference_timeframe import features_file, load_features_with_predictions
 
 FEATURES_DIR = 'ohlcv_parquet'
 TRADE_LOG_DIR = 'trade_ideas_logs'
@@ -51,8 +52,9 @@ def save_json_state(obj, filepath, lock_path):
         with open(filepath, "w") as f:
             json.dump(obj, f, indent=2)
 
-def log_trade_ideas_live(timeframe):
-    features_path = os.path.join(FEATURES_DIR, f"{timeframe}_features.parquet")
+def log_trade_ideas_live(timeframe, live=False):
+    # live: newest bars from the streaming indicator engine instead of the batch features file
+    features_path = features_file(timeframe, live, FEATURES_DIR)
     log_path = os.path.join(TRADE_LOG_DIR, f"trade_ideas_{timeframe}.csv")
     state_filename = f"state_{timeframe}.json"
     positions_filename = f"positions_{timeframe}.json"
@@ -60,7 +62,7 @@ def log_trade_ideas_live(timeframe):
     if not os.path.exists(features_path):
         print(f"Features file not found: {features_path}")
         return
-    df = pd.read_parquet(features_path)
+    df = load_features_with_predictions(timeframe, live=live)
     if 'pred_up' not in df.columns or 'proba_up' not in df.columns:
         print(f"Missing predictions in: {features_path}")
         return
@@ -249,8 +251,8 @@ def log_trade_ideas_live(timeframe):
     save_json_state(open_positions_global, OPEN_POSITIONS_GLOBAL_PATH, OPEN_POSITIONS_LOCK_PATH)
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python trade_ideas_logger.py [timeframe]")
+    if len(sys.argv) not in (2, 3) or (len(sys.argv) == 3 and sys.argv[2] != "--live"):
+        print("Usage: python trade_ideas_logger.py [timeframe] [--live]")
         sys.exit(1)
     tf = sys.argv[1]
-    log_trade_ideas_live(tf)
+    log_trade_ideas_live(tf, live=len(sys.argv) == 3)
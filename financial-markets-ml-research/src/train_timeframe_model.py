@@ -1,18 +1,49 @@
 import sys
 import os
+import argparse
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
+import pyarrow.parquet as pq
 import numpy as np
 import joblib
 import xgboost as xgb
 from sklearn.model_selection import TimeSeriesSplit
 from sklearn.feature_selection import RFECV
 from sklearn.metrics import accuracy_score, roc_auc_score, confusion_matrix
+import ohlcv_store
+import model_lineage
+import model_registry
+import training_cache
+import validation_metrics
 
 FEATURES_DIR = "ohlcv_parquet"
 MODEL_DIR = "models"
 COVERAGE_CSV = "symbol_timeframe_coverage.csv"
 VALIDATION_RESULTS_DIR = "validation_results"
 MIN_BARS = 1000
+# Feature selection: "rfecv" (step=1, ~n_features x 5 fits), "rfecv_step" (drops a fraction per round)
+# or "importance" (gain ranking from cached fold models, then a halving ladder of top-k subsets)
+SELECTION_STRATEGY = "rfecv"
+SELECTION_STRATEGIES = ["rfecv", "rfecv_step", "importance"]
+RFECV_STEP_FRACTION = 0.2
+MIN_FEATURES_TO_SELECT = 5
+# Scheduler: per-symbol models run in a process pool, each job limited to THREADS_PER_JOB threads.
+# TRAIN_DEVICE "auto" uses CUDA when a GPU is usable and falls back to CPU otherwise.
+TRAIN_DEVICE = "auto"
+THREADS_PER_JOB = 2
+CHECKPOINT_DIR = os.path.join(MODEL_DIR, "checkpoints")
+# Incremental retraining: warm-start WARM_START_TREES extra trees on rows newer than the artifact's
+# trained_until; refit from scratch when max feature PSI exceeds DRIFT_PSI_THRESHOLD or after
+# MAX_WARM_STARTS consecutive warm starts (which also bounds model growth)
+MIN_NEW_ROWS = 20
+WARM_START_TREES = 10
+DRIFT_PSI_THRESHOLD = 0.25
+MAX_WARM_STARTS = 48
+# Set per process by configure_training(); RFECV folds run serially inside the thread budget
+XGB_DEVICE = "cuda"
+XGB_N_JOBS = None
 os.makedirs(MODEL_DIR, exist_ok=True)
 os.makedirs(VALIDATION_RESULTS_DIR, exist_ok=True)
 
@@ -42,49 +73,347 @@ def compute_validation_metrics(y_true, y_pred, y_prob, test_df):
     metrics.update({'tp':tp, 'fp':fp, 'tn':tn, 'fn':fn})
 
     return metrics
-#Switching to XGB
-def train_xgb_model(X_train, y_train, X_test, y_test):
-    tscv = TimeSeriesSplit(n_splits=5)
-    rfecv_estimator = xgb.XGBClassifier(
+def resolve_device(requested=TRAIN_DEVICE):
+    """'cuda' if a one-tree fit succeeds on the GPU, else 'cpu' (requested 'cpu' is returned as-is)."""
+    if requested == "cpu":
+        return "cpu"
+    try:
+        xgb.XGBClassifier(tree_method="hist", device="cuda", n_estimators=1).fit(np.array([[0.0], [1.0]]), [0, 1])
+        return "cuda"
+    except Exception as e:
+        print(f"[WARN] CUDA unavailable ({type(e).__name__}), training on CPU")
+        return "cpu"
+
+def configure_training(device, n_threads):
+    """Pin this process's XGBoost device and thread count (also the process pool initializer);
+    the thread count reaches XGBoost as n_jobs in xgb_classifier()."""
+    global XGB_DEVICE, XGB_N_JOBS
+    XGB_DEVICE, XGB_N_JOBS = device, n_threads
+
+def xgb_classifier(n_estimators):
+    return xgb.XGBClassifier(
         tree_method="hist",
-        device="cuda",
-        n_estimators=25,
+        device=XGB_DEVICE,
+        n_jobs=XGB_N_JOBS,
+        n_estimators=n_estimators,
         random_state=42,
         eval_metric='logloss'
     )
+
+def select_features_rfecv(X_train, y_train, step=1):
     selector = RFECV(
-        rfecv_estimator,
-        step=1,
-        cv=tscv,
+        xgb_classifier(25),
+        step=step,
+        cv=TimeSeriesSplit(n_splits=5),
         scoring='accuracy',
-        min_features_to_select=5,
-        n_jobs=-1
+        min_features_to_select=MIN_FEATURES_TO_SELECT,
+        n_jobs=1
     )
     selector.fit(X_train, y_train)
-    selected_features = X_train.columns[selector.support_].tolist()
-    final_model = xgb.XGBClassifier(
-        tree_method="hist",
-        device="cuda",
-        n_estimators=100,
-        random_state=42,
-        eval_metric='logloss'
-    )
+    return X_train.columns[selector.support_].tolist()
+
+def cv_accuracy(X_train, y_train, features, folds):
+    scores = []
+    for train_idx, val_idx in folds:
+        model = xgb_classifier(25)
+        model.fit(X_train.iloc[train_idx][features], y_train.iloc[train_idx])
+        scores.append(accuracy_score(y_train.iloc[val_idx], model.predict(X_train.iloc[val_idx][features])))
+    return float(np.mean(scores))
+
+def select_features_importance(X_train, y_train):
+    """Rank by mean gain over the TimeSeriesSplit fold models, then keep the best-scoring top-k.
+
+    The full-feature fold models are fitted once and reused for both the ranking and the
+    score of the full set; smaller candidates halve k down to MIN_FEATURES_TO_SELECT.
+    """
+    folds = list(TimeSeriesSplit(n_splits=5).split(X_train))
+    columns = X_train.columns.tolist()
+    gain = pd.Series(0.0, index=columns)
+    full_scores = []
+    for train_idx, val_idx in folds:
+        model = xgb_classifier(25)
+        model.fit(X_train.iloc[train_idx], y_train.iloc[train_idx])
+        gain = gain.add(pd.Series(model.get_booster().get_score(importance_type='gain')), fill_value=0.0)
+        full_scores.append(accuracy_score(y_train.iloc[val_idx], model.predict(X_train.iloc[val_idx])))
+    ranked = gain.reindex(columns).fillna(0.0).sort_values(ascending=False, kind='stable').index.tolist()
+
+    best_features, best_score = columns, float(np.mean(full_scores))
+    k = len(columns) // 2
+    while k >= MIN_FEATURES_TO_SELECT:
+        score = cv_accuracy(X_train, y_train, ranked[:k], folds)
+        if score >= best_score:  # ties go to the smaller set
+            best_features, best_score = ranked[:k], score
+        k //= 2
+    return [c for c in columns if c in best_features]
+
+def select_features(X_train, y_train, strategy=SELECTION_STRATEGY):
+    if strategy == "rfecv":
+        return select_features_rfecv(X_train, y_train, step=1)
+    if strategy == "rfecv_step":
+        return select_features_rfecv(X_train, y_train, step=RFECV_STEP_FRACTION)
+    if strategy == "importance":
+        return select_features_importance(X_train, y_train)
+    raise ValueError(f"Unknown selection strategy: {strategy}")
+
+#Switching to XGB
+def train_xgb_model(X_train, y_train, X_test, y_test, selection=SELECTION_STRATEGY):
+    selected_features = select_features(X_train, y_train, selection)
+    final_model = xgb_classifier(100)
     final_model.fit(X_train[selected_features], y_train)
     y_pred = final_model.predict(X_test[selected_features])
     y_prob = final_model.predict_proba(X_test[selected_features])[:,1]
     return final_model, selected_features, y_pred, y_prob
 
-def train_model_for_timeframe(timeframe):
-    features_path = os.path.join(FEATURES_DIR, f"{timeframe}_features.parquet")
+def refit_all_rows(X, y, features):
+    """Refit the selected features on every row once the holdout has scored them.
+
+    The saved model then covers the holdout too, so trained_until is the last row and
+    incremental updates only warm-start on, and measure drift over, bars it has never seen.
+    """
+    model = xgb_classifier(100)
+    model.fit(X[features], y)
+    return model
+
+def feature_columns(columns):
+    drop_cols = ['timestamp', 'symbol', 'timeframe', 'target_return_1', 'target_up']
+    return [col for col in columns if col not in drop_cols and not col.startswith('target_')]
+
+def load_training_frame(features_path, timeframe, name='main'):
+    """Training rows for 'main' (all symbols) or one symbol, via the binary matrix cache."""
+    features = feature_columns(pq.read_schema(features_path).names)
+    return training_cache.load_frame(features_path, timeframe, name, features)
+
+def features_fingerprint(features_path, selection):
+    stat = os.stat(features_path)
+    return {'features_file': os.path.basename(features_path), 'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns, 'selection': selection}
+
+def checkpoint_path(timeframe, name):
+    return os.path.join(CHECKPOINT_DIR, timeframe, f"{ohlcv_store.symbol_key(name)}.json")
+
+def load_checkpoint(timeframe, name, fingerprint, model_path):
+    """Validation records of a finished job, if it ran on the same features and its model exists."""
+    path = checkpoint_path(timeframe, name)
+    if not os.path.exists(path) or not os.path.exists(model_path):
+        return None
+    with open(path, "r") as f:
+        checkpoint = json.load(f)
+    return checkpoint['records'] if checkpoint.get('fingerprint') == fingerprint else None
+
+def save_checkpoint(timeframe, name, fingerprint, records):
+    path = checkpoint_path(timeframe, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump({'fingerprint': fingerprint, 'records': records}, f, default=float)
+    os.replace(path + ".tmp", path)
+
+def symbol_model_path(timeframe, symbol):
+    return model_registry.model_path(timeframe, symbol, MODEL_DIR)
+
+def fit_symbol_model(timeframe, symbol, sdf, selection, features_path, mode='full', lineage=None):
+    """Select, fit and save one per-symbol model on time-sorted rows; returns its validation records."""
+    feature_cols = feature_columns(sdf.columns)
+    Xs = sdf[feature_cols]
+    ys = sdf['target_up']
+    split_s = int(len(sdf) * 0.7)
+    X_train_s, X_test_s = Xs.iloc[:split_s], Xs.iloc[split_s:]
+    y_train_s, y_test_s = ys.iloc[:split_s], ys.iloc[split_s:]
+    test_sdf = sdf.iloc[split_s:]
+    print(f"[INFO] Training model for symbol: {symbol} ({len(sdf)} bars)")
+    _, sym_features, sym_y_pred, sym_y_prob = train_xgb_model(X_train_s, y_train_s, X_test_s, y_test_s, selection)
+    sym_model_path = symbol_model_path(timeframe, symbol)
+    save_fitted_model(refit_all_rows(Xs, ys, sym_features), sym_features, Xs, sdf['timestamp'].iloc[-1],
+                      timeframe, symbol, features_path, mode, lineage)
+    print(f"[DONE] {symbol}: Model saved to {sym_model_path}")
+
+    # Per-symbol model validation
+    sym_val_metrics = compute_validation_metrics(y_test_s, sym_y_pred, sym_y_prob, test_sdf)
+    return [{
+        'symbol': symbol,
+        'timeframe': timeframe,
+        'model': 'per_symbol',
+        **sym_val_metrics
+    }]
+
+def save_artifact(artifact, timeframe, symbol=None):
+    """Write an artifact to its model path and index it in the model registry."""
+    joblib.dump(artifact, model_registry.model_path(timeframe, symbol, MODEL_DIR))
+    model_registry.register(artifact, timeframe, symbol, MODEL_DIR)
+
+def save_fitted_model(model, features, X_train, trained_until, timeframe, symbol, features_path, mode, lineage=None):
+    """Save a freshly fitted model (symbol None = main) with a new drift reference and an appended lineage entry."""
+    model_path = model_registry.model_path(timeframe, symbol, MODEL_DIR)
+    if lineage is None and os.path.exists(model_path):
+        lineage = joblib.load(model_path).get('lineage', [])
+    entry = model_lineage.lineage_entry(mode, model, len(X_train), trained_until, os.path.basename(features_path))
+    artifact = model_lineage.make_artifact(model, features, trained_until,
+                                           model_lineage.reference_histograms(X_train[features]),
+                                           (lineage or []) + [entry])
+    save_artifact(artifact, timeframe, symbol)
+
+def train_symbol_job(timeframe, symbol, features_path, selection, fingerprint):
+    """Worker entry point: one per-symbol model, errors and timing captured instead of raised."""
+    started = time.perf_counter()
+    result = {'symbol': symbol, 'status': 'ok', 'rows': 0, 'seconds': 0.0, 'error': '', 'records': []}
+    try:
+        # Cached per-symbol matrix; on a miss the symbol filter reads just its row group of an aggregated file
+        sdf = load_training_frame(features_path, timeframe, symbol)
+        result['rows'] = len(sdf)
+        if len(sdf) < MIN_BARS:
+            print(f"[SKIP] {symbol} actual bars: {len(sdf)} < {MIN_BARS}")
+            result['status'] = 'skipped'
+        else:
+            result['records'] = fit_symbol_model(timeframe, symbol, sdf, selection, features_path)
+        save_checkpoint(timeframe, symbol, fingerprint, result['records'])
+    except Exception as e:
+        result['status'], result['error'] = 'error', f"{type(e).__name__}: {e}"
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+def run_symbol_jobs(timeframe, symbols, features_path, selection, fingerprint, device, jobs, threads_per_job, resume=True):
+    """Train per-symbol models concurrently; symbols with a matching checkpoint are not retrained."""
+    results = []
+    pending = []
+    for symbol in symbols:
+        records = load_checkpoint(timeframe, symbol, fingerprint, symbol_model_path(timeframe, symbol)) if resume else None
+        if records is not None:
+            results.append({'symbol': symbol, 'status': 'resumed', 'rows': None, 'seconds': 0.0,
+                            'error': '', 'records': records})
+        else:
+            pending.append(symbol)
+    print(f"[INFO] {len(pending)} per-symbol jobs ({len(results)} resumed) on {jobs} processes "
+          f"x {threads_per_job} threads ({device})")
+    if jobs == 1:
+        configure_training(device, threads_per_job)
+        results += [train_symbol_job(timeframe, s, features_path, selection, fingerprint) for s in pending]
+    elif pending:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=configure_training,
+                                 initargs=(device, threads_per_job)) as pool:
+            futures = [pool.submit(train_symbol_job, timeframe, s, features_path, selection, fingerprint)
+                       for s in pending]
+            results += [future.result() for future in as_completed(futures)]
+
+    for result in results:
+        if result['status'] == 'error':
+            print(f"[ERROR] {result['symbol']}: {result['error']}")
+    timings = pd.DataFrame(results, columns=['symbol', 'status', 'rows', 'seconds', 'error', 'records'])
+    counts = timings['status'].value_counts().to_dict() if not timings.empty else {}
+    print(f"[DONE] Per-symbol training: {counts}")
+    return timings
+
+def update_model(timeframe, name, model_path, features_path, selection):
+    """Incrementally update one artifact ('main' or a symbol): unchanged, warm_start or refit.
+
+    The previous model is first scored on the new rows, which it has never seen, so the
+    returned accuracy/auc are out-of-sample whatever action follows.
+    """
+    started = time.perf_counter()
+    status = {'model': name, 'action': 'unchanged', 'new_rows': 0, 'max_psi': np.nan, 'drift_feature': None,
+              'accuracy_before': np.nan, 'auc_before': np.nan, 'seconds': 0.0, 'error': ''}
+    try:
+        artifact = joblib.load(model_path)
+        symbol_filter = [] if name == 'main' else [('symbol', '==', name)]
+        if 'trained_until' not in artifact:
+            status['action'] = 'refit'  # artifact predates lineage tracking
+            new = pd.DataFrame()
+        else:
+            new = pd.read_parquet(features_path, filters=symbol_filter + [('timestamp', '>', artifact['trained_until'])])
+            new = new.sort_values('timestamp')
+            status['new_rows'] = len(new)
+        if status['action'] != 'refit' and len(new) >= MIN_NEW_ROWS:
+            model, features = artifact['model'], artifact['features']
+            X_new, y_new = new[features], new['target_up']
+            prob = model.predict_proba(X_new)[:, 1]
+            before = compute_validation_metrics(y_new, (prob >= 0.5).astype(int), prob, new)
+            status['accuracy_before'], status['auc_before'] = before['accuracy'], before['auc']
+            psi = model_lineage.population_stability(artifact['reference'], X_new)
+            if len(psi):
+                status['max_psi'], status['drift_feature'] = psi.max(), psi.idxmax()
+            if status['max_psi'] > DRIFT_PSI_THRESHOLD or model_lineage.warm_starts_since_fit(artifact['lineage']) >= MAX_WARM_STARTS:
+                status['action'] = 'refit'
+            else:
+                status['action'] = 'warm_start'
+                updated = xgb_classifier(WARM_START_TREES)
+                updated.fit(X_new, y_new, xgb_model=model.get_booster())
+                trained_until = new['timestamp'].iloc[-1]
+                entry = model_lineage.lineage_entry('warm_start', updated, len(new), trained_until,
+                                                    os.path.basename(features_path), max_psi=float(status['max_psi']))
+                save_artifact(model_lineage.make_artifact(updated, features, trained_until, artifact['reference'],
+                                                          artifact['lineage'] + [entry]),
+                              timeframe, None if name == 'main' else name)
+
+        if status['action'] == 'refit':
+            lineage = artifact.get('lineage', [])
+            if name == 'main':
+                df = load_training_frame(features_path, timeframe)
+                train_main_model(timeframe, df, df['symbol'].unique(), model_path, selection, features_path,
+                                 mode='refit', lineage=lineage)
+            else:
+                sdf = load_training_frame(features_path, timeframe, name)
+                fit_symbol_model(timeframe, name, sdf, selection, features_path, mode='refit', lineage=lineage)
+    except Exception as e:
+        status['action'], status['error'] = 'error', f"{type(e).__name__}: {e}"
+    status['seconds'] = time.perf_counter() - started
+    return status
+
+def retrain_incremental(timeframe, features_path, selection, device, jobs, threads_per_job):
+    """Update the main model and every existing per-symbol model from their last trained_until.
+
+    Symbols without a model are left to the next full run. Writes
+    validation_results/incremental_retrain_<tf>.csv.
+    """
+    started = time.perf_counter()
+    configure_training(device, os.cpu_count() or 1)
+    statuses = [update_model(timeframe, 'main', model_registry.model_path(timeframe, model_dir=MODEL_DIR),
+                             features_path, selection)]
+    symbols = [s for s in pd.read_parquet(features_path, columns=['symbol'])['symbol'].unique()
+               if os.path.exists(symbol_model_path(timeframe, s))]
+    if jobs == 1:
+        configure_training(device, threads_per_job)
+        statuses += [update_model(timeframe, s, symbol_model_path(timeframe, s), features_path, selection) for s in symbols]
+    elif symbols:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=configure_training,
+                                 initargs=(device, threads_per_job)) as pool:
+            futures = [pool.submit(update_model, timeframe, s, symbol_model_path(timeframe, s), features_path, selection)
+                       for s in symbols]
+            statuses += [future.result() for future in as_completed(futures)]
+
+    report = pd.DataFrame(statuses)
+    for _, row in report[report['action'] == 'error'].iterrows():
+        print(f"[ERROR] {row['model']}: {row['error']}")
+    report_path = os.path.join(VALIDATION_RESULTS_DIR, f"incremental_retrain_{timeframe}.csv")
+    report.to_csv(report_path, index=False)
+    print(f"[DONE] Incremental retrain of {len(report)} models in {time.perf_counter() - started:.1f}s: "
+          f"{report['action'].value_counts().to_dict()} -> {report_path}")
+    return report
+
+def train_model_for_timeframe(timeframe, features_file=None, selection=SELECTION_STRATEGY,
+                              device=TRAIN_DEVICE, jobs=None, threads_per_job=THREADS_PER_JOB, resume=True,
+                              incremental=False):
+    # features_file selects e.g. <tf>_mtf_features.parquet (cross_timeframe_join.py output)
+    features_path = os.path.join(FEATURES_DIR, features_file or f"{timeframe}_features.parquet")
     if not os.path.exists(features_path):
         print(f"Features file not found: {features_path}")
         return
 
+    device = resolve_device(device)
+    thread_budget = os.cpu_count() or 1
+    jobs = jobs or max(1, thread_budget // threads_per_job)
+    if incremental and not os.path.exists(model_registry.model_path(timeframe, model_dir=MODEL_DIR)):
+        print(f"[INFO] No main model for {timeframe} yet, running a full training")
+    elif incremental:
+        return retrain_incremental(timeframe, features_path, selection, device, jobs, threads_per_job)
+    fingerprint = features_fingerprint(features_path, selection)
+
     print(f"[INFO] Loading features from: {features_path}")
-    df = pd.read_parquet(features_path)
+    df = load_training_frame(features_path, timeframe)
 
-    # Load coverage info
-    if os.path.exists(COVERAGE_CSV):
+    # Load coverage info: the OHLCV manifest first (no bar data read), then the coverage CSV
+    manifest_coverage = ohlcv_store.coverage_frame(timeframe, root=FEATURES_DIR)
+    if not manifest_coverage.empty:
+        covered_symbols = set(manifest_coverage[manifest_coverage['n_bars'] >= MIN_BARS]['symbol'])
+        print(f"[INFO] {len(covered_symbols)} symbols with sufficient bars for {timeframe} (manifest)")
+    elif os.path.exists(COVERAGE_CSV):
         coverage_df = pd.read_csv(COVERAGE_CSV)
         covered_symbols = set(coverage_df[
             (coverage_df['timeframe'] == timeframe) & (coverage_df['n_bars'] >= MIN_BARS)
@@ -97,9 +426,43 @@ def train_model_for_timeframe(timeframe):
     symbols = df['symbol'].unique()
     print(f"[INFO] Training on {len(symbols)} symbols: {symbols}")
 
+    # Save main model and validation
+    model_path = model_registry.model_path(timeframe, model_dir=MODEL_DIR)
+    validation_records = load_checkpoint(timeframe, "main", fingerprint, model_path) if resume else None
+    if validation_records is not None:
+        print(f"[INFO] Main model for {timeframe} is up to date (checkpoint), skipping")
+    else:
+        # The main model gets the whole thread budget before the per-symbol pool starts
+        configure_training(device, thread_budget)
+        validation_records = train_main_model(timeframe, df, symbols, model_path, selection, features_path)
+        save_checkpoint(timeframe, "main", fingerprint, validation_records)
+    del df
+
+    # --- Per-symbol models ---
+    eligible = []
+    for symbol in symbols:
+        if symbol not in covered_symbols:
+            print(f"[SKIP] {symbol} does not have sufficient bars for {timeframe} (skipped)")
+            continue
+        eligible.append(symbol)
+    timings = run_symbol_jobs(timeframe, eligible, features_path, selection, fingerprint,
+                              device, jobs, threads_per_job, resume=resume)
+    by_symbol = dict(zip(timings['symbol'], timings['records']))
+    for symbol in eligible:
+        validation_records.extend(by_symbol.get(symbol) or [])
+
+    # --- Save all validation results to CSV ---
+    validation_df = pd.DataFrame(validation_records)
+    validation_path = os.path.join(VALIDATION_RESULTS_DIR, f"model_validation_{timeframe}.csv")
+    validation_df.to_csv(validation_path, index=False)
+    if not validation_df.empty:
+        model_registry.attach_metrics(timeframe, validation_df, MODEL_DIR)
+    print(f"[DONE] Validation metrics saved to {validation_path}")
+
+def train_main_model(timeframe, df, symbols, model_path, selection, features_path, mode='full', lineage=None):
+    """Fit and save the multi-symbol model; returns its per-symbol validation records."""
     df = df.sort_values('timestamp')
-    drop_cols = ['timestamp', 'symbol', 'timeframe', 'target_return_1', 'target_up']
-    feature_cols = [col for col in df.columns if col not in drop_cols and not col.startswith('target_')]
+    feature_cols = feature_columns(df.columns)
 
     # --- Train main (multi-symbol) model ---
     X = df[feature_cols]
@@ -110,81 +473,84 @@ def train_model_for_timeframe(timeframe):
     test_df = df.iloc[split:]  # For Sharpe etc.
 
     print(f"[INFO] Training main model for timeframe {timeframe}")
-    final_model, selected_features, main_y_pred, main_y_prob = train_xgb_model(X_train, y_train, X_test, y_test)
+    _, selected_features, main_y_pred, main_y_prob = train_xgb_model(X_train, y_train, X_test, y_test, selection)
     main_metrics = compute_validation_metrics(y_test, main_y_pred, main_y_prob, test_df)
     print(f"[INFO] [ALL SYMBOLS] Metrics: {main_metrics}")
 
-    # Save main model and validation
-    model_path = os.path.join(MODEL_DIR, f"{timeframe}_model_xgboost.joblib")
-    joblib.dump({'model': final_model, 'features': selected_features}, model_path)
+    save_fitted_model(refit_all_rows(X, y, selected_features), selected_features, X, df['timestamp'].iloc[-1],
+                      timeframe, None, features_path, mode, lineage)
     print(f"[DONE] Main model saved to: {model_path}")
 
-    validation_records = []
-        # Save per-symbol main model performance as well!
-    for symbol in symbols:
-        sdf = test_df[test_df['symbol'] == symbol]
-        if len(sdf) == 0:
-            continue
+    # Per-symbol main model performance, all symbols in one grouped pass
+    codes = pd.Categorical(test_df['symbol'], categories=list(symbols)).codes
+    per_symbol = validation_metrics.grouped_validation_metrics(
+        codes, len(symbols), y_test, main_y_pred, main_y_prob, test_df['target_return_1'])
+    validation_records = [
+        {'symbol': symbol, 'timeframe': timeframe, 'model': 'main', **row.drop('n').to_dict()}
+        for symbol, (_, row) in zip(symbols, per_symbol.iterrows()) if row['n'] > 0
+    ]
+    return validation_records
 
-        # Find indices in test set (zero-based for main_y_pred)
-        test_indices = sdf.index - split
+def benchmark_selection(timeframe, features_file=None, strategies=SELECTION_STRATEGIES):
+    """Train the main model once per selection strategy and compare sets, metrics and runtime.
 
-        # Only keep those within bounds
-        valid_mask = (test_indices >= 0) & (test_indices < len(main_y_pred))
-        aligned_pred = main_y_pred[test_indices[valid_mask]]
-        aligned_prob = main_y_prob[test_indices[valid_mask]]
-        aligned_y = sdf['target_up'].iloc[valid_mask]
-        aligned_sdf = sdf.iloc[valid_mask]
+    Uses the same 70/30 time split as train_model_for_timeframe; no models are saved.
+    Writes validation_results/selection_benchmark_<tf>.csv.
+    """
+    features_path = os.path.join(FEATURES_DIR, features_file or f"{timeframe}_features.parquet")
+    df = load_training_frame(features_path, timeframe)
+    feature_cols = feature_columns(df.columns)
+    split = int(len(df) * 0.7)
+    X_train, X_test = df[feature_cols].iloc[:split], df[feature_cols].iloc[split:]
+    y_train, y_test = df['target_up'].iloc[:split], df['target_up'].iloc[split:]
 
-        if len(aligned_pred) > 0:
-            sym_metrics = compute_validation_metrics(aligned_y, aligned_pred, aligned_prob, aligned_sdf)
-            validation_records.append({
-                'symbol': symbol,
-                'timeframe': timeframe,
-                'model': 'main',
-                **sym_metrics
-            })
+    records = []
+    for strategy in strategies:
+        started = time.perf_counter()
+        _, selected, y_pred, y_prob = train_xgb_model(X_train, y_train, X_test, y_test, strategy)
+        seconds = time.perf_counter() - started
+        metrics = compute_validation_metrics(y_test, y_pred, y_prob, df.iloc[split:])
+        records.append({'strategy': strategy, 'seconds': seconds, 'n_features': len(selected),
+                        **{k: metrics[k] for k in ['accuracy', 'auc', 'sharpe', 'profit']},
+                        'features': ','.join(selected)})
+        print(f"[BENCH] {strategy}: {len(selected)} features in {seconds:.1f}s, "
+              f"accuracy={metrics['accuracy']:.4f} auc={metrics['auc']:.4f}")
 
-
-    # --- Per-symbol models ---
-    for symbol in symbols:
-        if symbol not in covered_symbols:
-            print(f"[SKIP] {symbol} does not have sufficient bars for {timeframe} (skipped)")
-            continue
-        sdf = df[df['symbol'] == symbol].copy()
-        if len(sdf) < MIN_BARS:
-            print(f"[SKIP] {symbol} actual bars: {len(sdf)} < {MIN_BARS}")
-            continue
-        Xs = sdf[feature_cols]
-        ys = sdf['target_up']
-        split_s = int(len(sdf) * 0.7)
-        X_train_s, X_test_s = Xs.iloc[:split_s], Xs.iloc[split_s:]
-        y_train_s, y_test_s = ys.iloc[:split_s], ys.iloc[split_s:]
-        test_sdf = sdf.iloc[split_s:]
-        print(f"[INFO] Training model for symbol: {symbol} ({len(sdf)} bars)")
-        sym_model, sym_features, sym_y_pred, sym_y_prob = train_xgb_model(X_train_s, y_train_s, X_test_s, y_test_s)
-        sym_model_path = os.path.join(MODEL_DIR, f"{timeframe}_{symbol}_model_xgboost.joblib")
-        joblib.dump({'model': sym_model, 'features': sym_features}, sym_model_path)
-        print(f"[DONE] {symbol}: Model saved to {sym_model_path}")
-
-        # Per-symbol model validation
-        sym_val_metrics = compute_validation_metrics(y_test_s, sym_y_pred, sym_y_prob, test_sdf)
-        validation_records.append({
-            'symbol': symbol,
-            'timeframe': timeframe,
-            'model': 'per_symbol',
-            **sym_val_metrics
-        })
-
-    # --- Save all validation results to CSV ---
-    validation_df = pd.DataFrame(validation_records)
-    validation_path = os.path.join(VALIDATION_RESULTS_DIR, f"model_validation_{timeframe}.csv")
-    validation_df.to_csv(validation_path, index=False)
-    print(f"[DONE] Validation metrics saved to {validation_path}")
+    bench = pd.DataFrame(records)
+    if 'rfecv' in bench['strategy'].values:
+        reference = set(bench.loc[bench['strategy'] == 'rfecv', 'features'].iloc[0].split(','))
+        ref_seconds = bench.loc[bench['strategy'] == 'rfecv', 'seconds'].iloc[0]
+        bench['jaccard_vs_rfecv'] = [
+            len(reference & set(f.split(','))) / len(reference | set(f.split(','))) for f in bench['features']
+        ]
+        bench['speedup_vs_rfecv'] = ref_seconds / bench['seconds']
+    out_path = os.path.join(VALIDATION_RESULTS_DIR, f"selection_benchmark_{timeframe}.csv")
+    bench.to_csv(out_path, index=False)
+    print(f"[DONE] Selection benchmark saved to {out_path}")
+    return bench
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python train_timeframe_model_xgboost.py [timeframe]")
-        sys.exit(1)
-    tf = sys.argv[1]
-    train_model_for_timeframe(tf)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train main and per-symbol XGBoost models for one timeframe.")
+    parser.add_argument("timeframe")
+    parser.add_argument("features_file", nargs="?", default=None,
+                        help="File in ohlcv_parquet to train on (default: <tf>_features.parquet)")
+    parser.add_argument("--selection", choices=SELECTION_STRATEGIES, default=SELECTION_STRATEGY,
+                        help="Feature selection strategy")
+    parser.add_argument("--benchmark-selection", action="store_true",
+                        help="Compare all selection strategies on the main model instead of training")
+    parser.add_argument("--device", choices=["auto", "cuda", "cpu"], default=TRAIN_DEVICE,
+                        help="XGBoost device; auto and cuda fall back to CPU when no GPU is usable")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Concurrent per-symbol jobs (default: CPU count / --threads-per-job)")
+    parser.add_argument("--threads-per-job", type=int, default=THREADS_PER_JOB, help="XGBoost threads per job")
+    parser.add_argument("--fresh", action="store_true", help="Ignore checkpoints and retrain every model")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Warm-start existing models on new rows; refit only on drift (see model_lineage.py)")
+    args = parser.parse_args()
+    if args.benchmark_selection:
+        configure_training(resolve_device(args.device), os.cpu_count() or 1)
+        benchmark_selection(args.timeframe, args.features_file)
+    else:
+        train_model_for_timeframe(args.timeframe, args.features_file, selection=args.selection, device=args.device,
+                                  jobs=args.jobs, threads_per_job=args.threads_per_job, resume=not args.fresh,
+                                  incremental=args.incremental)
@@ -0,0 +1,98 @@
+"""
+Binary cache of training matrices.
+
+Parsing the features Parquet and rebuilding X/y frames for the main model and
+every per-symbol model is repeated on each run although the file rarely
+changes between them. Each (timeframe, main|symbol) matrix is stored once as
+.npy arrays (features as float32, the precision XGBoost bins in anyway) and
+memory-mapped on later runs. Entries are keyed by the SHA-256 of the source
+file and the feature list, so a new features file or a changed feature set
+misses the cache automatically; stale entries for the same model are removed
+when the new one is written.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import ohlcv_store
+
+CACHE_DIR = os.path.join("cache", "training")
+HASH_CHUNK = 1 << 20
+
+def file_sha256(path):
+    """Content hash of a file, memoised by (size, mtime) so unchanged files are not re-read."""
+    stat = os.stat(path)
+    signature = [stat.st_size, stat.st_mtime_ns]
+    memo_path = os.path.join(CACHE_DIR, "hashes", os.path.basename(path) + ".json")
+    if os.path.exists(memo_path):
+        with open(memo_path, "r") as f:
+            memo = json.load(f)
+        if memo.get('path') == os.path.abspath(path) and memo.get('signature') == signature:
+            return memo['sha256']
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    os.makedirs(os.path.dirname(memo_path), exist_ok=True)
+    tmp_path = f"{memo_path}.{os.getpid()}.tmp"  # pool workers may race on the same memo
+    with open(tmp_path, "w") as f:
+        json.dump({'path': os.path.abspath(path), 'signature': signature, 'sha256': digest.hexdigest()}, f)
+    os.replace(tmp_path, memo_path)
+    return digest.hexdigest()
+
+def cache_key(source_sha256, name, features):
+    return hashlib.sha256(json.dumps([source_sha256, name, list(features)]).encode()).hexdigest()[:16]
+
+def entry_dir(timeframe, name, key):
+    return os.path.join(CACHE_DIR, timeframe, f"{ohlcv_store.symbol_key(name)}-{key}")
+
+def build_entry(features_path, path, name, features):
+    filters = None if name == 'main' else [('symbol', '==', name)]
+    df = pd.read_parquet(features_path, columns=['timestamp', 'symbol', 'target_up', 'target_return_1'] + list(features),
+                         filters=filters)
+    df = df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+    symbol_codes, symbols = pd.factorize(df['symbol'].astype(str))
+
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, "X.npy"), df[list(features)].to_numpy(dtype='float32'))
+    np.save(os.path.join(tmp_path, "y.npy"), df['target_up'].to_numpy(dtype='int8'))
+    np.save(os.path.join(tmp_path, "target_return_1.npy"), df['target_return_1'].to_numpy(dtype='float64'))
+    np.save(os.path.join(tmp_path, "timestamp.npy"), ohlcv_store.series_to_ms(df['timestamp']))
+    np.save(os.path.join(tmp_path, "symbol.npy"), symbol_codes.astype('int32'))
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump({'features': list(features), 'symbols': list(symbols), 'rows': len(df),
+                   'source': os.path.basename(features_path)}, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+def remove_stale_entries(timeframe, name, keep):
+    tf_dir = os.path.join(CACHE_DIR, timeframe)
+    prefix = ohlcv_store.symbol_key(name) + "-"
+    for entry in os.listdir(tf_dir):
+        if entry.startswith(prefix) and len(entry) == len(prefix) + 16 and os.path.join(tf_dir, entry) != keep:
+            shutil.rmtree(os.path.join(tf_dir, entry), ignore_errors=True)
+
+def load_frame(features_path, timeframe, name, features):
+    """Time-sorted training frame ('main' = all symbols) with `features` plus timestamp, symbol and targets.
+
+    Feature columns are float32 views of a memory-mapped array; rows get a RangeIndex.
+    """
+    path = entry_dir(timeframe, name, cache_key(file_sha256(features_path), name, features))
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        build_entry(features_path, path, name, features)
+        remove_stale_entries(timeframe, name, keep=path)
+    with open(os.path.join(path, "meta.json"), "r") as f:
+        meta = json.load(f)
+
+    X = np.load(os.path.join(path, "X.npy"), mmap_mode='r')
+    frame = pd.DataFrame(X, columns=meta['features'], copy=False)
+    frame['timestamp'] = pd.to_datetime(np.load(os.path.join(path, "timestamp.npy")), unit='ms', utc=True)
+    frame['symbol'] = np.asarray(meta['symbols'], dtype=object)[np.load(os.path.join(path, "symbol.npy"))]
+    frame['target_return_1'] = np.load(os.path.join(path, "target_return_1.npy"))
+    frame['target_up'] = np.load(os.path.join(path, "y.npy")).astype('int64')
+    return frame
@@ -0,0 +1,166 @@
+"""
+Walk-forward validation of the main (multi-symbol) model.
+
+The timeframe's unique bar times are cut into n_folds + 1 contiguous chunks;
+fold k tests on chunk k + 1 and trains on everything before it (expanding)
+or on the previous ROLLING_CHUNKS chunks (rolling). The last embargo_bars
+bars before each test chunk are dropped from training because their
+next-bar targets overlap the test period.
+
+Folds run in a process pool with the training scheduler's thread budget;
+each worker memory-maps the cached training matrix instead of receiving a
+pickled copy. Out-of-fold predictions are then scored for every
+(fold, symbol), every symbol over all folds and every fold over all symbols
+in grouped vectorized passes, and written to
+validation_results/walk_forward_<tf>.parquet (fold -1 = all folds,
+symbol 'ALL' = all symbols).
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import joblib
+import numpy as np
+import pandas as pd
+import model_registry
+import ohlcv_store
+import train_timeframe_model as ttm
+import validation_metrics
+
+N_FOLDS = 5
+WINDOW = "expanding"
+ROLLING_CHUNKS = 2
+EMBARGO_BARS = 1
+
+def walk_forward_folds(bar_times, n_folds=N_FOLDS, window=WINDOW, embargo_bars=EMBARGO_BARS,
+                       rolling_chunks=ROLLING_CHUNKS):
+    """Fold bounds in epoch ms (start inclusive, end exclusive) over sorted unique bar times."""
+    chunks = np.array_split(np.arange(len(bar_times)), n_folds + 1)
+    folds = []
+    for k in range(1, n_folds + 1):
+        test = chunks[k]
+        first_chunk = 0 if window == "expanding" else max(0, k - rolling_chunks)
+        train_start = chunks[first_chunk][0] if len(chunks[first_chunk]) else 0
+        train_end = test[0] - embargo_bars if len(test) else 0
+        if len(test) == 0 or train_end <= train_start:
+            continue
+        folds.append({
+            'fold': len(folds),
+            'train_start': int(bar_times[train_start]),
+            'train_end': int(bar_times[train_end]),
+            'test_start': int(bar_times[test[0]]),
+            'test_end': int(bar_times[test[-1]]) + 1
+        })
+    return folds
+
+def run_fold(features_path, timeframe, fold, features, selection):
+    """Worker entry point: fit on the fold's training rows, return positions and probabilities of its test rows."""
+    started = time.perf_counter()
+    df = ttm.load_training_frame(features_path, timeframe)
+    ms = ohlcv_store.series_to_ms(df['timestamp'])
+    train = (ms >= fold['train_start']) & (ms < fold['train_end'])
+    test = np.flatnonzero((ms >= fold['test_start']) & (ms < fold['test_end']))
+    X_train, y_train = df.loc[train, features], df.loc[train, 'target_up']
+    if selection:
+        features = ttm.select_features(X_train, y_train, selection)
+        X_train = X_train[features]
+    model = ttm.xgb_classifier(100)
+    model.fit(X_train, y_train)
+    prob = model.predict_proba(df[features].iloc[test])[:, 1]
+    return {**fold, 'rows': test, 'proba': prob, 'n_train': int(train.sum()), 'n_features': len(features),
+            'seconds': time.perf_counter() - started}
+
+def walk_forward(timeframe, features_file=None, n_folds=N_FOLDS, window=WINDOW, embargo_bars=EMBARGO_BARS,
+                 rolling_chunks=ROLLING_CHUNKS, selection=None, device=ttm.TRAIN_DEVICE, jobs=None,
+                 threads_per_job=ttm.THREADS_PER_JOB):
+    """Run all folds and write grouped metrics; returns the metrics frame.
+
+    Folds use the saved main model's feature list (all feature columns if there is none),
+    or re-run feature selection on each fold's training rows when `selection` is given.
+    """
+    started = time.perf_counter()
+    features_path = os.path.join(ttm.FEATURES_DIR, features_file or f"{timeframe}_features.parquet")
+    device = ttm.resolve_device(device)
+    # Loading once here also builds the cache entry before the workers map it
+    df = ttm.load_training_frame(features_path, timeframe)
+    folds = walk_forward_folds(np.unique(ohlcv_store.series_to_ms(df['timestamp'])), n_folds, window,
+                               embargo_bars, rolling_chunks)
+    if not folds:
+        print(f"[WARN] Not enough bars for {n_folds} walk-forward folds")
+        return pd.DataFrame()
+
+    main_path = model_registry.model_path(timeframe, model_dir=ttm.MODEL_DIR)
+    features = joblib.load(main_path)['features'] if os.path.exists(main_path) else ttm.feature_columns(df.columns)
+    jobs = jobs or min(len(folds), max(1, (os.cpu_count() or 1) // threads_per_job))
+    print(f"[INFO] {len(folds)} {window} folds (embargo {embargo_bars} bars) on {jobs} processes "
+          f"x {threads_per_job} threads ({device})")
+    if jobs == 1:
+        ttm.configure_training(device, threads_per_job)
+        results = [run_fold(features_path, timeframe, fold, features, selection) for fold in folds]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=ttm.configure_training,
+                                 initargs=(device, threads_per_job)) as pool:
+            futures = [pool.submit(run_fold, features_path, timeframe, fold, features, selection) for fold in folds]
+            results = [future.result() for future in as_completed(futures)]
+    results.sort(key=lambda r: r['fold'])
+
+    rows = np.concatenate([r['rows'] for r in results])
+    proba = np.concatenate([r['proba'] for r in results])
+    fold_ids = np.concatenate([np.full(len(r['rows']), r['fold']) for r in results])
+    codes, symbols = pd.factorize(df['symbol'])
+    codes = codes[rows]
+    y_true = df['target_up'].to_numpy()[rows]
+    target_return = df['target_return_1'].to_numpy()[rows]
+    y_pred = (proba > 0.5).astype('int64')  # XGBClassifier.predict threshold
+    n_folds_run, n_symbols = len(results), len(symbols)
+
+    def grouped(keys, n_groups):
+        return validation_metrics.grouped_validation_metrics(keys, n_groups, y_true, y_pred, proba, target_return)
+
+    by_fold_symbol = grouped(fold_ids * n_symbols + codes, n_folds_run * n_symbols)
+    by_fold_symbol['fold'] = np.repeat(np.arange(n_folds_run), n_symbols)
+    by_fold_symbol['symbol'] = np.tile(np.asarray(symbols, dtype=object), n_folds_run)
+    by_symbol = grouped(codes, n_symbols).assign(fold=-1, symbol=np.asarray(symbols, dtype=object))
+    by_fold = grouped(fold_ids, n_folds_run).assign(fold=np.arange(n_folds_run), symbol='ALL')
+    overall = grouped(np.zeros(len(rows), dtype='int64'), 1).assign(fold=-1, symbol='ALL')
+
+    metrics = pd.concat([overall, by_fold, by_symbol, by_fold_symbol], ignore_index=True)
+    metrics = metrics[metrics['n'] > 0]
+    fold_info = pd.DataFrame([{k: r[k] for k in ['fold', 'train_start', 'train_end', 'test_start', 'test_end',
+                                                  'n_train', 'n_features', 'seconds']} for r in results])
+    for col in ['train_start', 'train_end', 'test_start', 'test_end']:
+        fold_info[col] = pd.to_datetime(fold_info[col], unit='ms', utc=True)
+    metrics = metrics.merge(fold_info, on='fold', how='left')
+    metrics.insert(0, 'timeframe', timeframe)
+    metrics['window'] = window
+    metrics['embargo_bars'] = embargo_bars
+    metrics = metrics[['timeframe', 'fold', 'symbol'] + [c for c in metrics.columns
+                                                         if c not in ('timeframe', 'fold', 'symbol')]]
+
+    out_path = os.path.join(ttm.VALIDATION_RESULTS_DIR, f"walk_forward_{timeframe}.parquet")
+    metrics.to_parquet(out_path, index=False)
+    summary = metrics[metrics['symbol'] == 'ALL'][['fold', 'n', 'accuracy', 'auc', 'sharpe', 'profit']]
+    print(summary.to_string(index=False))
+    print(f"[DONE] Walk-forward metrics for {n_symbols} symbols saved to {out_path} "
+          f"in {time.perf_counter() - started:.1f}s")
+    return metrics
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Walk-forward validation of the main model for one timeframe.")
+    parser.add_argument("timeframe")
+    parser.add_argument("features_file", nargs="?", default=None)
+    parser.add_argument("--folds", type=int, default=N_FOLDS)
+    parser.add_argument("--window", choices=["expanding", "rolling"], default=WINDOW)
+    parser.add_argument("--rolling-chunks", type=int, default=ROLLING_CHUNKS,
+                        help="Training chunks per fold for --window rolling")
+    parser.add_argument("--embargo", type=int, default=EMBARGO_BARS, help="Bars dropped before each test chunk")
+    parser.add_argument("--selection", choices=ttm.SELECTION_STRATEGIES, default=None,
+                        help="Re-select features on every fold (default: main model's feature list)")
+    parser.add_argument("--device", choices=["auto", "cuda", "cpu"], default=ttm.TRAIN_DEVICE)
+    parser.add_argument("--jobs", type=int, default=None)
+    parser.add_argument("--threads-per-job", type=int, default=ttm.THREADS_PER_JOB)
+    args = parser.parse_args()
+    walk_forward(args.timeframe, args.features_file, n_folds=args.folds, window=args.window,
+                 embargo_bars=args.embargo, rolling_chunks=args.rolling_chunks, selection=args.selection,
+                 device=args.device, jobs=args.jobs, threads_per_job=args.threads_per_job)
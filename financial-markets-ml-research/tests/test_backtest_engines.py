@@ -0,0 +1,65 @@
+import importlib.util
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+PARAMS = {'leverage': 4.0, 'trade_pct': 0.1, 'scale_out_pct': 0.7, 'take_profit_pct': 0.03,
+          'stop_loss_pct': -0.04, 'proba_threshold': 0.6}
+
+@pytest.fixture(scope="session")
+def numba_cache_dir(tmp_path_factory):
+    return tmp_path_factory.mktemp("numba_cache")
+
+@pytest.fixture(params=["numba", "no numba"])
+def bt(request, monkeypatch, numba_cache_dir):
+    """A fresh copy of backtest_by_timeframe, compiled with numba or with numba blocked.
+
+    The copy's kernels are cached under a temporary directory: the on-disk cache records the module name, so
+    entries written to src/__pycache__ under the alias would break later imports of the real module.
+    """
+    if request.param == "numba":
+        numba = pytest.importorskip("numba")
+        monkeypatch.setattr(numba.config, "CACHE_DIR", str(numba_cache_dir))
+    else:
+        monkeypatch.setitem(sys.modules, "numba", None)
+    name = f"backtest_by_timeframe_{request.param.replace(' ', '_')}"
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SRC_DIR, "backtest_by_timeframe.py"))
+    module = importlib.util.module_from_spec(spec)
+    monkeypatch.setitem(sys.modules, name, module)  # cached kernels re-import their module by name
+    spec.loader.exec_module(module)
+    assert (module.njit is not None) == (request.param == "numba")
+    return module
+
+def synthetic_frame(n_symbols=4, n_bars=500, seed=11):
+    """load_backtest_frame()-shaped panel: sorted by symbol then time, symbols starting at different bars."""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for s in range(n_symbols):
+        times = pd.date_range('2024-01-01', periods=n_bars, freq='30min', tz='UTC') + pd.Timedelta(minutes=30 * 7 * s)
+        returns = rng.normal(0, 0.02, n_bars)
+        returns[rng.integers(50, n_bars, 3)] = -0.3  # crashes deep enough to liquidate at 4x
+        proba_up = rng.uniform(0.2, 0.9, n_bars)
+        frames.append(pd.DataFrame({
+            'datetime': times,
+            'symbol': f"SYM{s}/USDT",
+            'close': 100 * np.exp(np.cumsum(returns)),
+            'pred_up': (proba_up > 0.5).astype('int8'),
+            'proba_up': proba_up,
+            'rolling_std_14': rng.lognormal(0, 0.5, n_bars)
+        }))
+    return pd.concat(frames, ignore_index=True).set_index(['datetime', 'symbol'])
+
+def test_vol_spike_flags_match_reference(bt):
+    df = synthetic_frame()
+    expected = bt.vol_spike_reference(df).to_numpy(dtype=bool)
+    np.testing.assert_array_equal(bt.vol_spike_flags(df), expected)
+
+def test_kernel_trade_log_matches_reference(bt):
+    df = synthetic_frame()
+    expected = bt.simulate(df, PARAMS, "reference").reset_index(drop=True)
+    actual = bt.simulate(df, PARAMS, "kernel").reset_index(drop=True)
+    assert set(expected['exit_type']) == set(bt.EXIT_TYPES)  # every exit path is exercised
+    pd.testing.assert_frame_equal(actual, expected, check_exact=True)
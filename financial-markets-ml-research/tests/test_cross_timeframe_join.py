@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+import cross_timeframe_join as ctj
+import ohlcv_store
+
+def feature_frame(symbols, start, periods, freq, seed):
+    """Shuffled multi-symbol frame; `bar_open_ms` identifies the bar a joined value came from."""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for s, symbol in enumerate(symbols):
+        timestamps = pd.date_range(start, periods=periods, freq=freq, tz='UTC') + pd.Timedelta(minutes=30 * s)
+        frames.append(pd.DataFrame({'symbol': symbol, 'timestamp': timestamps,
+                                    'bar_open_ms': (timestamps - pd.Timestamp(0, tz='UTC')) // pd.Timedelta('1ms')}))
+    df = pd.concat(frames, ignore_index=True)
+    return df.iloc[rng.permutation(len(df))].reset_index(drop=True)
+
+def reference_asof(lower, lower_tf, higher, higher_tf):
+    """Per-row scan: open time of the newest higher bar closed by the time the lower bar closes."""
+    lower_delta, higher_delta = ohlcv_store.TIMEFRAME_DELTAS[lower_tf], ohlcv_store.TIMEFRAME_DELTAS[higher_tf]
+    out = []
+    for row in lower.itertuples():
+        closed = higher[(higher['symbol'] == row.symbol) & (higher['timestamp'] + higher_delta <= row.timestamp + lower_delta)]
+        out.append(closed['bar_open_ms'].max() if len(closed) else np.nan)
+    return np.array(out, dtype='float64')
+
+def test_asof_join_uses_only_closed_higher_bars():
+    lower = feature_frame(['BTC/USDT', 'ETH/USDT', 'XRP/USDT'], '2024-01-01', 400, '30min', seed=1)
+    higher = feature_frame(['ETH/USDT', 'BTC/USDT'], '2024-01-01 04:00', 30, '4h', seed=2)
+    joined = ctj.join_higher_timeframes(lower, '30m', {'4h': higher}, columns=['bar_open_ms'])
+
+    expected = reference_asof(lower, '30m', higher, '4h')
+    np.testing.assert_array_equal(joined['4h_bar_open_ms'].to_numpy(), expected)
+    assert joined['4h_bar_open_ms'][lower['symbol'] == 'XRP/USDT'].isna().all()
+    # the join never looks past the lower bar's own close
+    lower_close = lower['bar_open_ms'] + 30 * 60 * 1000
+    assert (joined['4h_bar_open_ms'].dropna() + 4 * 3600 * 1000 <= lower_close[joined['4h_bar_open_ms'].notna()]).all()
+    pd.testing.assert_frame_equal(joined[lower.columns], lower)
+
+def test_asof_boundary_bar_sees_higher_bar_closing_with_it():
+    higher = pd.DataFrame({'symbol': 'BTC/USDT', 'timestamp': pd.to_datetime(['2024-01-01 00:00'], utc=True),
+                           'bar_open_ms': [0]})
+    lower = pd.DataFrame({'symbol': 'BTC/USDT',
+                          'timestamp': pd.to_datetime(['2024-01-01 03:00', '2024-01-01 03:30'], utc=True)})
+    joined = ctj.join_higher_timeframes(lower, '30m', {'4h': higher}, columns=['bar_open_ms'])
+    # 03:00 closes at 03:30 while the 4h bar is still forming; 03:30 closes with it at 04:00
+    assert np.isnan(joined['4h_bar_open_ms'].iloc[0]) and joined['4h_bar_open_ms'].iloc[1] == 0
+
+def test_rejects_lower_or_equal_context_timeframe():
+    lower = feature_frame(['BTC/USDT'], '2024-01-01', 10, '4h', seed=3)
+    with pytest.raises(ValueError):
+        ctj.join_higher_timeframes(lower, '4h', {'1h': lower}, columns=['bar_open_ms'])
@@ -0,0 +1,67 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("talib")
+import feature_engineering_timeframe as fe
+import ohlcv_store
+
+STEP = pd.Timedelta(minutes=30)
+
+def synthetic_bars(symbol, n, end, seed=5):
+    """Random-walk 30m bars whose last bar opens at `end` (clean_ohlcv drops symbols with stale data)."""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    spread = close * rng.uniform(0.001, 0.01, n)
+    df = pd.DataFrame({
+        'timestamp': pd.date_range(end=end, periods=n, freq='30min'),
+        'open': open_, 'high': np.maximum(open_, close) + spread, 'low': np.minimum(open_, close) - spread,
+        'close': close, 'volume': rng.lognormal(5, 1, n), 'symbol': symbol, 'timeframe': '30m'
+    })
+    df.loc[rng.integers(0, n, 3), 'volume'] = 0.0  # bars the cleaning step removes
+    return df
+
+def now_bar():
+    # A bar ahead of the latest closed one, so the data stays fresh however long the test takes
+    return pd.Timestamp(ohlcv_store.latest_closed_bar_ms('30m') + 2 * ohlcv_store.timeframe_ms('30m'), unit='ms', tz='UTC')
+
+def features_path(root, symbol_folder):
+    return os.path.join(root, symbol_folder, '30m_features.parquet')
+
+def test_incremental_features_match_full_recompute(tmp_path, monkeypatch, capsys):
+    root = str(tmp_path)
+    monkeypatch.setattr(fe, "DATA_DIR", root)
+    bars = synthetic_bars('BTC/USDT', 1230, end=now_bar() + 30 * STEP)
+    ohlcv_store.append_bars(bars.iloc[:1200], 'BTC/USDT', '30m', root=root)
+    fe.generate_features_for_symbol('BTCUSDT', '30m', incremental=True)  # no file yet: full build
+    n_before = len(pd.read_parquet(features_path(root, 'BTCUSDT')))
+
+    ohlcv_store.append_bars(bars.iloc[1200:], 'BTC/USDT', '30m', root=root)
+    capsys.readouterr()
+    appended = fe.generate_features_for_symbol('BTCUSDT', '30m', incremental=True)
+    assert appended == 30 and "Appended 30 feature rows" in capsys.readouterr().out  # no fallback rebuild
+
+    incremental = pd.read_parquet(features_path(root, 'BTCUSDT'))
+    fe.write_full_features('BTCUSDT', '30m', str(tmp_path / 'full.parquet'))
+    full = pd.read_parquet(tmp_path / 'full.parquet')
+    assert len(incremental) == n_before + appended
+    pd.testing.assert_frame_equal(incremental, full, check_exact=False, rtol=fe.VERIFY_RTOL, atol=fe.VERIFY_ATOL)
+
+def test_panel_engine_matches_per_symbol_files(tmp_path, monkeypatch):
+    root = str(tmp_path)
+    monkeypatch.setattr(fe, "DATA_DIR", root)
+    end = now_bar()
+    for s, (symbol, n) in enumerate({'BTC/USDT': 700, 'ETH/USDT': 420, 'DOGE/USDT': 180}.items()):
+        ohlcv_store.append_bars(synthetic_bars(symbol, n, end, seed=s), symbol, '30m', root=root)
+    folders = ['BTCUSDT', 'DOGEUSDT', 'ETHUSDT']
+
+    timings = fe.generate_features_for_timeframe('30m', workers=1)
+    assert (timings['status'] == 'ok').all()
+    per_symbol = {f: pd.read_parquet(features_path(root, f)) for f in folders}
+    timings = fe.generate_features_panel('30m')
+    assert (timings['status'] == 'ok').all()
+    for folder in folders:
+        pd.testing.assert_frame_equal(pd.read_parquet(features_path(root, folder)), per_symbol[folder],
+                                      check_exact=False, rtol=fe.VERIFY_RTOL, atol=fe.VERIFY_ATOL)
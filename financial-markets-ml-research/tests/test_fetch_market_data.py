@@ -0,0 +1,113 @@
+import asyncio
+import json
+import pandas as pd
+import pytest
+
+ccxt = pytest.importorskip("ccxt")
+import fetch_market_data
+import ohlcv_store
+
+STEP_MS = 30 * 60 * 1000
+START_MS = int(pd.Timestamp('2024-01-01', tz='UTC').value // 10**6)
+SYMBOLS = ['BTC/USDT', 'ETH/USDT', 'SOL/USDT']
+
+def recorded_bars(n, start_ms=START_MS):
+    return [[start_ms + i * STEP_MS, 100.0 + i, 101.0 + i, 99.0 + i, 100.5 + i, 10.0 + i] for i in range(n)]
+
+def write_recording(path, n_bars):
+    recording = {symbol: {'30m': recorded_bars(n_bars + 7 * s)} for s, symbol in enumerate(SYMBOLS)}
+    path.write_text(json.dumps(recording))
+    return recording
+
+def to_ms(timestamps):
+    return ((timestamps - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(milliseconds=1)).to_numpy()
+
+def stored_bars(root, symbol):
+    df = ohlcv_store.read_bars(symbol, '30m', root=str(root))
+    prices = df[['open', 'high', 'low', 'close', 'volume']].values.tolist()
+    return [[int(ms), *row] for ms, row in zip(to_ms(df['timestamp']), prices)]
+
+class CountingExchange(fetch_market_data.ReplayExchange):
+    """Replay exchange that records the peak number of requests in flight."""
+
+    def __init__(self, recording_path, latency=0.0):
+        super().__init__(recording_path, latency=latency)
+        self.in_flight = 0
+        self.peak = 0
+
+    async def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            return await super().fetch_ohlcv(symbol, timeframe, since=since, limit=limit)
+        finally:
+            self.in_flight -= 1
+
+class FlakyExchange(fetch_market_data.ReplayExchange):
+    """Replay exchange whose first `failures` requests raise a network error."""
+
+    def __init__(self, recording_path, failures):
+        super().__init__(recording_path)
+        self.failures = failures
+
+    async def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        if self.failures:
+            self.failures -= 1
+            raise ccxt.NetworkError("connection reset")
+        return await super().fetch_ohlcv(symbol, timeframe, since=since, limit=limit)
+
+def test_async_fetch_pages_through_recording(tmp_path):
+    recording = write_recording(tmp_path / "replay.json", 2 * fetch_market_data.LIMIT + 17)
+    exchange = fetch_market_data.ReplayExchange(tmp_path / "replay.json")
+    limiter = fetch_market_data.TokenBucket(1000)
+    df = asyncio.run(fetch_market_data.fetch_missing_bars_async(exchange, limiter, 'BTC/USDT', '30m'))
+    assert exchange.requests == 3
+    assert df['timestamp'].is_monotonic_increasing
+    expected = pd.DataFrame(recording['BTC/USDT']['30m'], columns=fetch_market_data.OHLCV_COLUMNS)
+    assert (to_ms(df['timestamp']) == expected['timestamp'].to_numpy()).all()
+    pd.testing.assert_frame_equal(df[['open', 'high', 'low', 'close', 'volume']], expected.drop(columns='timestamp'))
+
+def test_update_all_async_stores_every_symbol_and_resumes(tmp_path, monkeypatch):
+    monkeypatch.setattr(fetch_market_data, "OUTPUT_DIR", str(tmp_path / "lake"))
+    write_recording(tmp_path / "replay.json", fetch_market_data.LIMIT + 40)
+    exchange = CountingExchange(tmp_path / "replay.json", latency=0.01)
+    results = asyncio.run(fetch_market_data.update_all_async(exchange, SYMBOLS, ['30m'], concurrency=2, rate=1000))
+    assert not [r for r in results if isinstance(r, Exception)]
+    assert 1 < exchange.peak <= 2
+
+    recording = write_recording(tmp_path / "replay.json", fetch_market_data.LIMIT + 45)
+    exchange = fetch_market_data.ReplayExchange(tmp_path / "replay.json")
+    asyncio.run(fetch_market_data.update_all_async(exchange, SYMBOLS, ['30m'], rate=1000))
+    assert exchange.requests == len(SYMBOLS)  # one short page per symbol, resumed after the stored bars
+    for symbol in SYMBOLS:
+        assert stored_bars(tmp_path / "lake", symbol) == recording[symbol]['30m']
+
+def test_forming_bar_is_not_stored(tmp_path, monkeypatch):
+    monkeypatch.setattr(fetch_market_data, "OUTPUT_DIR", str(tmp_path / "lake"))
+    forming = ohlcv_store.latest_closed_bar_ms('30m') + STEP_MS
+    bars = recorded_bars(5, start_ms=forming - 4 * STEP_MS)
+    fetch_market_data.save_bars(fetch_market_data.bars_to_frame(bars, 'BTC/USDT', '30m'), 'BTC/USDT', '30m')
+    assert stored_bars(tmp_path / "lake", 'BTC/USDT') == bars[:-1]
+    # the next run asks for the formerly forming bar again
+    assert ohlcv_store.plan_missing_ranges('BTC/USDT', '30m', root=str(tmp_path / "lake"),
+                                           end_ms=forming) == [(forming - STEP_MS + 1, None)]
+
+def test_page_retries_back_off_then_give_up(tmp_path, monkeypatch):
+    monkeypatch.setattr(fetch_market_data, "BACKOFF_BASE", 0.0)
+    recording = write_recording(tmp_path / "replay.json", 50)
+    limiter = fetch_market_data.TokenBucket(1000)
+    exchange = FlakyExchange(tmp_path / "replay.json", failures=fetch_market_data.MAX_RETRIES)
+    page = asyncio.run(fetch_market_data.fetch_page_with_retry(exchange, limiter, 'BTC/USDT', '30m', None))
+    assert page == recording['BTC/USDT']['30m']
+    exchange = FlakyExchange(tmp_path / "replay.json", failures=fetch_market_data.MAX_RETRIES + 1)
+    assert asyncio.run(fetch_market_data.fetch_page_with_retry(exchange, limiter, 'BTC/USDT', '30m', None)) is None
+
+def test_token_bucket_limits_request_rate():
+    async def burst(limiter, n):
+        started = asyncio.get_running_loop().time()
+        for _ in range(n):
+            await limiter.acquire()
+        return asyncio.get_running_loop().time() - started
+
+    # a burst of `capacity` is free, every request after it waits 1/rate
+    assert asyncio.run(burst(fetch_market_data.TokenBucket(50, capacity=5), 15)) >= 10 / 50 * 0.9
@@ -0,0 +1,110 @@
+import os
+import numpy as np
+import pandas as pd
+import ohlcv_store
+
+STEP = pd.Timedelta(minutes=30)
+
+def bars(start, n, symbol='BTC/USDT', price=100.0):
+    timestamps = pd.date_range(start, periods=n, freq='30min', tz='UTC')
+    close = price + np.arange(n, dtype='float64')
+    return pd.DataFrame({'timestamp': timestamps, 'open': close, 'high': close + 1, 'low': close - 1,
+                         'close': close, 'volume': 10.0, 'symbol': symbol, 'timeframe': '30m'})
+
+def n_files(root, symbol, month):
+    return len(ohlcv_store.list_parts(os.path.join(ohlcv_store.partition_root(symbol, '30m', root), month)))
+
+def test_append_and_read_round_trip_across_months(tmp_path):
+    root = str(tmp_path)
+    first = bars('2024-01-31 12:00', 48)  # spans the January/February boundary
+    assert ohlcv_store.append_bars(first, 'BTC/USDT', '30m', root=root) == 48
+    assert ohlcv_store.list_months('BTC/USDT', '30m', root=root) == ['2024-01', '2024-02']
+
+    # overlapping rewrite: later writes win, nothing is duplicated
+    second = bars('2024-02-01 06:00', 20, price=500.0)
+    ohlcv_store.append_bars(second, 'BTC/USDT', '30m', root=root)
+    expected = pd.concat([first[first['timestamp'] < second['timestamp'].iloc[0]], second], ignore_index=True)
+    pd.testing.assert_frame_equal(ohlcv_store.read_bars('BTC/USDT', '30m', root=root), expected)
+    assert ohlcv_store.last_timestamp_ms('BTC/USDT', '30m', root=root) == ohlcv_store.to_ms(expected['timestamp'].iloc[-1])
+
+    start, end = pd.Timestamp('2024-02-01', tz='UTC'), pd.Timestamp('2024-02-01 05:00', tz='UTC')
+    window = ohlcv_store.read_bars('BTC/USDT', '30m', root=root, start=start, end=end, columns=['close'])
+    assert list(window.columns) == ['timestamp', 'close']
+    assert len(window) == 11 and window['timestamp'].iloc[0] == start
+
+def test_compact_folds_closed_months_and_keeps_open_deltas(tmp_path):
+    root = str(tmp_path)
+    for i in range(3):
+        ohlcv_store.append_bars(bars(pd.Timestamp('2024-01-31 16:00') + i * 6 * STEP, 6), 'BTC/USDT', '30m', root=root)
+    ohlcv_store.append_bars(bars('2024-02-01 12:00', 4), 'BTC/USDT', '30m', root=root)
+    before = ohlcv_store.read_bars('BTC/USDT', '30m', root=root)
+
+    assert ohlcv_store.compact('BTC/USDT', '30m', root=root) == 1
+    assert n_files(root, 'BTC/USDT', '2024-01') == 1
+    assert n_files(root, 'BTC/USDT', '2024-02') > 1  # open month below COMPACT_MIN_FILES
+    pd.testing.assert_frame_equal(ohlcv_store.read_bars('BTC/USDT', '30m', root=root), before)
+
+    assert ohlcv_store.compact('BTC/USDT', '30m', root=root, min_files=2) == 1
+    assert n_files(root, 'BTC/USDT', '2024-02') == 1
+    pd.testing.assert_frame_equal(ohlcv_store.read_bars('BTC/USDT', '30m', root=root), before)
+
+def test_migrate_legacy_file_into_partitions(tmp_path):
+    root = str(tmp_path)
+    legacy = bars('2024-01-31 20:00', 12)
+    os.makedirs(os.path.join(root, 'BTCUSDT'))
+    pd.concat([legacy, legacy.iloc[:3]]).to_parquet(ohlcv_store.legacy_path('BTC/USDT', '30m', root), index=False)
+
+    assert ohlcv_store.migrate_legacy('BTC/USDT', '30m', root=root) == 12
+    assert not os.path.exists(ohlcv_store.legacy_path('BTC/USDT', '30m', root))
+    assert ohlcv_store.list_months('BTC/USDT', '30m', root=root) == ['2024-01', '2024-02']
+    pd.testing.assert_frame_equal(ohlcv_store.read_bars('BTC/USDT', '30m', root=root), legacy)
+    assert ohlcv_store.migrate_legacy('BTC/USDT', '30m', root=root) == 0
+
+def test_manifest_tracks_coverage_on_write(tmp_path):
+    root = str(tmp_path)
+    ohlcv_store.append_bars(bars('2024-01-01', 10), 'BTC/USDT', '30m', root=root)
+    ohlcv_store.append_bars(bars('2024-01-01 08:00', 5), 'BTC/USDT', '30m', root=root)
+    ohlcv_store.append_bars(bars('2024-01-01 05:00', 6), 'BTC/USDT', '30m', root=root)  # closes the gap
+
+    entry = ohlcv_store.coverage('BTC/USDT', '30m', root=root)
+    ms = ohlcv_store.to_ms
+    assert entry['intervals'] == [[ms('2024-01-01'), ms('2024-01-01 10:00')]]
+    assert entry['n_bars'] == 21 == len(ohlcv_store.read_bars('BTC/USDT', '30m', root=root))
+
+    frame = ohlcv_store.coverage_frame('30m', root=root)
+    assert frame[['symbol', 'n_bars', 'n_gaps']].values.tolist() == [['BTC/USDT', 21, 0]]
+    assert frame['end'].iloc[0] == pd.Timestamp('2024-01-01 10:00', tz='UTC')
+
+def test_rebuild_manifest_matches_incremental_manifest(tmp_path):
+    root = str(tmp_path)
+    ohlcv_store.append_bars(bars('2024-01-31', 40), 'BTC/USDT', '30m', root=root)
+    ohlcv_store.append_bars(bars('2024-02-03', 8), 'BTC/USDT', '30m', root=root)
+    ohlcv_store.append_bars(bars('2024-01-15', 5, symbol='ETH/USDT'), 'ETH/USDT', '30m', root=root)
+    incremental = ohlcv_store.load_manifest(root)
+    rebuilt = ohlcv_store.rebuild_manifest(root=root)
+
+    def strip(manifest):
+        return {key: {tf: {k: v for k, v in entry.items() if k != 'updated'} for tf, entry in tfs.items()}
+                for key, tfs in manifest.items()}
+    assert strip(rebuilt) == strip(incremental)
+    assert strip(ohlcv_store.load_manifest(root)) == strip(incremental)
+
+def test_planner_fetches_gaps_and_tail_only(tmp_path):
+    root = str(tmp_path)
+    assert ohlcv_store.plan_missing_ranges('BTC/USDT', '30m', root=root) == [(None, None)]
+    ohlcv_store.append_bars(bars('2024-01-01', 10), 'BTC/USDT', '30m', root=root)
+    ohlcv_store.append_bars(bars('2024-01-01 08:00', 4), 'BTC/USDT', '30m', root=root)
+    ohlcv_store.append_bars(bars('2024-01-02', 4), 'BTC/USDT', '30m', root=root)
+    ms = ohlcv_store.to_ms
+
+    plan = ohlcv_store.plan_missing_ranges('BTC/USDT', '30m', root=root, end_ms=ms('2024-01-03'))
+    assert plan == [(ms('2024-01-01 05:00'), ms('2024-01-01 07:30')),
+                    (ms('2024-01-01 10:00'), ms('2024-01-01 23:30')),
+                    (ms('2024-01-02 01:30') + 1, None)]
+    # fully covered up to the last closed bar: nothing to fetch
+    assert ohlcv_store.plan_missing_ranges('BTC/USDT', '30m', root=root, end_ms=ms('2024-01-02 01:30')) == plan[:2]
+
+    # a gap the exchange cannot fill is not planned again
+    ohlcv_store.mark_unavailable('BTC/USDT', '30m', *plan[0], root=root)
+    assert ohlcv_store.plan_missing_ranges('BTC/USDT', '30m', root=root, end_ms=ms('2024-01-03')) == plan[1:]
+    assert ohlcv_store.coverage('BTC/USDT', '30m', root=root)['n_bars'] == 18
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+import param_sweep
+
+PARAMS = {'leverage': 4.0, 'trade_pct': 0.1, 'scale_out_pct': 0.7, 'take_profit_pct': 0.03,
+          'stop_loss_pct': -0.04, 'proba_threshold': 0.6}
+
+def synthetic_frame(n_symbols=4, n_bars=500, seed=17):
+    """load_backtest_frame()-shaped panel: sorted by symbol then time, symbols starting at different bars."""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for s in range(n_symbols):
+        returns = rng.normal(0, 0.02, n_bars)
+        returns[rng.integers(50, n_bars, 2)] = -0.3
+        proba_up = rng.uniform(0.2, 0.9, n_bars)
+        frames.append(pd.DataFrame({
+            'datetime': pd.date_range('2024-01-01', periods=n_bars, freq='30min', tz='UTC') + pd.Timedelta(hours=5 * s),
+            'symbol': f"SYM{s}/USDT",
+            'close': 100 * np.exp(np.cumsum(returns)),
+            'pred_up': (proba_up > 0.5).astype('int8'),
+            'proba_up': proba_up,
+            'rolling_std_14': rng.lognormal(0, 0.5, n_bars)
+        }))
+    return pd.concat(frames, ignore_index=True).set_index(['datetime', 'symbol'])
+
+def test_sweep_matches_single_backtests():
+    grid = param_sweep.parameter_grid(take_profit_pct=[0.02, 0.04, 0.08], stop_loss_pct=[-0.08, -0.03],
+                                      proba_threshold=[0.55, 0.7], leverage=[2.0, 4.0])
+    sweep = param_sweep.sweep_params(synthetic_frame(), grid, PARAMS)
+    assert len(sweep) == 24 and (sweep['trade_count'] > 0).all()
+    pd.testing.assert_frame_equal(sweep[list(grid.columns)], grid)
+    assert param_sweep.verify_sweep(synthetic_frame(), grid, PARAMS, checks=len(grid))
+
+def test_parameter_sets_fill_from_base_and_reject_unknown():
+    sets = param_sweep.parameter_sets([{'take_profit_pct': 0.05}, {'leverage': 2.0}], PARAMS)
+    assert list(sets.columns) == param_sweep.SWEEP_PARAMS
+    assert sets.loc[0, 'leverage'] == PARAMS['leverage'] and sets.loc[1, 'take_profit_pct'] == PARAMS['take_profit_pct']
+    with pytest.raises(ValueError):
+        param_sweep.parameter_sets([{'max_open_trades': 3}], PARAMS)
@@ -0,0 +1,93 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+import aggregate_features_by_timeframe
+import backtest_by_timeframe as bt
+import inference_timeframe
+import portfolio_backtest
+
+PARAMS = {'leverage': 4.0, 'trade_pct': 0.2, 'scale_out_pct': 0.7, 'take_profit_pct': 0.03,
+          'stop_loss_pct': -0.04, 'proba_threshold': 0.6, 'max_open_trades': 3}
+
+def write_lake(seed=3):
+    """Per-symbol feature files, their aggregate and a predictions sidecar with a few bars unscored."""
+    rng = np.random.default_rng(seed)
+    predictions = []
+    for s, symbol in enumerate(['BTC/USDT', 'BTCB/USDT', 'ETH/USDT', 'SOL/USDT']):
+        n = 600 + 50 * s
+        timestamps = pd.date_range('2024-01-01', periods=n, freq='30min', tz='UTC') + pd.Timedelta(minutes=90 * s)
+        returns = rng.normal(0, 0.02, n)
+        returns[rng.integers(50, n, 2)] = -0.3
+        df = pd.DataFrame({
+            'timestamp': timestamps, 'symbol': symbol, 'timeframe': '30m',
+            'close': 100 * np.exp(np.cumsum(returns)), 'target_return_1': 0.0, 'drawdown_20': 0.0,
+            'rolling_std_14': rng.lognormal(0, 0.5, n), 'low_vol_liquidity': 0
+        })
+        df.loc[rng.integers(0, n, 5), 'drawdown_20'] = np.nan
+        folder = os.path.join('ohlcv_parquet', symbol.replace('/', ''))
+        os.makedirs(folder)
+        df.to_parquet(os.path.join(folder, '30m_features.parquet'), index=False)
+        proba_up = rng.uniform(0.2, 0.9, n)
+        scored = rng.random(n) > 0.02
+        predictions.append(pd.DataFrame({'symbol': symbol, 'timestamp': timestamps[scored],
+                                         'pred_up': (proba_up[scored] > 0.5).astype('int8'),
+                                         'proba_up': proba_up[scored]}))
+    aggregate_features_by_timeframe.aggregate_timeframe('30m')
+    inference_timeframe.write_predictions(pd.concat(predictions, ignore_index=True), '30m')
+
+@pytest.mark.parametrize("batch_size", [1, 37, 4096])
+def test_streamed_files_match_in_memory_frame(tmp_path, monkeypatch, batch_size):
+    monkeypatch.chdir(tmp_path)
+    write_lake()
+    expected = portfolio_backtest.simulate_portfolio(bt.load_backtest_frame('30m'), PARAMS)
+    actual = portfolio_backtest.stream_portfolio('30m', PARAMS, batch_size=batch_size)
+    assert len(expected[0]) > 100
+    pd.testing.assert_frame_equal(actual[0], expected[0], check_exact=True)
+    pd.testing.assert_series_equal(actual[1], expected[1], check_exact=True)
+    assert actual[2] == expected[2]
+
+def test_prediction_deltas_overlay_sidecar(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_lake()
+    sidecar = inference_timeframe.predictions_path('30m')
+    before = os.path.getmtime(sidecar)
+    features = pd.read_parquet(os.path.join('ohlcv_parquet', '30m_features.parquet'), columns=['symbol', 'timestamp'])
+    newest = features.groupby('symbol').tail(60).reset_index(drop=True)  # rescored bars and unscored ones
+    rng = np.random.default_rng(11)
+    for chunk in np.array_split(np.arange(len(newest)), 3):
+        rows = newest.iloc[chunk]
+        proba_up = rng.uniform(0.2, 0.9, len(rows))
+        update = rows.assign(pred_up=(proba_up > 0.5).astype('int8'), proba_up=proba_up)
+        inference_timeframe.write_predictions(update, '30m', upsert=True)
+    assert len(inference_timeframe.prediction_deltas('30m')) == 3
+    assert os.path.getmtime(sidecar) == before
+
+    merged = inference_timeframe.read_predictions('30m')
+    expected = portfolio_backtest.simulate_portfolio(bt.load_backtest_frame('30m'), PARAMS)
+    actual = portfolio_backtest.stream_portfolio('30m', PARAMS, batch_size=37)
+    pd.testing.assert_frame_equal(actual[0], expected[0], check_exact=True)
+    pd.testing.assert_series_equal(actual[1], expected[1], check_exact=True)
+
+    assert inference_timeframe.compact_predictions('30m')
+    assert not inference_timeframe.prediction_deltas('30m')
+    assert inference_timeframe.symbol_row_groups(pq.ParquetFile(sidecar)) is not None
+    compacted = inference_timeframe.read_predictions('30m')
+    pd.testing.assert_frame_equal(compacted, merged.sort_values(['symbol', 'timestamp']).reset_index(drop=True))
+    assert len(compacted.merge(newest, on=['symbol', 'timestamp'])) == len(newest)
+
+def test_open_positions_marked_to_market_at_end():
+    times = pd.date_range('2024-01-01', periods=5, freq='30min', tz='UTC')
+    df = pd.DataFrame({
+        'datetime': times, 'symbol': 'BTC/USDT', 'close': [100.0, 100.5, 101.0, 101.5, 102.0],
+        'pred_up': 1, 'proba_up': 0.9, 'rolling_std_14': 1.0
+    }).set_index(['datetime', 'symbol'])
+    trade_log_df, curve, counters = portfolio_backtest.simulate_portfolio(df, PARAMS)
+    assert trade_log_df.empty and counters['open_at_end'] == 1
+    margin = PARAMS['trade_pct'] * bt.STARTING_CASH
+    entry_fee = margin * PARAMS['leverage'] * bt.TRADE_COST
+    unrealized = (102.0 - 100.0) / 100.0 * margin * PARAMS['leverage']
+    assert counters['unrealized_pnl_at_end'] == pytest.approx(unrealized)
+    assert curve.index[-1] == times[-1]
+    assert curve.iloc[-1] == pytest.approx(bt.STARTING_CASH - entry_fee + unrealized)
@@ -0,0 +1,55 @@
+import joblib
+import ohlcv_store
+import numpy as np
+import pandas as pd
+import pytest
+import streaming_indicators
+from feature_engineering_timeframe import bad_bar_mask
+
+def synthetic_bars(n=600, seed=7):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    spread = np.abs(rng.normal(0, 0.005, n)) * close
+    df = pd.DataFrame({
+        'timestamp': pd.date_range('2024-01-01', periods=n, freq='30min', tz='UTC'),
+        'open': open_,
+        'high': np.maximum(open_, close) + spread,
+        'low': np.minimum(open_, close) - spread,
+        'close': close,
+        'volume': rng.lognormal(3, 1, n),
+        'symbol': 'BTC/USDT'
+    })
+    df.loc[100:104, 'close'] = df.loc[100, 'close']  # a flat stretch exercises the same-value paths
+    return df[~bad_bar_mask(df)].reset_index(drop=True)
+
+def test_stream_matches_talib_batch():
+    pytest.importorskip("talib")
+    report = streaming_indicators.validate_against_batch(synthetic_bars())
+    assert report['ok'].all(), report[~report['ok']].to_string(index=False)
+
+def test_snapshot_restore_matches_single_pass(tmp_path):
+    df = synthetic_bars()
+    single = streaming_indicators.FeatureStream().update_frame(df)
+
+    stream = streaming_indicators.FeatureStream()
+    first = stream.update_frame(df.iloc[:350])
+    path = tmp_path / "state.joblib"
+    streaming_indicators.save_stream(stream, path)
+    second = joblib.load(path).update_frame(df.iloc[350:])
+
+    pd.testing.assert_frame_equal(pd.concat([first, second]), single, check_exact=True)
+
+def test_live_update_skips_forming_bar(tmp_path, monkeypatch):
+    monkeypatch.setattr(streaming_indicators, "DATA_DIR", str(tmp_path))
+    df = synthetic_bars(300)
+    forming = pd.Timestamp(ohlcv_store.latest_closed_bar_ms('30m') + 30 * 60 * 1000, unit='ms', tz='UTC')
+    df['timestamp'] = forming - (len(df) - 1 - np.arange(len(df))) * pd.Timedelta('30min')
+    ohlcv_store.append_bars(df.iloc[:-1], 'BTC/USDT', '30m', root=str(tmp_path))
+    # a forming bar left in the store by another writer
+    ohlcv_store.append_bars(df.iloc[-1:], 'BTC/USDT', '30m', root=str(tmp_path))
+
+    row = streaming_indicators.update_symbol_stream(ohlcv_store.symbol_key('BTC/USDT'), '30m')
+    assert row['timestamp'] == df['timestamp'].iloc[-2]
+    single = streaming_indicators.FeatureStream().update_frame(df.iloc[:-1].reset_index(drop=True))
+    pd.testing.assert_series_equal(row, single.iloc[-1], check_names=False)
@@ -0,0 +1,66 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import training_cache
+
+FEATURES = ['return_1', 'rsi_14']
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(training_cache, "CACHE_DIR", str(tmp_path / "cache"))
+    return tmp_path / "cache"
+
+def write_features(path, seed=0, n=200):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'timestamp': np.tile(pd.date_range('2024-01-01', periods=n // 2, freq='30min', tz='UTC'), 2),
+        'symbol': np.repeat(['BTC/USDT', 'ETH/USDT'], n // 2),
+        'return_1': rng.normal(0, 0.01, n), 'rsi_14': rng.uniform(0, 100, n), 'macd': rng.normal(0, 1, n),
+        'target_up': rng.integers(0, 2, n), 'target_return_1': rng.normal(0, 0.01, n)
+    })
+    df.to_parquet(path, index=False)
+    return df
+
+def entries(cache_dir):
+    return sorted(os.listdir(cache_dir / "30m"))
+
+def count_builds(monkeypatch):
+    builds = []
+    build_entry = training_cache.build_entry
+    monkeypatch.setattr(training_cache, "build_entry", lambda *args: (builds.append(args[2]), build_entry(*args)))
+    return builds
+
+def test_cached_frame_matches_parquet(tmp_path):
+    df = write_features(tmp_path / "30m_features.parquet")
+    frame = training_cache.load_frame(str(tmp_path / "30m_features.parquet"), '30m', 'ETH/USDT', FEATURES)
+    expected = df[df['symbol'] == 'ETH/USDT'].sort_values('timestamp', kind='stable').reset_index(drop=True)
+    assert list(frame.columns) == FEATURES + ['timestamp', 'symbol', 'target_return_1', 'target_up']
+    np.testing.assert_array_equal(frame[FEATURES].to_numpy(), expected[FEATURES].to_numpy(dtype='float32'))
+    pd.testing.assert_series_equal(frame['timestamp'], expected['timestamp'], check_names=False, check_dtype=False)
+    assert (frame['symbol'] == 'ETH/USDT').all()
+    np.testing.assert_array_equal(frame['target_up'].to_numpy(), expected['target_up'].to_numpy())
+    np.testing.assert_array_equal(frame['target_return_1'].to_numpy(), expected['target_return_1'].to_numpy())
+
+def test_hit_then_miss_on_changed_file_or_features(tmp_path, monkeypatch, cache_dir):
+    path = str(tmp_path / "30m_features.parquet")
+    write_features(path)
+    builds = count_builds(monkeypatch)
+    training_cache.load_frame(path, '30m', 'main', FEATURES)
+    training_cache.load_frame(path, '30m', 'main', FEATURES)
+    training_cache.load_frame(path, '30m', 'BTC/USDT', FEATURES)
+    assert builds == ['main', 'BTC/USDT']
+    assert len(entries(cache_dir)) == 2
+
+    # a different feature list is a different entry and replaces the old one for that model
+    training_cache.load_frame(path, '30m', 'main', FEATURES + ['macd'])
+    assert builds[-1] == 'main' and len(builds) == 3
+    assert len(entries(cache_dir)) == 2
+
+    # new file contents miss the cache
+    df = write_features(path, seed=1)
+    frame = training_cache.load_frame(path, '30m', 'main', FEATURES)
+    assert len(builds) == 4
+    np.testing.assert_array_equal(np.sort(frame['rsi_14'].to_numpy()), np.sort(df['rsi_14'].to_numpy(dtype='float32')))
+    training_cache.load_frame(path, '30m', 'main', FEATURES)
+    assert len(builds) == 4